@@ -1,44 +1,163 @@
 import os
-from google.cloud import bigquery
+import time
+from datetime import date
+from pathlib import Path
+from string import Template
 from dotenv import load_dotenv
+from utils.config import REPO_ROOT
+from utils.metrics import ContextThreadPoolExecutor, get_metrics
+from utils.parquet_io import clear_changed_partitions, load_changed_partitions
 
 load_dotenv()
 
 PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 BQ_DATASET = os.getenv("BQ_DATASET")
 GCS_BUCKET = os.getenv("GCS_BUCKET")
+# host:port of a local BigQuery emulator (e.g. goccy/bigquery-emulator) for offline runs
+BQ_EMULATOR_HOST = os.getenv("BIGQUERY_EMULATOR_HOST")
 
+SQL_DIR = REPO_ROOT / "sql"
+PROCESSED_DIR = Path("data/processed")
+# 時の鐘
+CENTER_LAT, CENTER_LNG = 35.9251, 139.4852
 
-def run_bq_sql():
-    client = bigquery.Client(project=PROJECT_ID)
+# feature table -> (source dataset under data/processed, SQL files)
+FEATURE_TABLES = {
+    "youtube_video_features": {
+        "name": "YouTube Video Features",
+        "dataset": "youtube_video_details",
+        "source": "youtube_video_source.sql",
+        "full": "youtube_video_features.sql",
+        "merge": "youtube_video_features_merge.sql",
+    },
+    "gmap_place_features": {
+        "name": "Google Maps Place Features",
+        "dataset": "gmap_places",
+        "source": "gmap_place_source.sql",
+        "full": "gmap_place_features.sql",
+        "merge": "gmap_place_features_merge.sql",
+    },
+}
 
-    with open("sql/youtube_video_features.sql", "r") as f:
-        video_sql = f.read()    
 
-    with open("sql/gmap_place_features.sql", "r") as f:
-        place_sql = f.read()
+def run_bq_sql(incremental=False):
+    client = get_bq_client()
+    changed = load_changed_partitions(PROCESSED_DIR)
 
-    video_sql = video_sql.replace("${PROJECT_ID}", PROJECT_ID).replace("${BQ_DATASET}", BQ_DATASET).replace("${GCS_BUCKET}", GCS_BUCKET)
-    place_sql = place_sql.replace("${PROJECT_ID}", PROJECT_ID).replace("${BQ_DATASET}", BQ_DATASET).replace("${GCS_BUCKET}", GCS_BUCKET)
-
-    run_query(client, video_sql, "YouTube Video Features")
-    run_query(client, place_sql, "Google Maps Place Features")
+    # the two feature tables are independent, so their jobs run side by side
+    with ContextThreadPoolExecutor(max_workers=len(FEATURE_TABLES)) as pool:
+        futures = [
+            pool.submit(build_feature_table, client, table, spec, incremental, changed.get(spec["dataset"], []))
+            for table, spec in FEATURE_TABLES.items()
+        ]
+        errors = [f.exception() for f in futures if f.exception()]
+    if errors:
+        raise errors[0]
 
     print(f"All queries finished. Tables created in {PROJECT_ID}.{BQ_DATASET}")
 
-def run_query(client, sql, name):
+def get_bq_client():
+    from google.cloud import bigquery
+    if BQ_EMULATOR_HOST:
+        from google.api_core.client_options import ClientOptions
+        from google.auth.credentials import AnonymousCredentials
+        return bigquery.Client(
+            project=PROJECT_ID,
+            client_options=ClientOptions(api_endpoint=f"http://{BQ_EMULATOR_HOST}"),
+            credentials=AnonymousCredentials()
+        )
+    return bigquery.Client(project=PROJECT_ID)
+
+def build_feature_table(client, table, spec, incremental, changed_partitions):
+    name = spec["name"]
+    if incremental and not changed_partitions:
+        print(f"{name}: no changed partitions, skipping")
+        return
+    if incremental and not table_exists(client, table):
+        print(f"{name}: {table} does not exist yet, building it in full")
+        incremental = False
+
+    # external table + feature view; metadata only, no bytes scanned
+    run_query(client, render_sql(spec["source"]), f"{name} (source)")
+    if incremental:
+        params = merge_parameters(spec["dataset"], changed_partitions)
+        run_query(client, render_sql(spec["merge"]), f"{name} (merge {len(changed_partitions)} partitions)", params)
+        clear_changed_partitions(PROCESSED_DIR, spec["dataset"], changed_partitions)
+    else:
+        run_query(client, render_sql(spec["full"]), name)
+        clear_changed_partitions(PROCESSED_DIR, spec["dataset"])
+
+def render_sql(filename):
+    # identifiers cannot be query parameters, so only they go through the template;
+    # per-run values are passed as @parameters. substitute() fails on unknown ${...}
+    with open(SQL_DIR / filename, "r") as f:
+        template = Template(f.read())
+    return template.substitute(
+        PROJECT_ID=PROJECT_ID,
+        BQ_DATASET=BQ_DATASET,
+        GCS_BUCKET=GCS_BUCKET,
+        CENTER_LAT=CENTER_LAT,
+        CENTER_LNG=CENTER_LNG
+    )
+
+def merge_parameters(dataset, changed_partitions):
+    from google.cloud import bigquery
+    if dataset == "gmap_places":
+        # the feature table mirrors the latest snapshot only
+        return [bigquery.ScalarQueryParameter("snapshot_date", "DATE", date.fromisoformat(max(changed_partitions)))]
+    months = [date.fromisoformat(f"{p}-01") for p in changed_partitions if p != "unknown"]
+    return [
+        bigquery.ArrayQueryParameter("changed_partitions", "STRING", changed_partitions),
+        bigquery.ArrayQueryParameter("changed_months", "DATE", months),
+    ]
+
+def table_exists(client, table):
+    from google.api_core.exceptions import NotFound
+    try:
+        client.get_table(f"{PROJECT_ID}.{BQ_DATASET}.{table}")
+        return True
+    except NotFound:
+        return False
+
+def run_query(client, sql, name, params=None):
+    from google.cloud import bigquery
     try:
         print(f"Running {name} query...")
-        job = client.query(sql)
-        job.result()  
+        start = time.perf_counter()
+        job = client.query(sql, job_config=bigquery.QueryJobConfig(query_parameters=params or []))
+        job.result()
         print(f"{name} query completed successfully")
+        print_job_stats(job, name, time.perf_counter() - start)
+        return job
     except Exception as e:
         print(f"ERROR in {name} query")
         print("----- SQL Start -----")
-        print(sql[:500])  
+        print(sql[:500])
         print("----- SQL End -------")
-        raise e  
+        raise e
+
+def print_job_stats(job, name, wall_seconds):
+    # scripts report the totals of their child jobs; emulators may leave these unset
+    processed = job.total_bytes_processed or 0
+    billed = job.total_bytes_billed or 0
+    slot_seconds = (job.slot_millis or 0) / 1000
+    if job.started and job.ended:
+        duration = (job.ended - job.started).total_seconds()
+    else:
+        duration = wall_seconds
+    metrics = get_metrics()
+    metrics.api_call("bigquery.query")
+    metrics.add("bigquery_bytes_processed", processed)
+    metrics.add("bigquery_bytes_billed", billed)
+    metrics.add("bigquery_slot_seconds", slot_seconds)
+    print(f"{name}: {processed / 1024 ** 2:.1f} MiB processed, {billed / 1024 ** 2:.1f} MiB billed, "
+          f"slot time {slot_seconds:.1f}s, duration {duration:.1f}s (job {job.job_id})")
 
 
 if __name__ == "__main__":
-    run_bq_sql()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true",
+                        help="MERGE only partitions changed since the last build instead of rebuilding")
+    args = parser.parse_args()
+    run_bq_sql(incremental=args.incremental)
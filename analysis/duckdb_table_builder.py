@@ -0,0 +1,86 @@
+from pathlib import Path
+from utils.config import REPO_ROOT
+from utils.metrics import get_metrics
+
+PROCESSED_DIR = Path("data/processed")
+FEATURES_DIR = Path("data/features")
+SQL_DIR = REPO_ROOT / "sql" / "duckdb"
+
+# stand-ins for the spatial functions used in sql/duckdb, for machines where
+# the spatial extension cannot be installed (no network); ST_Distance_Sphere
+# takes (lat, lng) points like the extension does
+SPATIAL_FALLBACK_MACROS = [
+    "CREATE OR REPLACE MACRO ST_Point(x, y) AS {'x': x, 'y': y}",
+    "CREATE OR REPLACE MACRO ST_AsText(p) AS 'POINT (' || p.x || ' ' || p.y || ')'",
+    """
+    CREATE OR REPLACE MACRO ST_Distance_Sphere(a, b) AS
+      2 * 6371008.8 * ASIN(SQRT(
+        POWER(SIN(RADIANS(b.x - a.x) / 2), 2)
+        + COS(RADIANS(a.x)) * COS(RADIANS(b.x)) * POWER(SIN(RADIANS(b.y - a.y) / 2), 2)
+      ))
+    """,
+]
+
+
+def run_duckdb_sql(database=":memory:"):
+    con = connect(database)
+    FEATURES_DIR.mkdir(parents=True, exist_ok=True)
+
+    with open(SQL_DIR / "youtube_video_features.sql", "r") as f:
+        video_sql = f.read()
+
+    with open(SQL_DIR / "gmap_place_features.sql", "r") as f:
+        place_sql = f.read()
+
+    processed_dir = PROCESSED_DIR.resolve().as_posix()
+    video_sql = video_sql.replace("${PROCESSED_DIR}", processed_dir)
+    place_sql = place_sql.replace("${PROCESSED_DIR}", processed_dir)
+
+    run_query(con, video_sql, "YouTube Video Features")
+    export_table(con, "youtube_video_features")
+    run_query(con, place_sql, "Google Maps Place Features")
+    export_table(con, "gmap_place_features")
+
+    con.close()
+    print(f"All queries finished. Tables written to {FEATURES_DIR}")
+
+def connect(database=":memory:"):
+    import duckdb
+    con = duckdb.connect(database)
+    # CAST(timestamptz AS DATE) should match BigQuery's DATE(timestamp), which is UTC
+    con.execute("SET TimeZone = 'UTC'")
+    load_spatial(con)
+    return con
+
+def load_spatial(con):
+    import duckdb
+    try:
+        con.execute("INSTALL spatial")
+        con.execute("LOAD spatial")
+    except duckdb.Error as e:
+        print(f"DuckDB spatial extension unavailable ({type(e).__name__}); using haversine macros instead")
+        for macro in SPATIAL_FALLBACK_MACROS:
+            con.execute(macro)
+
+def export_table(con, table):
+    out_path = FEATURES_DIR / f"{table}.parquet"
+    con.execute(f"COPY {table} TO '{out_path.as_posix()}' (FORMAT PARQUET)")
+    n = con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    get_metrics().rows(rows_out=n)
+    print(f"Saved {n} rows → {out_path}")
+
+def run_query(con, sql, name):
+    try:
+        print(f"Running {name} query...")
+        con.execute(sql)
+        print(f"{name} query completed successfully")
+    except Exception as e:
+        print(f"ERROR in {name} query")
+        print("----- SQL Start -----")
+        print(sql[:500])
+        print("----- SQL End -------")
+        raise e
+
+
+if __name__ == "__main__":
+    run_duckdb_sql()
@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import os
+import time
+from functools import lru_cache
+from utils.api_cache import ApiCache, CACHE_DIR, CACHE_MISS, DAY
+from utils.metrics import get_metrics
+from utils.rate_limiter import backoff_delay
+
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+SUMMARY_ENDPOINT = "gemini.caption_summary"
+DIGEST_ENDPOINT = "gemini.report_digest"
+TOKEN_COUNT_ENDPOINT = "gemini.count_tokens"
+
+GENAI_LOCATION = "us-central1"
+
+DIGEST_MERGE_PROMPT = """
+    以下は観光戦略を立てるための中間要約です。重要な観光体験・季節性・ターゲット層・課題が失われないように、
+    重複を除いて1つの中間要約に統合してください。
+    {blocks}
+    """
+
+
+@lru_cache(maxsize=None)
+def get_genai_client():
+    # google.genai takes about a second to import, so it is only loaded by stages that call Gemini
+    from google import genai
+    return genai.Client(
+        vertexai=True,
+        project=os.getenv("GCP_PROJECT_ID"),
+        location=GENAI_LOCATION
+    )
+
+
+@lru_cache(maxsize=None)
+def get_summary_cache():
+    return ApiCache(
+        path=CACHE_DIR / "summary_cache.sqlite",
+        ttls={SUMMARY_ENDPOINT: 90 * DAY, DIGEST_ENDPOINT: 90 * DAY, TOKEN_COUNT_ENDPOINT: 90 * DAY},
+        max_bytes=64 * 1024 * 1024,
+    )
+
+
+async def agenerate_text(client, model, prompt, config, limiter, max_retries=4):
+    """Generate text with the async Gemini client, bounded by `limiter` and retried on transient errors."""
+    for attempt in range(max_retries + 1):
+        async with limiter:
+            start = time.perf_counter()
+            try:
+                response = await client.aio.models.generate_content(
+                    model=model,
+                    contents=prompt,
+                    config=config
+                )
+                get_metrics().llm_call(model, response.usage_metadata, time.perf_counter() - start)
+                return (response.text or "").strip()
+            except Exception as e:
+                get_metrics().api_call(f"gemini.{model}", error=True)
+                if not is_transient(e) or attempt == max_retries:
+                    raise
+                print(f"Retrying {model} after {type(e).__name__}: {e} (attempt {attempt + 1})")
+        await asyncio.sleep(backoff_delay(attempt, base=2))
+
+
+async def agenerate_cached(cache, endpoint, template, client, model, prompt, config, limiter):
+    # content-addressed: editing the template, the config or the prompt changes the key
+    key = {
+        "model": model,
+        "template": sha256(template),
+        "config": config,
+        "prompt": sha256(prompt),
+    }
+    text = cache.get(endpoint, key)
+    if text is CACHE_MISS:
+        cache.require_online(endpoint)
+        text = await agenerate_text(client, model, prompt, config, limiter)
+        cache.set(endpoint, key, text)
+    return text
+
+
+async def acount_tokens(client, model, text, limiter, cache=None):
+    """Count tokens with the model's own tokenizer (cached by content hash when a cache is given)."""
+    key = {"model": model, "text": sha256(text)}
+    if cache is not None:
+        count = cache.get(TOKEN_COUNT_ENDPOINT, key)
+        if count is not CACHE_MISS:
+            return count
+        cache.require_online(TOKEN_COUNT_ENDPOINT)
+    async with limiter:
+        response = await client.aio.models.count_tokens(model=model, contents=text)
+    get_metrics().api_call(TOKEN_COUNT_ENDPOINT)
+    if cache is not None:
+        cache.set(TOKEN_COUNT_ENDPOINT, key, response.total_tokens)
+    return response.total_tokens
+
+
+def pack_blocks(blocks, token_counts, budget):
+    """Greedily pack consecutive blocks into batches whose token total fits the budget."""
+    batches, batch, used = [], [], 0
+    for block, count in zip(blocks, token_counts):
+        if batch and used + count > budget:
+            batches.append(batch)
+            batch, used = [], 0
+        batch.append(block)
+        used += count
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def adigest_groups(groups, budget, digest, count):
+    """Map step of hierarchical reports: summarize each group, in budget-sized batches, in parallel.
+
+    `groups` maps a label to its text blocks, `digest(label, batch)` returns a
+    coroutine producing one digest and `count(text)` one producing a token count.
+    """
+    labels = list(groups)
+    counts = await asyncio.gather(*[
+        asyncio.gather(*[count(block) for block in groups[label]]) for label in labels
+    ])
+    jobs = [
+        digest(label, batch)
+        for label, group_counts in zip(labels, counts)
+        for batch in pack_blocks(groups[label], group_counts, budget)
+    ]
+    return list(await asyncio.gather(*jobs))
+
+
+async def areduce_to_budget(texts, budget, merge, count):
+    """Reduce step: merge digests batch by batch until they fit in one prompt of `budget` tokens."""
+    while len(texts) > 1:
+        counts = await asyncio.gather(*[count(text) for text in texts])
+        if sum(counts) <= budget:
+            break
+        batches = pack_blocks(texts, counts, budget)
+        if len(batches) == len(texts):
+            # every digest fills the budget alone; merge pairwise so each round shrinks the list
+            batches = [texts[i:i + 2] for i in range(0, len(texts), 2)]
+        texts = list(await asyncio.gather(*[merge(batch) for batch in batches]))
+    return texts
+
+
+async def abuild_report_input(client, cache, endpoint, blocks, labels, budget, mode, digest_template,
+                              limiter, count_model, digest_model, digest_config):
+    """Build the data part of a strategy prompt within `budget` tokens.
+
+    "flat" keeps blocks in order until the budget is used up (the rest is
+    dropped). "hierarchical" digests the blocks per label in parallel and
+    merges the digests until they fit. "auto" is flat when everything fits
+    and hierarchical otherwise. Returns (text, number of blocks the text covers):
+    the kept blocks when flat, every block when hierarchical, since each one
+    went into a digest.
+    """
+    async def count(text):
+        return await acount_tokens(client, count_model, text, limiter, cache)
+
+    async def digest(label, batch):
+        prompt = digest_template.format(group=label, blocks="\n\n".join(batch))
+        return await agenerate_cached(
+            cache, endpoint, digest_template, client, digest_model, prompt, digest_config, limiter
+        )
+
+    async def merge(batch):
+        prompt = DIGEST_MERGE_PROMPT.format(blocks="\n\n".join(batch))
+        return await agenerate_cached(
+            cache, endpoint, DIGEST_MERGE_PROMPT, client, digest_model, prompt, digest_config, limiter
+        )
+
+    counts = await asyncio.gather(*[count(block) for block in blocks])
+    if mode == "flat" or (mode == "auto" and sum(counts) <= budget):
+        kept = pack_blocks(blocks, counts, budget)[:1]
+        kept = kept[0] if kept else []
+        if len(kept) < len(blocks):
+            print(f"Token budget {budget} reached: dropping {len(blocks) - len(kept)} of {len(blocks)} blocks")
+        return "\n\n".join(kept), len(kept)
+
+    groups = {}
+    for label, block in zip(labels, blocks):
+        groups.setdefault(label, []).append(block)
+    digests = await adigest_groups(groups, budget, digest, count)
+    print(f"Digested {len(blocks)} blocks in {len(groups)} groups into {len(digests)} digests")
+    digests = await areduce_to_budget(digests, budget, merge, count)
+    return "\n\n".join(digests), len(blocks)
+
+
+def is_transient(error):
+    from google.genai import errors
+    if isinstance(error, errors.APIError):
+        return error.code in TRANSIENT_STATUS_CODES
+    return isinstance(error, (asyncio.TimeoutError, ConnectionError))
+
+
+def split_text(text, max_chars):
+    """Split text into chunks of at most max_chars, preferring sentence or word boundaries."""
+    chunks = []
+    while len(text) > max_chars:
+        cut = max(text.rfind("。", 0, max_chars), text.rfind(" ", 0, max_chars))
+        if cut < max_chars // 2:
+            cut = max_chars - 1
+        chunks.append(text[:cut + 1].strip())
+        text = text[cut + 1:]
+    if text.strip():
+        chunks.append(text.strip())
+    return chunks
+
+
+def sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
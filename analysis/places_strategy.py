@@ -1,37 +1,59 @@
 import pandas as pd
+import numpy as np
 import re
-import os
-from google import genai
+import asyncio
 import textwrap
 from pathlib import Path
+import time
 from dotenv import load_dotenv
+from utils.parquet_io import read_latest_partition
+from utils.metrics import get_metrics
+from analysis.llm import DIGEST_ENDPOINT, abuild_report_input, get_genai_client, get_summary_cache
 
 load_dotenv()
 PROCESSED_DIR = Path("data/processed")
 OUTPUT_DIR = Path("outputs")
-OUTPUT_DIR.mkdir(exist_ok=True)
 
-GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
-client = genai.Client(
-    vertexai=True,
-    project=GCP_PROJECT_ID,
-    location="us-central1"
-)
-
-def generate_tourism_report(max_places=20):
-    df_reviews = pd.read_parquet(PROCESSED_DIR / "gmap_reviews.parquet")
+REPORT_MODEL = "gemini-2.5-pro"
+DIGEST_MODEL = "gemini-2.5-flash"
+DIGEST_CONFIG = {"max_output_tokens": 4000, "temperature": 0.4, "top_p": 0.8, "top_k": 40}
+PLACE_DIGEST_PROMPT = """
+    以下は川越の「{group}」のスポットに関するグーグルマップのレビューです。
+    観光体験や人気要素、季節ごとの魅力、訪問者が感動した点・不満を持った点、訪問者の属性（国内・インバウンド、年齢層、旅行スタイル）を、
+    後で観光戦略を立てるための中間要約として日本語で簡潔にまとめてください。スポット名は残してください。
+    {blocks}
+    """
+# 時の鐘 (same center as sql/gmap_place_features.sql)
+CENTER_LAT, CENTER_LNG = 35.9251, 139.4852
+
+def generate_tourism_report(max_places=20, max_input_tokens=100_000, mode="auto", group_by="zone",
+                            max_concurrency=8):
+    summary_cache = get_summary_cache()
+    summary_cache.purge_expired(DIGEST_ENDPOINT)
+    df_reviews = read_latest_partition(PROCESSED_DIR / "gmap_reviews", "snapshot_date")
     df_reviews["cleaned_review"] = df_reviews["review_text"].apply(lambda x: re.sub(r"\s+", " ", x))
     df_reviews["review_month"] = pd.to_datetime(df_reviews["review_time"]).dt.month
     df_reviews = df_reviews.drop(["review_author","review_language"], axis=1)
-    df_places = pd.read_parquet(PROCESSED_DIR / "gmap_places.parquet")
-    df_places = df_places[["place_id", "name", "rating", "rating_count", "summary"]]
+    df_places = read_latest_partition(PROCESSED_DIR / "gmap_places", "snapshot_date")
+    df_places = df_places[["place_id", "name", "rating", "rating_count", "summary",
+                           "lat", "lng", "tourist_attraction", "food"]]
     df_places = df_places.sort_values("rating_count", ascending=False)
+    if max_places:
+        df_places = df_places.head(max_places)
     prompts = []
-    for place_id in df_places["place_id"][:max_places]:
+    for place_id in df_places["place_id"]:
         prompt = build_place_prompt(place_id, df_places, df_reviews)
         prompts.append(prompt)
-    print(f"Generating report for {len(prompts)} places...")
-    generated_text = generate_tourism_strategy("\n\n".join(prompts), max_places)
+
+    prompts_text, num_places = asyncio.run(abuild_report_input(
+        get_genai_client(), summary_cache, DIGEST_ENDPOINT, prompts, place_group_labels(df_places, group_by),
+        max_input_tokens, mode, PLACE_DIGEST_PROMPT, asyncio.Semaphore(max_concurrency),
+        count_model=REPORT_MODEL, digest_model=DIGEST_MODEL, digest_config=DIGEST_CONFIG
+    ))
+    get_metrics().rows(rows_in=len(df_places))
+    print(f"Generating report for {num_places} places...")
+    generated_text = generate_tourism_strategy(prompts_text, num_places)
+    OUTPUT_DIR.mkdir(exist_ok=True)
     out_text_file = OUTPUT_DIR / "generated_tourism_report.txt"
     with open(out_text_file, "w", encoding="utf-8") as f:
         f.write(generated_text)
@@ -43,6 +65,24 @@ def generate_tourism_report(max_places=20):
         f.write(wrapped_text)
     print(f"Saved generated report to {out_md_file}")
 
+def place_group_labels(df_places, group_by="zone"):
+    if group_by == "zone":
+        # same zones as kawagoe_zone in sql/gmap_place_features.sql
+        dist = haversine_m(df_places["lat"], df_places["lng"], CENTER_LAT, CENTER_LNG)
+        return np.select(
+            [dist <= 1000, dist <= 3000], ["Central Kawagoe", "Inner Kawagoe"], "Outer Kawagoe"
+        ).tolist()
+    if group_by == "category":
+        return np.select(
+            [df_places["tourist_attraction"] == 1, df_places["food"] == 1], ["観光スポット", "飲食店"], "その他"
+        ).tolist()
+    raise ValueError(f"Unknown group_by: {group_by}")
+
+def haversine_m(lat, lng, lat0, lng0):
+    lat, lng, lat0, lng0 = map(np.radians, (lat, lng, lat0, lng0))
+    a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat) * np.cos(lat0) * np.sin((lng - lng0) / 2) ** 2
+    return 2 * 6_371_000 * np.arcsin(np.sqrt(a))
+
 def build_place_prompt(place_id, df_places, df_reviews):
     place = df_places[df_places["place_id"] == place_id].iloc[0]
     place_header = (
@@ -63,13 +103,13 @@ def build_place_prompt(place_id, df_places, df_reviews):
     block = f"Place: {place_header}\nReviews:\n{reviews_text}"
     return block 
 
-def generate_tourism_strategy(prompts_text, max_places):
+def generate_tourism_strategy(prompts_text, num_places):
     prompt_header = f"""
     あなたは観光戦略の専門家です。
     以下のグーグルマップのレビューを分析し、その地域の観光資源を最大限に活用できる
     プロモーション戦略を提案してください。
     出力はMarkdownを絶対に使用せず、通常の日本語の文章スタイルで書いてください。
-    必ず{2000 + max_places * 100 }文字以上で中途半端に打ち切らず、最後まで書き切ってください。
+    必ず{2000 + num_places * 100 }文字以上で中途半端に打ち切らず、最後まで書き切ってください。
 
     出力には必ず以下の観点を含めてください：
 
@@ -89,9 +129,10 @@ def generate_tourism_strategy(prompts_text, max_places):
     - 不満点や課題を解消する改善提案（混雑対策、アクセス、設備など）
     """
     
-    max_output_tokens = min(32000, 3000 + 800 * max_places)
-    response = client.models.generate_content(
-        model="gemini-2.5-pro",   
+    max_output_tokens = min(32000, 3000 + 800 * num_places)
+    start = time.perf_counter()
+    response = get_genai_client().models.generate_content(
+        model=REPORT_MODEL,   
         contents=prompt_header + prompts_text,
         config={
             "max_output_tokens": max_output_tokens,
@@ -100,7 +141,11 @@ def generate_tourism_strategy(prompts_text, max_places):
             "top_k": 40,
         }
     )
-    print(response)
+    usage = response.usage_metadata
+    get_metrics().llm_call(REPORT_MODEL, usage, time.perf_counter() - start)
+    if usage is not None:
+        print(f"{REPORT_MODEL}: {usage.prompt_token_count} input / {usage.candidates_token_count} output tokens, "
+              f"finish reason {response.candidates[0].finish_reason if response.candidates else None}")
     return response.text.strip()
 
 
@@ -112,4 +157,18 @@ def wrap_preserve_newlines(text: str, width: int = 100) -> str:
 
 
 if __name__ == "__main__":
-    generate_tourism_report()
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max_places", type=int, default=20, help="0 for all places")
+    parser.add_argument("--max_input_tokens", type=int, default=100_000)
+    parser.add_argument("--mode", choices=["auto", "flat", "hierarchical"], default="auto")
+    parser.add_argument("--group_by", choices=["zone", "category"], default="zone")
+    parser.add_argument("--max_concurrency", type=int, default=8)
+    args = parser.parse_args()
+    generate_tourism_report(
+        max_places=args.max_places,
+        max_input_tokens=args.max_input_tokens,
+        mode=args.mode,
+        group_by=args.group_by,
+        max_concurrency=args.max_concurrency
+    )
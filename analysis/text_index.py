@@ -0,0 +1,420 @@
+import hashlib
+import re
+import sqlite3
+import time
+import unicodedata
+import zlib
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from utils.metrics import get_metrics
+from utils.parquet_io import read_dataset
+
+PROCESSED_DIR = Path("data/processed")
+INDEX_PATH = Path("data/index/text_index.sqlite")
+NGRAM = 2
+# documents tokenized before their postings are written as one block per term
+FLUSH_DOCS = 20_000
+# rebuild once this share of the indexed documents has been replaced or removed
+STALE_REBUILD_RATIO = 0.2
+GROUP_COLUMNS = ["month", "place", "category", "source"]
+SQLITE_MAX_PARAMS = 900
+# stored texts are only read to confirm phrase matches, so favour speed
+TEXT_COMPRESSION_LEVEL = 1
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(text):
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text or "").casefold()).strip()
+
+
+def ngrams(text, n=NGRAM):
+    """Distinct character n-grams of a normalized query."""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def batch_ngrams(texts, first_id, n=NGRAM):
+    """Distinct (n-gram code, doc ID) pairs of consecutive documents, sorted by code and doc ID.
+
+    An n-gram's code packs its code points, 21 bits each, into one integer,
+    so a whole batch is tokenized with array operations. Each text is padded
+    with n - 1 spaces, so every character starts an n-gram; n-grams spanning
+    two documents are dropped.
+    """
+    texts = [text + " " * (n - 1) for text in texts]
+    points = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    doc_of = np.repeat(np.arange(first_id, first_id + len(texts)), [len(text) for text in texts])
+    size = len(points) - n + 1
+    codes = np.zeros(size, dtype=np.int64)
+    for k in range(n):
+        codes = (codes << 21) | points[k:k + size]
+    within = doc_of[:size] == doc_of[n - 1:]
+    codes, doc_ids = codes[within], doc_of[:size][within]
+    order = np.lexsort((doc_ids, codes))
+    codes, doc_ids = codes[order], doc_ids[order]
+    distinct = np.r_[True, (codes[1:] != codes[:-1]) | (doc_ids[1:] != doc_ids[:-1])]
+    return codes[distinct], doc_ids[distinct]
+
+
+def ngram_text(code, n=NGRAM):
+    return "".join(chr((int(code) >> (21 * (n - 1 - k))) & 0x1FFFFF) for k in range(n))
+
+
+def encode_postings(codes, doc_ids):
+    """Varint-encode the doc ID deltas of each term; returns (bytes, byte offset where each term starts).
+
+    `codes` and `doc_ids` are parallel arrays sorted by (code, doc_id). Each
+    term's list starts from 0, so blocks can be decoded independently.
+    """
+    starts = np.r_[True, codes[1:] != codes[:-1]]
+    deltas = np.where(starts, doc_ids, doc_ids - np.r_[0, doc_ids[:-1]]).astype(np.uint64)
+    nbytes = np.ones(len(deltas), dtype=np.int64)
+    for k in range(1, 5):
+        nbytes += deltas >= np.uint64(1 << (7 * k))
+    ends = np.cumsum(nbytes)
+    first = ends - nbytes
+    out = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    for k in range(int(nbytes.max()) if len(nbytes) else 0):
+        mask = nbytes > k
+        byte = (deltas[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (nbytes[mask] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[first[mask] + k] = (byte | more).astype(np.uint8)
+    return out.tobytes(), first[starts]
+
+
+def decode_postings(data):
+    values = np.frombuffer(data, dtype=np.uint8)
+    last = np.flatnonzero(values < 0x80)
+    first = np.r_[0, last[:-1] + 1]
+    lengths = last - first + 1
+    deltas = np.zeros(len(last), dtype=np.int64)
+    for k in range(int(lengths.max()) if len(lengths) else 0):
+        mask = lengths > k
+        deltas[mask] |= (values[first[mask] + k] & 0x7F).astype(np.int64) << (7 * k)
+    return np.cumsum(deltas)
+
+
+def review_documents():
+    root = PROCESSED_DIR / "gmap_reviews"
+    if not root.exists():
+        return
+    reviews = read_dataset(root)
+    # the same review shows up in every snapshot; keep the latest copy
+    reviews = reviews.sort_values("snapshot_date").drop_duplicates(
+        ["place_id", "review_author", "review_time"], keep="last"
+    )
+    place_types = place_categories()
+    for r in reviews.itertuples(index=False):
+        yield {
+            "key": f"{r.place_id}|{r.review_author}|{r.review_time}",
+            "text": r.review_text,
+            "month": (r.review_time or "")[:7] or None,
+            "place": r.place_name,
+            "category": place_types.get(r.place_id),
+        }
+
+
+def place_categories():
+    """place_id -> the first of the place's types in the latest snapshot."""
+    root = PROCESSED_DIR / "gmap_places"
+    if not root.exists():
+        return {}
+    places = read_dataset(root, columns=["place_id", "types", "snapshot_date"])
+    places = places.sort_values("snapshot_date").drop_duplicates("place_id", keep="last")
+    return {
+        pid: types[0] for pid, types in zip(places["place_id"], places["types"])
+        if types is not None and len(types)
+    }
+
+
+def video_documents():
+    root = PROCESSED_DIR / "youtube_video_details"
+    if not root.exists():
+        return
+    videos = read_dataset(
+        root, columns=["video_id", "title", "description", "tags", "publish_date", "category_id"]
+    )
+    for v in videos.itertuples(index=False):
+        tags = " ".join(v.tags) if v.tags is not None else ""
+        yield {
+            "key": v.video_id,
+            "text": f"{v.title or ''} {v.description or ''} {tags}",
+            "month": month_of(v.publish_date),
+            "place": None,
+            "category": v.category_id,
+        }
+
+
+def caption_documents():
+    path = PROCESSED_DIR / "youtube_captions.parquet"
+    if not path.exists():
+        return
+    captions = pd.read_parquet(path, columns=["video_id", "caption", "publish_date", "category_id"])
+    for c in captions.itertuples(index=False):
+        yield {
+            "key": c.video_id,
+            "text": c.caption,
+            "month": month_of(c.publish_date),
+            "place": None,
+            "category": c.category_id,
+        }
+
+
+def month_of(timestamp):
+    return timestamp.strftime("%Y-%m") if pd.notna(timestamp) else None
+
+
+# source -> generator of {key, text, month, place, category}
+SOURCES = {
+    "review": review_documents,
+    "video": video_documents,
+    "caption": caption_documents,
+}
+
+
+class TextIndex:
+    """Character n-gram inverted index over reviews, video texts and captions, in SQLite.
+
+    Every document gets a new, never reused ID; postings are stored per
+    term in blocks of varint-encoded ID deltas, one block per update, so new
+    data is indexed by appending blocks. Replaced or removed documents are
+    dropped from `documents` and their stale postings are skipped at query
+    time until the next rebuild. Queries intersect the postings of the
+    query's n-grams and, for queries longer than one n-gram, check the
+    candidates' stored (normalized, compressed) text for the exact phrase.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                doc_id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                key TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                month TEXT,
+                place TEXT,
+                category TEXT,
+                text BLOB NOT NULL,
+                UNIQUE (source, key)
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                first_doc INTEGER NOT NULL,
+                doc_count INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (term, first_doc)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+        self._metadata = None
+
+    def close(self):
+        self._conn.close()
+
+    def _meta(self, name):
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def _set_meta(self, name, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (name, value))
+
+    def rebuild(self, sources=None):
+        with self._conn:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.execute("DELETE FROM postings")
+            self._set_meta("stale_docs", 0)
+        self._conn.execute("VACUUM")
+        return self.update(sources)
+
+    def update(self, sources=None):
+        """Index new and changed documents of `sources` (all by default); returns {source: (added, removed)}."""
+        changes = {}
+        for source in sources or SOURCES:
+            existing = {
+                key: (doc_id, text_hash) for doc_id, key, text_hash in
+                self._conn.execute("SELECT doc_id, key, text_hash FROM documents WHERE source = ?", (source,))
+            }
+            seen, removed, pending, added, removed_total = set(), [], [], 0, 0
+            for doc in SOURCES[source]():
+                if not doc["text"] or doc["key"] in seen:
+                    continue
+                seen.add(doc["key"])
+                # hashed before normalizing, so unchanged documents cost only the hash
+                raw = f'{doc["month"]}|{doc["place"]}|{doc["category"]}|{doc["text"]}'
+                text_hash = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+                old = existing.get(doc["key"])
+                if old is not None:
+                    if old[1] == text_hash:
+                        continue
+                    removed.append(old[0])
+                pending.append({**doc, "text": normalize(doc["text"]), "text_hash": text_hash})
+                if len(pending) >= FLUSH_DOCS:
+                    added += self._add(source, pending, removed)
+                    removed_total += len(removed)
+                    pending, removed = [], []
+            removed += [doc_id for key, (doc_id, _) in existing.items() if key not in seen]
+            added += self._add(source, pending, removed)
+            changes[source] = (added, removed_total + len(removed))
+        self._print_changes(changes)
+        return changes
+
+    def _add(self, source, docs, removed):
+        """Index `docs` and drop the `removed` doc IDs, in one transaction."""
+        if not docs and not removed:
+            return 0
+        self._metadata = None
+        with self._conn:
+            for i in range(0, len(removed), SQLITE_MAX_PARAMS):
+                chunk = removed[i:i + SQLITE_MAX_PARAMS]
+                self._conn.execute(f"DELETE FROM documents WHERE doc_id IN ({','.join('?' * len(chunk))})", chunk)
+            self._set_meta("stale_docs", self._meta("stale_docs") + len(removed))
+            if not docs:
+                return 0
+            next_id = self._meta("next_doc_id") or 1
+            rows = [
+                (
+                    doc_id, source, doc["key"], doc["text_hash"], doc["month"], doc["place"], doc["category"],
+                    zlib.compress(doc["text"].encode("utf-8"), TEXT_COMPRESSION_LEVEL)
+                )
+                for doc_id, doc in enumerate(docs, start=next_id)
+            ]
+            self._conn.executemany("INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._set_meta("next_doc_id", next_id + len(docs))
+
+            codes, doc_ids = batch_ngrams([doc["text"] for doc in docs], next_id)
+            data, offsets = encode_postings(codes, doc_ids)
+            group_starts = np.r_[np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]), len(codes)]
+            offsets = np.r_[offsets, len(data)]
+            self._conn.executemany(
+                "INSERT INTO postings VALUES (?, ?, ?, ?)",
+                (
+                    (ngram_text(codes[a]), int(doc_ids[a]), int(b - a), data[offsets[g]:offsets[g + 1]])
+                    for g, (a, b) in enumerate(zip(group_starts[:-1], group_starts[1:]))
+                )
+            )
+        return len(docs)
+
+    def _print_changes(self, changes):
+        for source, (added, removed) in changes.items():
+            print(f"Indexed {added} new or changed {source} documents ({removed} removed)")
+        total = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        stale = self._meta("stale_docs")
+        get_metrics().rows(rows_out=total)
+        print(f"{total} documents in {self.path}")
+        if total and stale / total > STALE_REBUILD_RATIO:
+            print(f"{stale} replaced or removed documents still have postings; consider --rebuild")
+
+    def _postings(self, term):
+        if len(term) < NGRAM:
+            # every character starts an n-gram, so a shorter term matches a prefix range of terms
+            rows = self._conn.execute(
+                "SELECT data FROM postings WHERE term >= ? AND term < ?", (term, term + "\U0010ffff")
+            )
+        else:
+            rows = self._conn.execute("SELECT data FROM postings WHERE term = ?", (term,))
+        blocks = [decode_postings(data) for (data,) in rows]
+        return np.unique(np.concatenate(blocks)) if blocks else np.empty(0, dtype=np.int64)
+
+    def search(self, query, sources=None, mentions=False):
+        """Documents containing `query` as a DataFrame (doc_id, source, key, month, place, category[, mentions])."""
+        phrase = normalize(query)
+        if not phrase:
+            raise ValueError("Empty query")
+        terms = sorted(ngrams(phrase)) or [phrase]
+        candidates = None
+        for term in terms:
+            ids = self._postings(term)
+            candidates = ids if candidates is None else np.intersect1d(candidates, ids, assume_unique=True)
+            if not len(candidates):
+                break
+
+        hits = self._documents()
+        hits = hits[hits.index.isin(candidates)]
+        if sources:
+            hits = hits[hits["source"].isin(sources)]
+        # n-grams alone say nothing about their order in longer phrases
+        if len(phrase) > NGRAM or mentions:
+            counts = [text.count(phrase) for text in self._texts(hits.index)]
+            hits = hits.assign(mentions=counts)
+            hits = hits[hits["mentions"] > 0]
+            if not mentions:
+                hits = hits.drop(columns=["mentions"])
+        return hits.reset_index()
+
+    def _documents(self):
+        """Metadata of all indexed documents by doc_id, loaded once per instance (and after updates)."""
+        if self._metadata is None:
+            self._metadata = pd.read_sql_query(
+                "SELECT doc_id, source, key, month, place, category FROM documents", self._conn, index_col="doc_id"
+            )
+        return self._metadata
+
+    def _texts(self, doc_ids):
+        texts = {}
+        doc_ids = [int(d) for d in doc_ids]
+        for i in range(0, len(doc_ids), SQLITE_MAX_PARAMS):
+            chunk = doc_ids[i:i + SQLITE_MAX_PARAMS]
+            rows = self._conn.execute(
+                f"SELECT doc_id, text FROM documents WHERE doc_id IN ({','.join('?' * len(chunk))})", chunk
+            )
+            texts.update((doc_id, zlib.decompress(text).decode("utf-8")) for doc_id, text in rows)
+        return [texts[d] for d in doc_ids]
+
+    def count(self, queries, group_by="month", sources=None, mentions=False):
+        """Matching documents (and optionally phrase occurrences) per query and `group_by` value."""
+        if isinstance(queries, str):
+            queries = [queries]
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"Unknown group_by: {group_by} (choose from {', '.join(GROUP_COLUMNS)})")
+        frames = []
+        for query in queries:
+            hits = self.search(query, sources=sources, mentions=mentions)
+            agg = {"documents": ("doc_id", "size")}
+            if mentions:
+                agg["mentions"] = ("mentions", "sum")
+            counts = hits.fillna({group_by: "(none)"}).groupby(group_by).agg(**agg).reset_index()
+            counts.insert(0, "query", query)
+            frames.append(counts)
+        return pd.concat(frames, ignore_index=True).sort_values(["query", group_by]).reset_index(drop=True)
+
+
+def build_text_index(rebuild=False):
+    index = TextIndex()
+    try:
+        if rebuild:
+            index.rebuild()
+        else:
+            index.update()
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build or query the local full-text index.")
+    parser.add_argument("queries", nargs="*", help="Terms or phrases to count (no query: update the index)")
+    parser.add_argument("--group_by", choices=GROUP_COLUMNS, default="month")
+    parser.add_argument("--source", nargs="+", choices=list(SOURCES), help="Only count these sources")
+    parser.add_argument("--mentions", action="store_true", help="Also count occurrences, not only documents")
+    parser.add_argument("--rebuild", action="store_true", help="Drop the index and reindex everything")
+    args = parser.parse_args()
+
+    if not args.queries:
+        build_text_index(rebuild=args.rebuild)
+    else:
+        index = TextIndex()
+        start = time.perf_counter()
+        result = index.count(args.queries, group_by=args.group_by, sources=args.source, mentions=args.mentions)
+        elapsed = time.perf_counter() - start
+        print(result.to_string(index=False))
+        print(f"({elapsed * 1000:.1f} ms)")
@@ -1,42 +1,79 @@
 import pandas as pd
-import re
-import os
-from google import genai
+import asyncio
 import textwrap
 from pathlib import Path
+import time
 from dotenv import load_dotenv
+from utils.metrics import get_metrics
+from analysis.llm import (
+    DIGEST_ENDPOINT, SUMMARY_ENDPOINT, abuild_report_input, acount_tokens, agenerate_cached, get_genai_client,
+    get_summary_cache, pack_blocks, split_text
+)
 
 load_dotenv()
 
 PROCESSED_DIR = Path("data/processed")
 OUTPUT_DIR = Path("outputs")
-OUTPUT_DIR.mkdir(exist_ok=True)
 
-GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 
-client = genai.Client(
-    vertexai=True,
-    project=GCP_PROJECT_ID,
-    location="us-central1"
-)
+CAPTION_SUMMARY_MODEL = "gemini-2.5-flash"
+CAPTION_SUMMARY_PROMPT = """
+    動画『{title}』の字幕から川越観光に関連する内容を日本語でまとめてください。  
+    観光体験の手順や訪問者の行動・感想をまとめてください。  
+    特に観光体験・季節イベント、観光客のタイプ、反応、食事・アクセスに注目してください。  
+    注意: 情報が存在しない項目は省略し、不要な雑談や効果音は書かないでください。
+    字幕：
+    {caption}
+    """
+CAPTION_CHUNK_PROMPT = """
+    動画『{title}』の字幕の一部（{part}/{parts}）から川越観光に関連する内容を日本語で箇条書きにまとめてください。  
+    特に観光体験・季節イベント、観光客のタイプ、反応、食事・アクセスに注目してください。  
+    注意: 情報が存在しない項目は省略し、不要な雑談や効果音は書かないでください。
+    字幕（一部）：
+    {caption}
+    """
+CAPTION_REDUCE_PROMPT = """
+    以下は動画『{title}』の字幕を分割して要約したものです。重複を除いて1つの要約に統合してください。  
+    観光体験の手順や訪問者の行動・感想をまとめてください。  
+    特に観光体験・季節イベント、観光客のタイプ、反応、食事・アクセスに注目してください。  
+    部分要約：
+    {summaries}
+    """
+VIDEO_DIGEST_PROMPT = """
+    以下は川越観光に関するYouTube動画（{group}）の要約です。
+    観光体験や人気要素、季節ごとの魅力やイベント、視聴者・訪問者の反応、観光客のタイプを、
+    後で観光戦略を立てるための中間要約として日本語で簡潔にまとめてください。代表的な動画タイトルは残してください。
+    {blocks}
+    """
+REPORT_MODEL = "gemini-2.5-pro"
+DIGEST_CONFIG = {"max_output_tokens": 4000, "temperature": 0.4, "top_p": 0.8, "top_k": 40}
+# order used by content_category in sql/youtube_video_features.sql
+CONTENT_CATEGORIES = ["nature", "events", "heritage", "food"]
+# captions above this many tokens (counted by the summary model) are summarized per chunk
+CAPTION_CHUNK_TOKENS = 8000
+# chunks are packed from sentence-bounded pieces of about this many characters
+CAPTION_PIECE_CHARS = 2000
 
 
-def generate_video_report(max_videos=20, max_chars=100_000):
+def generate_video_report(max_videos=20, max_input_tokens=100_000, mode="auto", group_by="month",
+                          max_concurrency=8):
+    summary_cache = get_summary_cache()
+    summary_cache.purge_expired(SUMMARY_ENDPOINT)
+    summary_cache.purge_expired(DIGEST_ENDPOINT)
     df = pd.read_parquet(PROCESSED_DIR / "youtube_captions.parquet")
     df = df.sort_values("view_count", ascending=False)
-    
-    prompts = []
-    current_length = 0
-    for video_id in df["video_id"][:max_videos]:
-        prompt = build_video_prompt(video_id, df)
-        if current_length + len(prompt) + 2 > max_chars:
-            break
-        prompts.append(prompt)
-        current_length += len(prompt) + 2
-    prompts_text = "\n\n".join(prompts)
-
-    print(f"Generating report for {len(prompts)} videos...")
-    generated_text = generate_tourism_strategy(prompts_text, len(prompts))
+    if max_videos:
+        df = df.head(max_videos)
+
+    prompts_text, num_videos = asyncio.run(
+        build_report_input(df, max_input_tokens, mode, group_by, max_concurrency)
+    )
+
+    summary_cache.print_stats()
+    get_metrics().rows(rows_in=len(df))
+    print(f"Generating report for {num_videos} videos...")
+    generated_text = generate_tourism_strategy(prompts_text, num_videos)
+    OUTPUT_DIR.mkdir(exist_ok=True)
     out_file = OUTPUT_DIR / "generated_video_report.txt"
     with open(out_file, "w", encoding="utf-8") as f:
         f.write(generated_text)
@@ -49,11 +86,40 @@ def generate_video_report(max_videos=20, max_chars=100_000):
     print(f"Saved generated report to {out_md_file}")
 
 
-def build_video_prompt(video_id, df):
-    video = df[df["video_id"] == video_id].iloc[0]    
-    caption = clean_caption(video['caption'])
+async def build_report_input(df, max_input_tokens, mode, group_by, max_concurrency=8):
+    limiter = asyncio.Semaphore(max_concurrency)
+    # all videos are summarized concurrently; blocks come back in view-count order
+    blocks = await build_video_prompts(df, limiter)
+    return await abuild_report_input(
+        get_genai_client(), get_summary_cache(), DIGEST_ENDPOINT, blocks, video_group_labels(df, group_by),
+        max_input_tokens, mode, VIDEO_DIGEST_PROMPT, limiter,
+        count_model=REPORT_MODEL, digest_model=CAPTION_SUMMARY_MODEL, digest_config=DIGEST_CONFIG
+    )
+
+
+def video_group_labels(df, group_by="month"):
+    if group_by == "month":
+        return [f"{d.month}月公開" for d in df["publish_date"]]
+    if group_by == "category":
+        return [
+            next((cat for cat in CONTENT_CATEGORIES if video.get(cat) == 1), "other")
+            for video in df.to_dict("records")
+        ]
+    raise ValueError(f"Unknown group_by: {group_by}")
+
+
+async def build_video_prompts(df, limiter):
+    videos = df.to_dict("records")
+    summaries = await asyncio.gather(*[
+        # captions are cleaned once when they are ingested (preprocess.youtube_captions)
+        asummarize_caption(video["title"], video["caption"], limiter)
+        for video in videos
+    ])
+    return [build_video_prompt(video, summary) for video, summary in zip(videos, summaries)]
+
+
+def build_video_prompt(video, caption_summary):
     title = video['title'].split("#")[0].strip()
-    caption_summary = generate_caption_summary(video['title'], caption)
     block = (
         f"『{title}』 "
         f"(Views:{video['view_count']}, Likes:{video['like_count']}, Date:{video['publish_date'].date() or ''})\n"
@@ -62,38 +128,59 @@ def build_video_prompt(video_id, df):
     return block
 
 
-def clean_caption(captions: str) -> str:
-    captions = re.sub(r"\s+", " ", captions)
-    captions = re.sub(r"\[.*?\]", "", captions)
-    captions = re.sub(r"\(.*?\)", "", captions)
-    captions = re.sub(r"[♪★☆※]+", "", captions)
-    captions = re.sub(r"ー{2,}", "ー", captions)  
-    captions = re.sub(r"…{2,}", "…", captions)  
-    captions = re.sub(r"\s+", " ", captions)
-    return captions.strip()
+def generate_caption_summary(title, caption):
+    return asyncio.run(asummarize_caption(title, caption, asyncio.Semaphore(1)))
 
 
-def generate_caption_summary(title, caption):
-    prompt = f"""
-    動画『{title}』の字幕から川越観光に関連する内容を日本語でまとめてください。  
-    観光体験の手順や訪問者の行動・感想をまとめてください。  
-    特に観光体験・季節イベント、観光客のタイプ、反応、食事・アクセスに注目してください。  
-    注意: 情報が存在しない項目は省略し、不要な雑談や効果音は書かないでください。
-    字幕：
-    {caption}
+async def asummarize_caption(title, caption, limiter):
+    """Summarize a caption; long captions are summarized per chunk (map) and then merged (reduce).
+
+    Chunks are bounded by the summary model's token count: the caption is cut
+    into sentence-bounded pieces, each piece is counted (cached by content),
+    and consecutive pieces are packed into chunks of at most
+    CAPTION_CHUNK_TOKENS.
     """
-    max_output_tokens = 1200 + len(caption)//8
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt,
-        config={
-            "max_output_tokens": max_output_tokens,
-            "temperature": 0.4,
-            "top_p": 0.8,
-            "top_k": 40,
-        }
+    async def count(text):
+        return await acount_tokens(get_genai_client(), CAPTION_SUMMARY_MODEL, text, limiter, get_summary_cache())
+
+    tokens = await count(caption)
+    if tokens <= CAPTION_CHUNK_TOKENS:
+        prompt = CAPTION_SUMMARY_PROMPT.format(title=title, caption=caption)
+        return await agenerate_cached(
+            get_summary_cache(), SUMMARY_ENDPOINT, CAPTION_SUMMARY_PROMPT, get_genai_client(),
+            CAPTION_SUMMARY_MODEL, prompt, summary_config(tokens), limiter
+        )
+
+    pieces = split_text(caption, CAPTION_PIECE_CHARS)
+    counts = await asyncio.gather(*[count(piece) for piece in pieces])
+    chunks, start = [], 0
+    for batch in pack_blocks(pieces, counts, CAPTION_CHUNK_TOKENS):
+        chunks.append((" ".join(batch), sum(counts[start:start + len(batch)])))
+        start += len(batch)
+    partials = await asyncio.gather(*[
+        agenerate_cached(
+            get_summary_cache(), SUMMARY_ENDPOINT, CAPTION_CHUNK_PROMPT, get_genai_client(), CAPTION_SUMMARY_MODEL,
+            CAPTION_CHUNK_PROMPT.format(title=title, part=i + 1, parts=len(chunks), caption=chunk),
+            summary_config(chunk_tokens), limiter
+        )
+        for i, (chunk, chunk_tokens) in enumerate(chunks)
+    ])
+    summaries = "\n\n".join(f"({i + 1}) {text}" for i, text in enumerate(partials))
+    return await agenerate_cached(
+        get_summary_cache(), SUMMARY_ENDPOINT, CAPTION_REDUCE_PROMPT, get_genai_client(), CAPTION_SUMMARY_MODEL,
+        CAPTION_REDUCE_PROMPT.format(title=title, summaries=summaries),
+        summary_config(await count(summaries)), limiter
     )
-    return response.text.strip()
+
+
+def summary_config(tokens):
+    """Generation config whose output budget grows with the input's token count."""
+    return {
+        "max_output_tokens": 1200 + tokens // 8,
+        "temperature": 0.4,
+        "top_p": 0.8,
+        "top_k": 40,
+    }
 
 
 def generate_tourism_strategy(prompts_text, num_videos):
@@ -122,8 +209,9 @@ def generate_tourism_strategy(prompts_text, num_videos):
     - 不満点や課題を解消する改善提案（混雑対策、アクセス、設備など）
     """
     max_output_tokens = min(32000, 3000 + 800 * num_videos)
-    response = client.models.generate_content(
-        model="gemini-2.5-pro",   
+    start = time.perf_counter()
+    response = get_genai_client().models.generate_content(
+        model=REPORT_MODEL,   
         contents=prompt_header + prompts_text,
         config={
             "max_output_tokens": max_output_tokens,
@@ -132,7 +220,11 @@ def generate_tourism_strategy(prompts_text, num_videos):
             "top_k": 40,
         }
     )
-    print(response)
+    usage = response.usage_metadata
+    get_metrics().llm_call(REPORT_MODEL, usage, time.perf_counter() - start)
+    if usage is not None:
+        print(f"{REPORT_MODEL}: {usage.prompt_token_count} input / {usage.candidates_token_count} output tokens, "
+              f"finish reason {response.candidates[0].finish_reason if response.candidates else None}")
     return response.text.strip()
 
 
@@ -144,4 +236,22 @@ def wrap_preserve_newlines(text: str, width: int = 100) -> str:
 
 
 if __name__ == "__main__":
-    generate_video_report()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--max_videos", type=int, default=20, help="0 for all videos")
+    parser.add_argument("--max_input_tokens", type=int, default=100_000)
+    parser.add_argument("--mode", choices=["auto", "flat", "hierarchical"], default="auto")
+    parser.add_argument("--group_by", choices=["month", "category"], default="month")
+    parser.add_argument("--max_concurrency", type=int, default=8)
+    parser.add_argument("--clear_summary_cache", action="store_true",
+                        help="Drop all cached caption summaries before generating the report")
+    args = parser.parse_args()
+    if args.clear_summary_cache:
+        get_summary_cache().invalidate(SUMMARY_ENDPOINT)
+    generate_video_report(
+        max_videos=args.max_videos,
+        max_input_tokens=args.max_input_tokens,
+        mode=args.mode,
+        group_by=args.group_by,
+        max_concurrency=args.max_concurrency
+    )
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""Import-time benchmark for the pipeline modules.
+
+Each module is imported in a fresh interpreter (best of --repeat runs), with
+no API keys set and from a scratch working directory, so import-time side
+effects (clients, credential checks, CWD-relative config reads) show up as
+failures. It also fails when a heavy SDK is loaded just by importing.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --max_ms 800
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+MODULES = [
+    "main",
+    "collectors.youtube_search",
+    "collectors.places_search",
+    "preprocess.youtube_enricher",
+    "preprocess.youtube_captions",
+    "preprocess.places_cleaner",
+    "analysis.youtube_strategy",
+    "analysis.places_strategy",
+    "analysis.bq_table_builder",
+    "analysis.duckdb_table_builder",
+]
+
+# SDKs that must only be imported when a stage actually uses them
+LAZY_PACKAGES = [
+    "google.genai",
+    "google.cloud.bigquery",
+    "googleapiclient.discovery",
+    "googlemaps",
+    "duckdb",
+    "youtube_transcript_api",
+]
+
+PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [p for p in {lazy!r} if p in sys.modules]
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+# credentials the modules used to need at import time
+CREDENTIAL_VARS = ["GOOGLE_MAPS_API_KEY", "YOUTUBE_API_KEY", "GCP_PROJECT_ID", "GOOGLE_APPLICATION_CREDENTIALS"]
+
+
+def measure(module, repeat=5):
+    env = {k: v for k, v in os.environ.items() if k not in CREDENTIAL_VARS}
+    best, loaded = None, []
+    with tempfile.TemporaryDirectory() as cwd:
+        for _ in range(repeat):
+            probe = PROBE.format(root=str(REPO_ROOT), module=module, lazy=LAZY_PACKAGES)
+            proc = subprocess.run(
+                [sys.executable, "-c", probe], cwd=cwd, env=env, capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                return {"module": module, "error": proc.stderr.strip().splitlines()[-1]}
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            best = result["seconds"] if best is None else min(best, result["seconds"])
+            loaded = result["loaded"]
+    return {"module": module, "ms": round(best * 1000, 1), "loaded": loaded}
+
+
+def run(modules=MODULES, repeat=5, max_ms=None):
+    results = [measure(m, repeat) for m in modules]
+    failed = False
+    for r in results:
+        if "error" in r:
+            print(f"{r['module']:<34} FAILED: {r['error']}")
+            failed = True
+            continue
+        problems = []
+        if r["loaded"]:
+            problems.append(f"loads {', '.join(r['loaded'])}")
+        if max_ms and r["ms"] > max_ms:
+            problems.append(f"over {max_ms} ms")
+        failed = failed or bool(problems)
+        print(f"{r['module']:<34} {r['ms']:>8.1f} ms  {'; '.join(problems)}")
+    return results, failed
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max_ms", type=float, help="Fail when any import takes longer than this")
+    parser.add_argument("--output", type=str, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    results, failed = run(args.modules, args.repeat, args.max_ms)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if failed else 0)
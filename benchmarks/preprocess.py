@@ -0,0 +1,277 @@
+"""Benchmarks for the preprocessing hot paths on synthetic API payloads.
+
+Every (stage, size) is run in a fresh interpreter from a scratch working
+directory, so the API cache, data/ outputs and memory peaks start from zero
+each time. Payloads come from benchmarks.synthetic and the YouTube client is
+a fake, so no network or credentials are needed. The best of --repeat timed
+runs is reported, plus one run under tracemalloc for the peak allocation.
+
+    python -m benchmarks.preprocess
+    python -m benchmarks.preprocess --sizes 10000 100000 1000000 --stages keyword_filter flatten_reviews
+    python -m benchmarks.preprocess --baseline data/benchmarks/preprocess_20260101T000000Z.json
+
+Results are saved to data/benchmarks/ (or --output) for comparing runs over time.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = REPO_ROOT / "data" / "benchmarks"
+SIZES = [10_000, 100_000]
+# only the top videos by views get captions, so this stage sees far fewer records
+CAPTIONS_PER_RECORD = 1 / 100
+CAPTION_CHARS = 8000
+
+
+def setup_keyword_filter(n):
+    from benchmarks.synthetic import search_items
+    return search_items(n), n
+
+
+def run_keyword_filter(items):
+    from preprocess.youtube_enricher import filter_search_items
+    filter_search_items(items)
+
+
+def setup_enrich_videos(n):
+    from benchmarks.synthetic import FakeYouTube, search_items
+    video_ids = list(dict.fromkeys(item["id"]["videoId"] for item in search_items(n)))
+    return (video_ids, FakeYouTube()), len(video_ids)
+
+
+def run_enrich_videos(args):
+    from preprocess.youtube_enricher import enrich_videos, video_schema
+    from utils.parquet_io import PartitionedWriter
+    video_ids, youtube = args
+    with PartitionedWriter("videos", "publish_month", video_schema()) as writer:
+        for batch in enrich_videos(video_ids, youtube, min_views=1000):
+            writer.write(batch)
+
+
+def setup_flatten(n):
+    from benchmarks.synthetic import place_details
+    # n counts reviews; the API returns at most 5 per place
+    return place_details(max(1, n // 5)), n
+
+
+def run_flatten_places(details):
+    from preprocess.places_cleaner import PLACE_SCHEMA, flatten_places
+    from utils.parquet_io import PartitionedWriter
+    with PartitionedWriter("places", "snapshot_date", PLACE_SCHEMA) as writer:
+        for batch in flatten_places(details):
+            writer.write(batch, "bench")
+
+
+def run_flatten_reviews(details):
+    from preprocess.places_cleaner import REVIEW_SCHEMA, flatten_reviews
+    from utils.parquet_io import PartitionedWriter
+    with PartitionedWriter("reviews", "snapshot_date", REVIEW_SCHEMA) as writer:
+        for batch in flatten_reviews(details):
+            writer.write(batch, "bench")
+
+
+def setup_save_search_results(n):
+    from benchmarks.synthetic import search_items
+    from collectors.youtube_search import save_search_results
+    items = search_items(n, duplicate_rate=0)
+    # half of the results are already on disk, as on an incremental run
+    save_search_results("bench", items[: n // 2])
+    return items, n
+
+
+def run_save_search_results(items):
+    from collectors.youtube_search import save_search_results
+    save_search_results("bench", items)
+
+
+def setup_dedup(n):
+    import random
+    from benchmarks.synthetic import video_item
+    from preprocess.youtube_enricher import VIDEO_DETAILS_DIR, publish_months, videos_to_frame
+    from utils.parquet_io import write_partitions
+    rng = random.Random(0)
+    items = [video_item(random_id, rng) for random_id in (f"video{i:08d}" for i in range(n))]
+    # every tenth video comes back as a lightly edited re-upload
+    for item in items[: n // 10]:
+        copy = {**item, "id": item["id"] + "-copy", "snippet": {**item["snippet"]}}
+        copy["snippet"]["title"] += " #shorts"
+        items.append(copy)
+    df = videos_to_frame(items, min_views=0)
+    df["publish_month"] = publish_months(df)
+    write_partitions(df, VIDEO_DETAILS_DIR, "publish_month")
+    return None, len(items)
+
+
+def run_dedup(_):
+    from preprocess.youtube_dedup import youtube_dedup
+    youtube_dedup()
+
+
+def setup_clean_caption(n):
+    from benchmarks.synthetic import captions
+    texts = captions(max(1, int(n * CAPTIONS_PER_RECORD)), chars=CAPTION_CHARS)
+    return texts, len(texts)
+
+
+def run_clean_caption(texts):
+    from preprocess.youtube_captions import clean_caption
+    for text in texts:
+        clean_caption(text)
+
+
+# stage -> (module under test, setup(n) returning (payload, records), run(payload))
+STAGES = {
+    "keyword_filter": ("preprocess.youtube_enricher", setup_keyword_filter, run_keyword_filter),
+    "enrich_videos": ("preprocess.youtube_enricher", setup_enrich_videos, run_enrich_videos),
+    "flatten_places": ("preprocess.places_cleaner", setup_flatten, run_flatten_places),
+    "flatten_reviews": ("preprocess.places_cleaner", setup_flatten, run_flatten_reviews),
+    "save_search_results": ("collectors.youtube_search", setup_save_search_results, run_save_search_results),
+    "dedup": ("preprocess.youtube_dedup", setup_dedup, run_dedup),
+    "clean_caption": ("preprocess.youtube_captions", setup_clean_caption, run_clean_caption),
+}
+
+
+def child(stage, size, trace):
+    """Runs one stage once in this process and prints the measurement as JSON."""
+    import contextlib
+    import importlib
+    import io
+    import tracemalloc
+    from utils.metrics import peak_rss_mb
+
+    module, setup, run = STAGES[stage]
+    # imported up front so the timing does not include pandas and friends
+    importlib.import_module(module)
+    # the stages print progress; keep stdout for the result line
+    with contextlib.redirect_stdout(io.StringIO()):
+        payload, records = setup(size)
+        rss_before = peak_rss_mb()
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        run(payload)
+        seconds = time.perf_counter() - start
+    result = {"seconds": seconds, "records": records, "rss_growth_mb": round((peak_rss_mb() or 0) - (rss_before or 0), 1)}
+    if trace:
+        result["peak_alloc_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 1)
+        tracemalloc.stop()
+    print(json.dumps(result))
+
+
+def measure(stage, size, repeat=3):
+    env = {**os.environ, "PYTHONPATH": str(REPO_ROOT), "API_CACHE_OFFLINE": ""}
+
+    def once(trace):
+        with tempfile.TemporaryDirectory() as cwd:
+            cmd = [sys.executable, "-m", "benchmarks.preprocess", "--child", stage, str(size)]
+            proc = subprocess.run(cmd + (["--trace"] if trace else []), cwd=cwd, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+    try:
+        runs = [once(trace=False) for _ in range(repeat)]
+        traced = once(trace=True)
+    except RuntimeError as e:
+        return {"stage": stage, "size": size, "error": str(e)}
+    best = min(r["seconds"] for r in runs)
+    return {
+        "stage": stage,
+        "size": size,
+        "records": runs[0]["records"],
+        "seconds": round(best, 4),
+        "seconds_all": [round(r["seconds"], 4) for r in runs],
+        "records_per_second": round(runs[0]["records"] / best) if best else None,
+        "peak_alloc_mb": traced["peak_alloc_mb"],
+        "rss_growth_mb": max(r["rss_growth_mb"] for r in runs),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(stages=tuple(STAGES), sizes=SIZES, repeat=3):
+    results = []
+    for stage in stages:
+        for size in sizes:
+            r = measure(stage, size, repeat)
+            results.append(r)
+            if "error" in r:
+                print(f"{stage:<20} {size:>9}  FAILED: {r['error']}")
+            else:
+                print(f"{stage:<20} {size:>9}  {r['seconds']:>9.3f} s  {r['records_per_second']:>10}/s  "
+                      f"peak {r['peak_alloc_mb']:>8.1f} MB")
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(report, baseline, max_regression=1.25):
+    """Prints time and memory ratios against a previous report; returns the regressed (stage, size) pairs."""
+    previous = {(r["stage"], r["size"]): r for r in baseline["results"] if "error" not in r}
+    print(f"Compared with {baseline.get('commit')} ({baseline.get('created_at')}):")
+    regressed = []
+    for r in report["results"]:
+        old = previous.get((r["stage"], r["size"]))
+        if old is None or "error" in r:
+            continue
+        time_ratio = r["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        mem_ratio = r["peak_alloc_mb"] / old["peak_alloc_mb"] if old["peak_alloc_mb"] else 1.0
+        flag = ""
+        if time_ratio > max_regression or mem_ratio > max_regression:
+            regressed.append((r["stage"], r["size"]))
+            flag = "  REGRESSION"
+        print(f"{r['stage']:<20} {r['size']:>9}  time x{time_ratio:.2f}  memory x{mem_ratio:.2f}{flag}")
+    return regressed
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES,
+                        help="Records per stage (search items, videos, reviews; captions are 1 per 100)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=str, help="Results JSON (default: data/benchmarks/preprocess_<time>.json)")
+    parser.add_argument("--baseline", type=str, help="Earlier results JSON to compare against")
+    parser.add_argument("--max_regression", type=float, default=1.25,
+                        help="Fail when time or memory grows by more than this factor over the baseline")
+    parser.add_argument("--child", nargs=2, metavar=("STAGE", "SIZE"), help=argparse.SUPPRESS)
+    parser.add_argument("--trace", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child[0], int(args.child[1]), args.trace)
+        sys.exit(0)
+
+    report = run(args.stages, args.sizes, args.repeat)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"preprocess_{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved benchmark results to {output}")
+
+    failed = any("error" in r for r in report["results"])
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            failed = bool(compare(report, json.load(f), args.max_regression)) or failed
+    sys.exit(1 if failed else 0)
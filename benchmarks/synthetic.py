@@ -0,0 +1,174 @@
+"""Synthetic API payloads shaped like the real YouTube and Places responses.
+
+Texts mix tourism vocabulary with some of the negative keywords (trains,
+buses) so the keyword filter drops a realistic share of the search results.
+Everything is generated from a seeded random.Random, so a given size always
+produces the same data.
+"""
+import random
+import string
+from datetime import datetime, timedelta, timezone
+
+SPOTS = ["時の鐘", "喜多院", "菓子屋横丁", "川越氷川神社", "蔵造りの町並み", "川越城本丸御殿", "中院", "大正浪漫夢通り"]
+TOURISM_WORDS = [
+    "食べ歩き", "グルメ", "着物", "散策", "縁結び", "風鈴", "紅葉", "桜", "お祭り", "ランチ", "カフェ", "さつまいも",
+    "歴史", "神社", "寺", "蔵", "古い町並み", "旅行記", "japan travel", "day trip", "street food", "shrine",
+]
+NEGATIVE_WORDS = ["電車", "東武", "西武", "川越線", "車窓", "発車メロディー", "高速バス", "踏切"]
+FILLER = [
+    "今日は", "川越に", "来ました", "とても", "楽しかった", "です", "みなさん", "ぜひ", "行ってみてください",
+    "週末", "友達と", "みんなで", "おすすめ", "混雑", "駐車場", "景色", "最高", "また来たい",
+]
+CAPTION_NOISE = ["[音楽]", "[拍手]", "(笑)", "(字幕)", "♪", "★", "※", "ーーー", "……", "  ", "\n"]
+REVIEW_LANGUAGES = ["ja", "ja", "ja", "en", "zh-Hant", "ko"]
+PLACE_TYPES = ["tourist_attraction", "restaurant", "cafe", "food", "store", "point_of_interest", "establishment"]
+CATEGORY_IDS = ["1", "2", "10", "15", "17", "19", "20", "22", "24"]
+EPOCH = datetime(2015, 1, 1, tzinfo=timezone.utc)
+
+
+def random_id(rng, length=11, alphabet=string.ascii_letters + string.digits + "-_"):
+    return "".join(rng.choices(alphabet, k=length))
+
+
+def random_time(rng, days=365 * 10):
+    return (EPOCH + timedelta(seconds=rng.randrange(days * 86400))).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def sentence(rng, words, negative_rate=0.0):
+    parts = rng.choices(FILLER, k=words)
+    parts[rng.randrange(words)] = rng.choice(SPOTS)
+    parts[rng.randrange(words)] = rng.choice(TOURISM_WORDS)
+    if rng.random() < negative_rate:
+        parts[rng.randrange(words)] = rng.choice(NEGATIVE_WORDS)
+    return "".join(parts)
+
+
+def search_items(n, seed=0, negative_rate=0.15, duplicate_rate=0.05):
+    """`search.list` items; a few video IDs repeat, as they do across queries."""
+    rng = random.Random(seed)
+    items = []
+    for i in range(n):
+        if items and rng.random() < duplicate_rate:
+            items.append(rng.choice(items))
+            continue
+        channel_id = "UC" + random_id(rng, 22)
+        published = random_time(rng)
+        items.append({
+            "kind": "youtube#searchResult",
+            "etag": random_id(rng, 27),
+            "id": {"kind": "youtube#video", "videoId": random_id(rng)},
+            "snippet": {
+                "publishedAt": published,
+                "channelId": channel_id,
+                "title": sentence(rng, 6, negative_rate),
+                "description": sentence(rng, 30, negative_rate),
+                "thumbnails": {"default": {"url": "https://i.ytimg.com/vi/x/default.jpg", "width": 120, "height": 90}},
+                "channelTitle": f"channel {rng.randrange(n // 10 + 1)}",
+                "liveBroadcastContent": "none",
+                "publishTime": published,
+            },
+        })
+    return items
+
+
+def video_item(video_id, rng):
+    """One `videos.list` item with snippet, contentDetails and statistics."""
+    views = int(rng.lognormvariate(8, 2))
+    return {
+        "kind": "youtube#video",
+        "id": video_id,
+        "snippet": {
+            "publishedAt": random_time(rng),
+            "channelId": "UC" + random_id(rng, 22),
+            "title": sentence(rng, 6),
+            "description": sentence(rng, 60),
+            "channelTitle": f"channel {rng.randrange(1000)}",
+            "tags": rng.sample(TOURISM_WORDS, rng.randrange(0, 8)),
+            "categoryId": rng.choice(CATEGORY_IDS),
+            "defaultLanguage": "ja",
+            "defaultAudioLanguage": "ja",
+        },
+        "contentDetails": {
+            "duration": f"PT{rng.randrange(60)}M{rng.randrange(60)}S",
+            "definition": rng.choice(["hd", "sd"]),
+        },
+        "statistics": {
+            "viewCount": str(views),
+            "likeCount": str(views // rng.randrange(20, 100)),
+            "favoriteCount": "0",
+            "commentCount": str(views // rng.randrange(200, 2000)),
+        },
+    }
+
+
+def review(rng):
+    lang = rng.choice(REVIEW_LANGUAGES)
+    text = {"text": sentence(rng, rng.randrange(10, 80)), "languageCode": lang}
+    return {
+        "name": "places/x/reviews/" + random_id(rng, 20),
+        "relativePublishTimeDescription": "1 か月前",
+        "rating": rng.randint(1, 5),
+        "text": text,
+        "originalText": text,
+        "authorAttribution": {"displayName": f"user {rng.randrange(10 ** 6)}", "uri": "", "photoUri": ""},
+        "publishTime": random_time(rng),
+    }
+
+
+def place_details(n, seed=0, reviews_per_place=5):
+    """Place Details (New) responses with the fields in PLACE_DETAILS_FIELDS."""
+    rng = random.Random(seed)
+    places = []
+    for _ in range(n):
+        places.append({
+            "id": "ChIJ" + random_id(rng, 23),
+            "types": rng.sample(PLACE_TYPES, rng.randrange(1, 4)),
+            "formattedAddress": f"日本、〒350-00{rng.randrange(10, 99)} 埼玉県川越市幸町{rng.randrange(1, 30)}-{rng.randrange(1, 30)}",
+            "location": {"latitude": 35.92 + rng.uniform(-0.05, 0.05), "longitude": 139.48 + rng.uniform(-0.06, 0.06)},
+            "rating": round(rng.uniform(3.0, 5.0), 1),
+            "userRatingCount": int(rng.lognormvariate(5, 1.5)),
+            "priceLevel": rng.choice(["PRICE_LEVEL_INEXPENSIVE", "PRICE_LEVEL_MODERATE", None]),
+            "regularOpeningHours": {
+                "openNow": True,
+                "weekdayDescriptions": [f"{d}: 10時00分～17時00分" for d in "月火水木金土日"],
+            },
+            "displayName": {"text": rng.choice(SPOTS) + f" {rng.randrange(1000)}", "languageCode": "ja"},
+            "editorialSummary": {"text": sentence(rng, 12), "languageCode": "ja"},
+            "reviews": [review(rng) for _ in range(reviews_per_place)],
+        })
+    return places
+
+
+def caption(rng, chars=8000):
+    """Auto-generated style caption text: short segments with bracketed cues and symbols."""
+    parts, length = [], 0
+    while length < chars:
+        part = rng.choice(CAPTION_NOISE) if rng.random() < 0.15 else sentence(rng, rng.randrange(3, 10))
+        parts.append(part)
+        length += len(part) + 1
+    return " ".join(parts)
+
+
+def captions(n, seed=0, chars=8000):
+    rng = random.Random(seed)
+    return [caption(rng, chars) for _ in range(n)]
+
+
+class FakeYouTube:
+    """Stands in for the googleapiclient `youtube` resource; only `videos().list().execute()`."""
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.calls = 0
+
+    def videos(self):
+        return self
+
+    def list(self, part, id):
+        self._ids = id.split(",")
+        return self
+
+    def execute(self, **kwargs):
+        self.calls += 1
+        # seeded by the IDs so repeated runs return the same payloads
+        return {"items": [video_item(vid, random.Random(f"{self.seed}:{vid}")) for vid in self._ids]}
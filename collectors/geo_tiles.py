@@ -0,0 +1,99 @@
+import math
+
+EARTH_RADIUS_M = 6_371_000
+METERS_PER_DEG_LAT = 111_320
+
+# tiles are (south, west, north, east) boxes in degrees, searched as their circumscribed circle
+
+
+def bbox_tiles(bbox, tile_radius):
+    """Cover a (south, west, north, east) box with a grid of tiles whose circles have ~tile_radius metres."""
+    south, west, north, east = bbox
+    side = tile_radius * math.sqrt(2)
+    dlat = side / METERS_PER_DEG_LAT
+    dlng = side / (METERS_PER_DEG_LAT * math.cos(math.radians((south + north) / 2)))
+    rows = max(1, math.ceil((north - south) / dlat))
+    cols = max(1, math.ceil((east - west) / dlng))
+    dlat, dlng = (north - south) / rows, (east - west) / cols
+    return [
+        (south + i * dlat, west + j * dlng, south + (i + 1) * dlat, west + (j + 1) * dlng)
+        for i in range(rows) for j in range(cols)
+    ]
+
+
+def split_tile(tile):
+    """Quadtree split into four equal sub-tiles."""
+    south, west, north, east = tile
+    mid_lat, mid_lng = (south + north) / 2, (west + east) / 2
+    return [
+        (south, west, mid_lat, mid_lng),
+        (south, mid_lng, mid_lat, east),
+        (mid_lat, west, north, mid_lng),
+        (mid_lat, mid_lng, north, east),
+    ]
+
+
+def tile_center(tile):
+    south, west, north, east = tile
+    return ((south + north) / 2, (west + east) / 2)
+
+
+def tile_radius(tile):
+    # circumscribed circle, so the four circles of a split still cover the parent tile
+    south, west, north, east = tile
+    return haversine_m(tile_center(tile), (north, east))
+
+
+def polygon_bbox(polygon):
+    lats = [p[0] for p in polygon]
+    lngs = [p[1] for p in polygon]
+    return (min(lats), min(lngs), max(lats), max(lngs))
+
+
+def in_bbox(point, bbox):
+    south, west, north, east = bbox
+    return south <= point[0] <= north and west <= point[1] <= east
+
+
+def in_polygon(point, polygon):
+    # ray casting on (lat, lng) pairs; fine at city scale
+    lat, lng = point
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        (lat_i, lng_i), (lat_j, lng_j) = polygon[i], polygon[j]
+        if (lng_i > lng) != (lng_j > lng):
+            cross = lat_i + (lng - lng_i) * (lat_j - lat_i) / (lng_j - lng_i)
+            if lat < cross:
+                inside = not inside
+        j = i
+    return inside
+
+
+def tile_intersects(tile, polygon):
+    south, west, north, east = tile
+    corners = [(south, west), (south, east), (north, east), (north, west)]
+    if any(in_polygon(c, polygon) for c in corners + [tile_center(tile)]):
+        return True
+    if any(in_bbox(p, tile) for p in polygon):
+        return True
+    edges = list(zip(corners, corners[1:] + corners[:1]))
+    return any(
+        segments_cross(a, b, polygon[i], polygon[i - 1])
+        for a, b in edges for i in range(len(polygon))
+    )
+
+
+def segments_cross(p1, p2, q1, q2):
+    def orient(a, b, c):
+        return (b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])
+    return (
+        orient(p1, p2, q1) * orient(p1, p2, q2) < 0
+        and orient(q1, q2, p1) * orient(q1, q2, p2) < 0
+    )
+
+
+def haversine_m(a, b):
+    lat1, lng1, lat2, lng2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(h))
@@ -1,36 +1,71 @@
-import os
 import json
 from pathlib import Path
 import time
-import googlemaps
+from functools import lru_cache
 import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from utils.api_cache import get_api_cache
+from utils.config import require_env
+from utils.metrics import ContextThreadPoolExecutor, get_metrics
+from utils.rate_limiter import RateLimiter, backoff_delay
+from collectors.geo_tiles import bbox_tiles, polygon_bbox
+from collectors.search_scheduler import RequestBudget
+from collectors.tile_scheduler import SATURATION_RESULTS, TileScheduler
 
 load_dotenv()
 
-API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
-if not API_KEY:
-    raise RuntimeError("Missing GOOGLE_MAPS_API_KEY environment variable")
-
 KAWAGOE_LOCATION = (35.9251, 139.4856)
+# (south, west, north, east) around Kawagoe city
+KAWAGOE_BBOX = (35.86, 139.40, 35.98, 139.55)
 TYPES = [None, "tourist_attraction", "restaurant"]
 
+PLACE_DETAILS_URL = "https://places.googleapis.com/v1/places/{place_id}"
+PLACE_DETAILS_FIELDS = (
+    "id,displayName,formattedAddress,location,"
+    "regularOpeningHours,rating,userRatingCount,"
+    "reviews,types,priceLevel,editorialSummary"
+)
+PLACE_DETAILS_LANGUAGE = "ja"
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
 RAW_DIR = Path("data/raw")
-RAW_DIR.mkdir(exist_ok=True)
-gmaps = googlemaps.Client(key=API_KEY)
 
-def collect_nearby_places(search_radius=4000, max_pages=3, max_results=60):
-    results = fetch_nearby_places(search_radius, max_pages)
+
+@lru_cache(maxsize=None)
+def get_api_key():
+    return require_env("GOOGLE_MAPS_API_KEY")
+
+
+@lru_cache(maxsize=None)
+def get_gmaps_client():
+    import googlemaps
+    return googlemaps.Client(key=get_api_key())
+
+def collect_nearby_places(search_radius=4000, max_pages=3, max_results=60, max_workers=8, qps=10,
+                          tiled=False, polygon=None, tile_radius=1000, min_radius=100, max_requests=2000):
+    if tiled:
+        results = fetch_nearby_places_tiled(
+            polygon=polygon, tile_radius=tile_radius, min_radius=min_radius,
+            max_workers=max_workers, qps=qps, max_requests=max_requests
+        )
+    else:
+        results = fetch_nearby_places(search_radius, max_pages)
     top_places = pick_top_places(results, max_results)
-    details = fetch_place_details([p["place_id"] for p in top_places])
+    details = fetch_place_details(
+        [p["place_id"] for p in top_places], max_workers=max_workers, qps=qps
+    )
+    RAW_DIR.mkdir(parents=True, exist_ok=True)
     save_path = RAW_DIR / "place_details.json"
     with open(save_path, "w", encoding="utf-8") as f:
         json.dump(details, f, ensure_ascii=False, indent=2)
     print(f"Saved place details to {save_path}")
+    get_metrics().rows(rows_in=len(results), rows_out=len(details))
     return results
 
 
 def fetch_nearby_places(search_radius=3000, max_pages=3):
+    gmaps = get_gmaps_client()
     all_results = []
 
     for place_type in TYPES:
@@ -49,6 +84,7 @@ def fetch_nearby_places(search_radius=3000, max_pages=3):
             results.extend(page["results"])
             pages_fetched += 1
 
+        get_metrics().api_call("places.nearby_search", pages_fetched)
         print(f"{place_type or 'no type'} → {len(results)} results ({pages_fetched} pages)")
         all_results.extend(results)
 
@@ -62,6 +98,30 @@ def fetch_nearby_places(search_radius=3000, max_pages=3):
     print(f"Total {len(deduped)} unique places from {len(TYPES)} searches")
     return deduped
 
+def fetch_nearby_places_tiled(bbox=KAWAGOE_BBOX, polygon=None, tile_radius=1000, min_radius=100,
+                              max_workers=8, qps=10, max_requests=2000):
+    """Cover `bbox` (or `polygon`, a list of (lat, lng)) with search circles, splitting saturated ones."""
+    if polygon:
+        bbox = polygon_bbox(polygon)
+    scheduler = TileScheduler(
+        get_api_key(), RateLimiter(qps), RequestBudget(max_requests),
+        max_workers=max_workers, min_radius=min_radius, bbox=bbox, polygon=polygon
+    )
+    tiles = bbox_tiles(bbox, tile_radius)
+    for place_type in TYPES:
+        for tile in tiles:
+            scheduler.add_tile(tile, place_type)
+    results = scheduler.run()
+
+    print(f"Total {len(results)} unique places from {scheduler.requests} requests "
+          f"({len(tiles)} initial tiles x {len(TYPES)} types)")
+    if scheduler.saturated:
+        print(f"{len(scheduler.saturated)} tiles still hit the {SATURATION_RESULTS}-result cap "
+              f"at the minimum radius of {min_radius}m")
+    if scheduler.failed:
+        print(f"{len(scheduler.failed)} tile pages failed and are missing from the results")
+    return results
+
 def pick_top_places(results, limit=60, ratio_popularity=0.8, min_reviews=200):
     filtered = [p for p in results if p.get("user_ratings_total", 0) >= min_reviews]
     n_popularity = int(limit * ratio_popularity)
@@ -90,36 +150,93 @@ def pick_top_places(results, limit=60, ratio_popularity=0.8, min_reviews=200):
     return top_popularity + top_quality
 
 
-def fetch_place_details(place_ids):
-    details = []
-    for pid in place_ids:
-        url = f"https://places.googleapis.com/v1/places/{pid}"
-        headers = {
-            "X-Goog-Api-Key": API_KEY,
-            "X-Goog-FieldMask": (
-                "id,displayName,formattedAddress,location,"
-                "regularOpeningHours,rating,userRatingCount,"
-                "reviews,types,priceLevel,editorialSummary"
-            ),
-            "Accept-Language": "ja" 
-        }
-        resp = requests.get(url, headers=headers)
-        resp.raise_for_status()
-        details.append(resp.json())
+def fetch_place_details(place_ids, max_workers=8, qps=10, max_retries=3):
+    cache = get_api_cache()
+    session = get_http_session(pool_size=max_workers)
+    limiter = RateLimiter(qps)
+
+    def fetch_cached(pid):
+        params = {"id": pid, "fields": PLACE_DETAILS_FIELDS, "language": PLACE_DETAILS_LANGUAGE}
+        return cache.fetch(
+            "places.details", params,
+            lambda: fetch_place_detail(session, pid, limiter, max_retries)
+        )
+
+    try:
+        with ContextThreadPoolExecutor(max_workers=max_workers) as pool:
+            # pool.map keeps the results in the same order as place_ids
+            details = list(pool.map(fetch_cached, place_ids))
+    finally:
+        session.close()
     print(f"Retrieved details for {len(details)} places")
+    cache.print_stats()
     return details
 
 
+def get_http_session(pool_size=8):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_place_detail(session, place_id, limiter=None, max_retries=3, timeout=30):
+    url = PLACE_DETAILS_URL.format(place_id=place_id)
+    headers = {
+        "X-Goog-Api-Key": get_api_key(),
+        "X-Goog-FieldMask": PLACE_DETAILS_FIELDS,
+        "Accept-Language": PLACE_DETAILS_LANGUAGE
+    }
+    for attempt in range(max_retries + 1):
+        if limiter:
+            limiter.acquire()
+        try:
+            resp = session.get(url, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            get_metrics().api_call("places.details", error=True)
+            if attempt == max_retries:
+                raise
+            print(f"Retrying {place_id} after {type(e).__name__} (attempt {attempt + 1})")
+        else:
+            get_metrics().api_call("places.details", error=not resp.ok)
+            if resp.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+                resp.raise_for_status()
+                return resp.json()
+            print(f"Retrying {place_id} after HTTP {resp.status_code} (attempt {attempt + 1})")
+        time.sleep(backoff_delay(attempt))
+
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--search_radius", type=int, default=4000)
     parser.add_argument("--max_pages", type=int, default=3)
     parser.add_argument("--max_results", type=int, default=60)
+    parser.add_argument("--max_workers", type=int, default=8)
+    parser.add_argument("--qps", type=float, default=10)
+    parser.add_argument("--tiled", action="store_true",
+                        help="Cover the city with recursively split search tiles instead of one circle")
+    parser.add_argument("--polygon", type=str,
+                        help="JSON file with a [[lat, lng], ...] area to tile (default: Kawagoe bounding box)")
+    parser.add_argument("--tile_radius", type=int, default=1000)
+    parser.add_argument("--min_radius", type=int, default=100)
+    parser.add_argument("--max_requests", type=int, default=2000)
     args = parser.parse_args()
 
+    polygon = None
+    if args.polygon:
+        with open(args.polygon, encoding="utf-8") as f:
+            polygon = [tuple(p) for p in json.load(f)]
+
     collect_nearby_places(
         search_radius=args.search_radius,
         max_pages=args.max_pages,
-        max_results=args.max_results
+        max_results=args.max_results,
+        max_workers=args.max_workers,
+        qps=args.qps,
+        tiled=args.tiled,
+        polygon=polygon,
+        tile_radius=args.tile_radius,
+        min_radius=args.min_radius,
+        max_requests=args.max_requests
     )
\ No newline at end of file
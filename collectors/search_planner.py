@@ -0,0 +1,164 @@
+import heapq
+import json
+import math
+from datetime import datetime, timedelta, timezone
+from collectors.search_store import SEARCH_DIR
+from collectors.search_windows import PAGE_SIZE, window_key
+
+# {"query|window": {"requests": ..., "new": ...}}, decayed whenever the pair is searched again so recent runs weigh more
+YIELD_HISTORY_PATH = SEARCH_DIR / "search_yield.json"
+PLANS_DIR = SEARCH_DIR / "plans"
+
+# share of the budget spent on the least-tried (query, window) pairs
+EXPLORATION_SHARE = 0.1
+# a pair never tried counts as one request that found this many new videos
+PRIOR_NEW_PER_REQUEST = 10.0
+PRIOR_REQUESTS = 1.0
+HISTORY_DECAY = 0.7
+# each further request to the same pair is expected to find this share of the previous one's videos
+DIMINISHING_RETURNS = 0.6
+
+
+def window_label(end):
+    """The quarter a window ends in, e.g. 2025Q4; merged quiet windows are labelled by their newest quarter."""
+    last = end - timedelta(microseconds=1)
+    return f"{last.year}Q{(last.month - 1) // 3 + 1}"
+
+
+def yield_key(query, window):
+    return f"{query}|{window}"
+
+
+def expected_yield(history, query, window):
+    """Smoothed new videos per request of a (query, window) pair."""
+    h = history.get(yield_key(query, window), {})
+    return (h.get("new", 0.0) + PRIOR_NEW_PER_REQUEST * PRIOR_REQUESTS) / (h.get("requests", 0.0) + PRIOR_REQUESTS)
+
+
+def plan_requests(candidates, budget, history, explore=EXPLORATION_SHARE):
+    """Split `budget` requests over (query, window, max_requests) candidates; returns plan entries.
+
+    A share `explore` of the budget goes one request at a time to the pairs
+    with the least history (newest first). The rest is handed out greedily by
+    expected new videos, where each further request to a pair is worth
+    DIMINISHING_RETURNS of the one before, up to the pair's `max_requests`.
+    """
+    entries = {}
+    for query, window, max_requests in candidates:
+        h = history.get(yield_key(query, window), {})
+        entries[(query, window)] = {
+            "query": query, "window": window, "max_requests": max_requests, "requests": 0,
+            "expected_per_request": round(expected_yield(history, query, window), 2),
+            "history_requests": round(h.get("requests", 0.0), 2), "expected_new": 0.0, "explore": 0,
+        }
+
+    explore_budget = min(len(entries), math.floor(budget * explore))
+    # candidates come newest window first, and sorted() keeps that order among ties
+    least_tried = sorted(entries.values(), key=lambda e: e["history_requests"])
+    for entry in least_tried[:explore_budget]:
+        entry["requests"] += 1
+        entry["explore"] += 1
+        entry["expected_new"] += entry["expected_per_request"]
+
+    heap = [
+        (-e["expected_per_request"] * DIMINISHING_RETURNS ** e["requests"], i, e)
+        for i, e in enumerate(entries.values()) if e["requests"] < e["max_requests"]
+    ]
+    heapq.heapify(heap)
+    remaining = budget - explore_budget
+    while heap and remaining > 0:
+        gain, i, entry = heapq.heappop(heap)
+        entry["requests"] += 1
+        entry["expected_new"] += -gain
+        remaining -= 1
+        if entry["requests"] < entry["max_requests"]:
+            heapq.heappush(heap, (gain * DIMINISHING_RETURNS, i, entry))
+
+    plan = sorted(
+        (e for e in entries.values() if e["requests"]),
+        key=lambda e: e["expected_new"] / e["requests"], reverse=True
+    )
+    for entry in plan:
+        entry["expected_new"] = round(entry["expected_new"], 1)
+    return plan
+
+
+def max_window_requests(state, start, end, default):
+    """Requests a window needs to be paginated to the end, if a previous run exhausted it and knows its count."""
+    info = state["windows"].get(window_key(start, end), {})
+    if not info.get("exhausted") or info.get("count") is None:
+        return default
+    return max(1, math.ceil(info["count"] / PAGE_SIZE))
+
+
+def print_plan(plan, budget):
+    planned = sum(e["requests"] for e in plan)
+    explored = sum(e["explore"] for e in plan)
+    print(f"Search plan: {planned} of {budget} requests over {len(plan)} (query, window) pairs "
+          f"({explored} exploring), about {sum(e['expected_new'] for e in plan):.0f} new videos expected")
+    for e in plan:
+        print(f"  {e['query']} {e['window']}: {e['requests']} requests, "
+              f"~{e['expected_per_request']:.1f} new/request over {e['history_requests']:.1f} past requests"
+              + (" (explore)" if e["explore"] else ""))
+
+
+def plan_report(plan, usage):
+    """Planned vs spent requests and expected vs found new videos per (query, window); `usage` maps
+    (query, window) to [requests, new videos]."""
+    planned = {(e["query"], e["window"]): e for e in plan}
+    rows = []
+    for key in sorted(set(planned) | set(usage)):
+        entry = planned.get(key, {})
+        requests, new = usage.get(key, (0, 0))
+        rows.append({
+            "query": key[0], "window": key[1],
+            "planned_requests": entry.get("requests", 0), "requests": requests,
+            "expected_new": entry.get("expected_new", 0.0), "new": new,
+        })
+    return rows
+
+
+def print_report(report):
+    spent = sum(r["requests"] for r in report)
+    found = sum(r["new"] for r in report)
+    expected = sum(r["expected_new"] for r in report)
+    print(f"Search report: {spent} requests found {found} new videos "
+          f"({found / spent if spent else 0:.1f}/request, {expected:.0f} expected)")
+    for r in sorted(report, key=lambda r: r["new"], reverse=True):
+        if r["requests"]:
+            print(f"  {r['query']} {r['window']}: {r['new']} new from {r['requests']} requests "
+                  f"(planned {r['planned_requests']}, expected {r['expected_new']:.0f})")
+
+
+def save_plan(plan, report=None, budget=None):
+    PLANS_DIR.mkdir(parents=True, exist_ok=True)
+    created_at = datetime.now(timezone.utc)
+    path = PLANS_DIR / f"search_plan_{created_at:%Y%m%dT%H%M%SZ}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"created_at": created_at.isoformat(), "budget": budget, "plan": plan, "report": report},
+            f, ensure_ascii=False, indent=2
+        )
+    return path
+
+
+def load_yield_history():
+    if YIELD_HISTORY_PATH.exists():
+        with open(YIELD_HISTORY_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def update_yield_history(history, usage, decay=HISTORY_DECAY):
+    """Fold this run's [requests, new videos] per (query, window) into the decayed history."""
+    for (query, window), (requests, new) in usage.items():
+        h = history.setdefault(yield_key(query, window), {"requests": 0.0, "new": 0.0})
+        h["requests"] = round(h["requests"] * decay + requests, 3)
+        h["new"] = round(h["new"] * decay + new, 3)
+    return history
+
+
+def save_yield_history(history):
+    SEARCH_DIR.mkdir(parents=True, exist_ok=True)
+    with open(YIELD_HISTORY_PATH, "w", encoding="utf-8") as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,189 @@
+import heapq
+import itertools
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from collectors.search_windows import PAGE_SIZE, split_window, window_key, to_rfc3339
+from utils.metrics import ContextThreadPoolExecutor, get_metrics
+
+# search.list stops paginating after roughly 500 results per query
+MAX_PAGES_PER_WINDOW = 10
+SATURATION_RESULTS = 500
+
+
+class RequestBudget:
+    """Request counter shared by concurrent searches."""
+
+    def __init__(self, max_requests):
+        self.max_requests = max_requests
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.used >= self.max_requests:
+                return False
+            self.used += 1
+            return True
+
+    @property
+    def remaining(self):
+        return max(0, self.max_requests - self.used)
+
+
+_thread_local = threading.local()
+
+
+def thread_http():
+    # httplib2 connections are not thread-safe, so each worker gets its own
+    if not hasattr(_thread_local, "http"):
+        from googleapiclient.http import build_http
+        _thread_local.http = build_http()
+    return _thread_local.http
+
+
+def search_page(youtube, query: str, start, end, page_token=None):
+    request = youtube.search().list(
+        q=query,
+        part="id,snippet",
+        type="video",
+        order="date",
+        maxResults=PAGE_SIZE,
+        publishedAfter=to_rfc3339(start),
+        publishedBefore=to_rfc3339(end),
+        pageToken=page_token
+    )
+    # quota is charged per request, whether or not it succeeds
+    get_metrics().api_call("youtube.search.list")
+    return request.execute(http=thread_http(), num_retries=2)
+
+
+class SearchScheduler:
+    """Runs search.list pages for many (query, window) pairs over one client and one budget.
+
+    Every page is a separate task. Video IDs are deduplicated across queries as
+    pages arrive, and a query whose recent pages are mostly IDs we already have
+    drops to a lower tier, so productive queries spend the budget first.
+    Saturated windows are re-queued as calendar sub-windows.
+
+    With an `allocation` ({(query, window label): requests}, from the search
+    planner), pages of windows that still have planned requests go first, and
+    the rest of the budget is spent on the remaining pages afterwards. Pages
+    of split windows count towards the window they were scheduled as, and
+    `usage` records [requests, new videos] per (query, window label).
+    """
+
+    def __init__(self, youtube, budget, max_workers=4, known_ids=None,
+                 novelty_pages=3, low_novelty=0.2, max_pages=MAX_PAGES_PER_WINDOW, allocation=None):
+        self.youtube = youtube
+        self.budget = budget
+        self.max_workers = max_workers
+        self.novelty_pages = novelty_pages
+        self.low_novelty = low_novelty
+        self.max_pages = max_pages
+
+        self.known_ids = set(known_ids or ())
+        self.collected = {}
+        self.found = defaultdict(dict)
+        self.leaves = defaultdict(list)
+        self.recent_novelty = defaultdict(lambda: deque(maxlen=self.novelty_pages))
+        self.new_counts = defaultdict(int)
+        self.requests = defaultdict(int)
+        self.allocation = dict(allocation) if allocation is not None else None
+        self.usage = defaultdict(lambda: [0, 0])
+        self._heap = []
+        self._seq = itertools.count()
+
+    def add_window(self, query, start, end, page_token=None, pages=0, label=None):
+        task = {
+            "query": query, "start": start, "end": end, "page_token": page_token, "pages": pages,
+            "label": label or window_key(start, end),
+        }
+        heapq.heappush(self._heap, (self.priority(task), next(self._seq), task))
+
+    def priority(self, task):
+        planned = self.allocation is None or self.allocation.get((task["query"], task["label"]), 0) > 0
+        return (0 if planned else 1, self.tier(task["query"]))
+
+    def tier(self, query):
+        recent = self.recent_novelty[query]
+        if len(recent) < recent.maxlen:
+            return 0
+        return 0 if sum(recent) / len(recent) >= self.low_novelty else 1
+
+    def _pop(self):
+        while True:
+            priority, seq, task = heapq.heappop(self._heap)
+            current = self.priority(task)
+            if current == priority:
+                key = (task["query"], task["label"])
+                if self.allocation and self.allocation.get(key, 0) > 0:
+                    self.allocation[key] -= 1
+                return task
+            # the query's novelty or the window's planned requests changed since this page was queued
+            heapq.heappush(self._heap, (current, seq, task))
+
+    def run(self):
+        running = {}
+        with ContextThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while running or (self._heap and self.budget.remaining):
+                while self._heap and len(running) < self.max_workers and self.budget.acquire():
+                    task = self._pop()
+                    future = pool.submit(
+                        search_page, self.youtube, task["query"], task["start"], task["end"], task["page_token"]
+                    )
+                    running[future] = task
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._handle(running.pop(future), future.result())
+
+        # windows still queued when the budget ran out stay incomplete
+        for _, _, task in self._heap:
+            self.leaves[task["query"]].append((task["start"], task["end"], False))
+        self._heap = []
+        return self.found
+
+    def _handle(self, task, response):
+        query = task["query"]
+        self.requests[query] += 1
+        items = response.get("items", [])
+        new_ids = 0
+        for item in items:
+            item["query"] = query
+            vid = item["id"]["videoId"]
+            if vid not in self.known_ids:
+                self.known_ids.add(vid)
+                new_ids += 1
+            self.collected.setdefault(vid, item)
+            self.found[query][vid] = item
+        self.new_counts[query] += new_ids
+        usage = self.usage[(query, task["label"])]
+        usage[0] += 1
+        usage[1] += new_ids
+        self.recent_novelty[query].append(new_ids / len(items) if items else 0.0)
+
+        pages = task["pages"] + 1
+        next_page_token = response.get("nextPageToken")
+        key = window_key(task["start"], task["end"])
+        total_results = response.get("pageInfo", {}).get("totalResults", 0)
+        saturated = (
+            (pages == 1 and len(items) >= PAGE_SIZE and total_results > SATURATION_RESULTS)
+            or pages >= self.max_pages
+        )
+        children = split_window(task["start"], task["end"]) if next_page_token and saturated else []
+
+        if not next_page_token:
+            self.leaves[query].append((task["start"], task["end"], True))
+            status = "complete"
+        elif children:
+            for start, end in children:
+                self.add_window(query, start, end, label=task["label"])
+            status = f"split into {len(children)}"
+        else:
+            self.add_window(query, task["start"], task["end"], next_page_token, pages, label=task["label"])
+            status = f"page {pages}"
+
+        print(f"[{query} {key}] {status}, new: {new_ids}/{len(items)}, "
+              f"Total requests: {self.budget.used}, Collected: {len(self.collected)}")
@@ -0,0 +1,177 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+SEARCH_DIR = Path("data/raw/search")
+STORE_PATH = SEARCH_DIR / "search_results.sqlite"
+FETCH_SIZE = 1000
+
+
+class SearchStore:
+    """SQLite store for raw search.list items, upserted by video ID.
+
+    Every save gets the next sequence number (`seq`), and upserted rows take
+    it, so a reader that remembers the last sequence it processed can read
+    only what has been added or updated since. `video_queries` records which
+    queries found each video.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                published_at TEXT,
+                item TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                first_seen_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_videos_published_at ON videos (published_at);
+            CREATE INDEX IF NOT EXISTS idx_videos_seq ON videos (seq);
+            CREATE TABLE IF NOT EXISTS video_queries (
+                video_id TEXT NOT NULL,
+                query TEXT NOT NULL,
+                found_at REAL NOT NULL,
+                PRIMARY KEY (video_id, query)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_video_queries_query ON video_queries (query);
+            CREATE TABLE IF NOT EXISTS imported_files (
+                name TEXT PRIMARY KEY,
+                imported_at REAL NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @property
+    def last_seq(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM videos").fetchone()[0]
+
+    def upsert(self, query, items):
+        """Insert or update `items` as found by `query`; returns the number of videos new to the store."""
+        now = time.time()
+        rows = {
+            item["id"]["videoId"]: (
+                item["id"]["videoId"], item["snippet"].get("publishedAt"),
+                json.dumps(item, ensure_ascii=False)
+            )
+            for item in items
+        }
+        with self._lock, self._conn:
+            seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM videos").fetchone()[0]
+            before = self._conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+            self._conn.executemany(
+                """
+                INSERT INTO videos (video_id, published_at, item, seq, first_seen_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (video_id) DO UPDATE SET
+                    published_at = excluded.published_at,
+                    item = excluded.item,
+                    seq = excluded.seq,
+                    updated_at = excluded.updated_at
+                WHERE videos.item != excluded.item
+                """,
+                [(*row, seq, now, now) for row in rows.values()]
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO video_queries VALUES (?, ?, ?)",
+                [(vid, query, now) for vid in rows]
+            )
+            after = self._conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+        return after - before
+
+    def iter_items(self, query=None, after_seq=0, fetch_size=FETCH_SIZE):
+        """Yields (seq, item) for stored videos in sequence order, optionally only those found by `query`."""
+        sql = "SELECT v.seq, v.item FROM videos v"
+        params = [after_seq]
+        if query is not None:
+            sql += " JOIN video_queries q ON q.video_id = v.video_id AND q.query = ?"
+            params.insert(0, query)
+        sql += " WHERE v.seq > ? ORDER BY v.seq, v.video_id"
+        # a separate connection, so the cursor does not block writes or hold the lock
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for seq, item in rows:
+                    yield seq, json.loads(item)
+        finally:
+            conn.close()
+
+    def video_ids(self, query=None):
+        with self._lock:
+            if query is None:
+                rows = self._conn.execute("SELECT video_id FROM videos")
+            else:
+                rows = self._conn.execute("SELECT video_id FROM video_queries WHERE query = ?", (query,))
+            return {vid for (vid,) in rows}
+
+    def count(self, query=None):
+        with self._lock:
+            if query is None:
+                return self._conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+            return self._conn.execute("SELECT COUNT(*) FROM video_queries WHERE query = ?", (query,)).fetchone()[0]
+
+    def queries_for(self, video_id):
+        with self._lock:
+            rows = self._conn.execute("SELECT query FROM video_queries WHERE video_id = ? ORDER BY query", (video_id,))
+            return [q for (q,) in rows]
+
+    def import_json_files(self, search_dir=SEARCH_DIR):
+        """One-off import of the old {query}_search.json files; each file is imported once and kept."""
+        imported = 0
+        for file in sorted(Path(search_dir).glob("*_search.json")):
+            with self._lock:
+                done = self._conn.execute("SELECT 1 FROM imported_files WHERE name = ?", (file.name,)).fetchone()
+            if done:
+                continue
+            with open(file, "r", encoding="utf-8") as f:
+                try:
+                    items = json.load(f)
+                except json.JSONDecodeError:
+                    print(f"Skipping unreadable {file}")
+                    continue
+            # file names replaced spaces with underscores, so multi-word queries come back with underscores
+            query = file.name[: -len("_search.json")]
+            imported += self.upsert(query, items)
+            with self._lock, self._conn:
+                self._conn.execute("INSERT INTO imported_files VALUES (?, ?)", (file.name, time.time()))
+            print(f"Imported {len(items)} search results for '{query}' from {file}")
+        return imported
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_search_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SearchStore()
+            _store.import_json_files()
+    return _store
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Inspect the raw search result store.")
+    parser.add_argument("--query", type=str, help="Only count videos found by this query")
+    args = parser.parse_args()
+    store = get_search_store()
+    print(f"{store.count(args.query)} videos in {store.path} (last seq {store.last_seq})")
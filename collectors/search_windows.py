@@ -0,0 +1,144 @@
+from datetime import datetime, timedelta
+
+PAGE_SIZE = 50
+
+def quarter_windows(start_year, end_year):
+    # newest quarter first, as (start, end) pairs in UTC
+    windows = []
+    for year in range(end_year, start_year - 1, -1):
+        for q in range(3, -1, -1):
+            start = datetime(year, 3 * q + 1, 1)
+            end = datetime(year + 1, 1, 1) if q == 3 else datetime(year, 3 * q + 4, 1)
+            windows.append((start, end))
+    return windows
+
+
+def split_window(start, end):
+    """Bisect a window along calendar boundaries: quarter -> month -> week -> day."""
+    span = end - start
+    if span > timedelta(days=92):
+        levels = [quarter_starts, month_starts]
+    elif span > timedelta(days=31):
+        levels = [month_starts]
+    elif span > timedelta(days=7):
+        levels = [week_starts]
+    else:
+        levels = [day_starts]
+
+    for level in levels + [day_starts]:
+        cuts = [d for d in level(start, end) if start < d < end]
+        if cuts:
+            edges = [start] + cuts + [end]
+            # newest sub-window first
+            return [(edges[i], edges[i + 1]) for i in range(len(edges) - 1)][::-1]
+    return []
+
+
+def month_starts(start, end):
+    d = datetime(start.year, start.month, 1)
+    while d < end:
+        yield d
+        d = datetime(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def quarter_starts(start, end):
+    return (d for d in month_starts(start, end) if d.month in (1, 4, 7, 10))
+
+
+def week_starts(start, end):
+    # weeks restart on the 1st so they never straddle a month
+    for month in month_starts(start, end):
+        for day in (1, 8, 15, 22, 29):
+            if day <= 28 or (month + timedelta(days=day - 1)).month == month.month:
+                yield month.replace(day=day)
+
+
+def day_starts(start, end):
+    d = datetime(start.year, start.month, start.day)
+    while d < end:
+        yield d
+        d += timedelta(days=1)
+
+
+def merge_quiet_windows(pending, state):
+    """Merge adjacent windows whose last known result count fits in a single page."""
+    merged = []
+    for start, end, published_after in sorted(pending, key=lambda w: w[0], reverse=True):
+        info = state["windows"].get(window_key(start, end), {})
+        quiet = info.get("count") is not None and info["count"] < PAGE_SIZE
+        if merged and quiet and merged[-1]["quiet"] and merged[-1]["start"] == end \
+                and merged[-1]["count"] + info["count"] < PAGE_SIZE:
+            merged[-1]["start"] = published_after
+            merged[-1]["count"] += info["count"]
+        else:
+            merged.append({"start": published_after, "end": end, "quiet": quiet, "count": info.get("count", 0)})
+    if len(merged) < len(pending):
+        print(f"Merged {len(pending)} quiet windows into {len(merged)} requests")
+    return [(w["start"], w["end"]) for w in merged]
+
+
+def select_pending_windows(windows, state, backfill=False):
+    """Keep windows that still need fetching as (start, end, published_after).
+
+    Complete windows (fully paginated after they closed) are always skipped.
+    Without `backfill`, older windows that were never fetched or were cut off
+    by the request budget are skipped too, leaving only new and still-open ones.
+    """
+    watermark = parse_published_at(state.get("newest_published_at"))
+    pending = []
+    for start, end in windows:
+        info = state["windows"].get(window_key(start, end))
+        is_open = bool(info) and parse_published_at(info["fetched_at"]) < end
+        if info and info["exhausted"] and not is_open:
+            continue
+
+        is_new = watermark is None or end > watermark
+        if not (backfill or is_new or is_open):
+            continue
+
+        published_after = start
+        if info and info["exhausted"] and info.get("newest"):
+            # the rest of this open window was already paginated to the end
+            published_after = max(start, parse_published_at(info["newest"]))
+        pending.append((start, end, published_after))
+    return pending
+
+
+def record_window(state, start, end, items, leaves, fetched_at):
+    """Record a quarter as exhausted only if every searched sub-window inside it was."""
+    key = window_key(start, end)
+    info = state["windows"].get(key, {})
+    overlapping = [done for s, e, done in leaves if s < end and e > start]
+    exhausted = bool(overlapping) and all(overlapping)
+
+    lo, hi = to_rfc3339(start), to_rfc3339(end)
+    published = [item["snippet"]["publishedAt"] for item in items if lo <= item["snippet"]["publishedAt"] < hi]
+    newest = max(published + [info.get("newest") or ""]) or None
+    if exhausted and info.get("exhausted"):
+        # an open window was resumed from its newest video, so add to the previous count
+        count = info.get("count", 0) + len(published)
+    else:
+        count = len(published)
+
+    state["windows"][key] = {
+        "exhausted": exhausted,
+        "fetched_at": to_rfc3339(fetched_at),
+        "newest": newest,
+        "count": count,
+    }
+    if newest and newest > (state.get("newest_published_at") or ""):
+        state["newest_published_at"] = newest
+
+
+def window_key(start, end):
+    return f"{start:%Y-%m-%d}/{end:%Y-%m-%d}"
+
+
+def to_rfc3339(dt):
+    return dt.replace(microsecond=0).isoformat("T") + "Z"
+
+
+def parse_published_at(value):
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
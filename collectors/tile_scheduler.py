@@ -0,0 +1,187 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from collectors.geo_tiles import in_bbox, in_polygon, split_tile, tile_center, tile_intersects, tile_radius
+from utils.metrics import ContextThreadPoolExecutor, get_metrics
+from utils.rate_limiter import backoff_delay
+
+# Nearby Search returns 20 results per page and stops after 3 pages
+PAGE_SIZE = 20
+MAX_PAGES = 3
+SATURATION_RESULTS = PAGE_SIZE * MAX_PAGES
+# a next_page_token only becomes valid a couple of seconds after it is issued
+PAGE_TOKEN_DELAY = 2.0
+TOKEN_RETRY_DELAY = 1.0
+MAX_TOKEN_RETRIES = 5
+# statuses worth retrying with backoff; any other error fails only its tile
+RETRY_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+MAX_ERROR_RETRIES = 3
+
+_thread_local = threading.local()
+
+
+def thread_gmaps(api_key):
+    # googlemaps.Client wraps a requests.Session, so each worker gets its own
+    if not hasattr(_thread_local, "gmaps"):
+        import googlemaps
+        _thread_local.gmaps = googlemaps.Client(key=api_key)
+    return _thread_local.gmaps
+
+
+class TileScheduler:
+    """Runs Nearby Search pages for many (tile, type) pairs concurrently.
+
+    Every page is a separate task in a heap ordered by the time it may run, so
+    the wait before a next_page_token is usable only delays that tile while
+    other tiles keep the workers busy. A tile whose pages add up to the 60
+    result cap is split into four and searched again, down to `min_radius`.
+    Places are deduplicated by place_id as pages arrive and, when an area is
+    given, only places inside it are kept.
+
+    Transient errors (OVER_QUERY_LIMIT, UNKNOWN_ERROR, timeouts and
+    connection errors) are retried with backoff; a page that still fails is
+    recorded in `failed` and the rest of the tiles go on, so the places
+    collected so far are always returned. REQUEST_DENIED stops scheduling
+    new pages, since every other request would be denied too.
+    """
+
+    def __init__(self, api_key, limiter, budget, max_workers=8, min_radius=100, bbox=None, polygon=None):
+        self.api_key = api_key
+        self.limiter = limiter
+        self.budget = budget
+        self.max_workers = max_workers
+        self.min_radius = min_radius
+        self.bbox = bbox
+        self.polygon = polygon
+
+        self.places = {}
+        self.saturated = []
+        self.failed = []
+        self.denied = False
+        self.requests = 0
+        self._heap = []
+        self._seq = itertools.count()
+
+    def add_tile(self, tile, place_type=None):
+        if self.polygon and not tile_intersects(tile, self.polygon):
+            return
+        self._push({"tile": tile, "type": place_type, "page_token": None, "pages": 0, "count": 0, "retries": 0,
+                    "errors": 0})
+
+    def _push(self, task, delay=0.0):
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), task))
+
+    def run(self):
+        running = {}
+        with ContextThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while running or (self._heap and self.budget.remaining and not self.denied):
+                while (self._heap and not self.denied and len(running) < self.max_workers
+                       and self._heap[0][0] <= time.monotonic() and self.budget.acquire()):
+                    _, _, task = heapq.heappop(self._heap)
+                    running[pool.submit(self._fetch, task)] = task
+                # wait for a queued page only if one could start; otherwise block on the running ones
+                timeout = None
+                if (self._heap and not self.denied and len(running) < self.max_workers
+                        and self.budget.remaining):
+                    timeout = max(0.0, self._heap[0][0] - time.monotonic())
+                if not running:
+                    if timeout is None:
+                        break
+                    time.sleep(timeout)
+                    continue
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._handle(running.pop(future), future)
+
+        if self._heap and self.denied:
+            print(f"Requests denied; {len(self._heap)} queued pages were not started")
+            self.failed.extend((task["tile"], task["type"], "not started") for _, _, task in self._heap)
+        elif self._heap:
+            print(f"Request budget exhausted with {len(self._heap)} pages still queued")
+        self._heap = []
+        return list(self.places.values())
+
+    def _fetch(self, task):
+        self.limiter.acquire()
+        gmaps = thread_gmaps(self.api_key)
+        if task["page_token"]:
+            return gmaps.places_nearby(page_token=task["page_token"])
+        kwargs = {"type": task["type"]} if task["type"] else {}
+        return gmaps.places_nearby(
+            location=tile_center(task["tile"]), radius=round(tile_radius(task["tile"])), **kwargs
+        )
+
+    def _handle(self, task, future):
+        from googlemaps.exceptions import ApiError, Timeout, TransportError
+        self.requests += 1
+        try:
+            page = future.result()
+        except ApiError as e:
+            get_metrics().api_call("places.nearby_search", error=True)
+            # token not active yet: try the same page again a bit later
+            if e.status == "INVALID_REQUEST" and task["page_token"] and task["retries"] < MAX_TOKEN_RETRIES:
+                self._push({**task, "retries": task["retries"] + 1}, TOKEN_RETRY_DELAY)
+                return
+            if e.status == "REQUEST_DENIED":
+                self.denied = True
+            self._retry_or_fail(task, f"{e.status} {e.message or ''}".strip(), retry=e.status in RETRY_STATUSES)
+            return
+        except (Timeout, TransportError) as e:
+            get_metrics().api_call("places.nearby_search", error=True)
+            self._retry_or_fail(task, type(e).__name__, retry=True)
+            return
+        get_metrics().api_call("places.nearby_search")
+
+        results = page.get("results", [])
+        new_places = 0
+        for place in results:
+            pid = place.get("place_id")
+            if not pid or pid in self.places or not self._in_area(place):
+                continue
+            self.places[pid] = place
+            new_places += 1
+
+        task = {
+            **task, "pages": task["pages"] + 1, "count": task["count"] + len(results), "retries": 0, "errors": 0
+        }
+        next_page_token = page.get("next_page_token")
+        if next_page_token and task["pages"] < MAX_PAGES:
+            self._push({**task, "page_token": next_page_token}, PAGE_TOKEN_DELAY)
+            status = f"page {task['pages']}"
+        elif task["count"] >= SATURATION_RESULTS and tile_radius(task["tile"]) / 2 >= self.min_radius:
+            for child in split_tile(task["tile"]):
+                self.add_tile(child, task["type"])
+            status = "saturated, split into 4"
+        else:
+            if task["count"] >= SATURATION_RESULTS:
+                self.saturated.append((task["tile"], task["type"]))
+            status = "complete"
+
+        print(f"{self._label(task)} {status}, new: {new_places}/{len(results)}, "
+              f"Total requests: {self.requests}, Collected: {len(self.places)}")
+
+    def _retry_or_fail(self, task, reason, retry):
+        label = self._label(task)
+        if retry and task["errors"] < MAX_ERROR_RETRIES:
+            print(f"{label} retrying after {reason} (attempt {task['errors'] + 1})")
+            self._push({**task, "errors": task["errors"] + 1}, backoff_delay(task["errors"]))
+            return
+        print(f"{label} failed: {reason}")
+        self.failed.append((task["tile"], task["type"], reason))
+
+    def _label(self, task):
+        lat, lng = tile_center(task["tile"])
+        return f"[{task['type'] or 'no type'} ({lat:.4f}, {lng:.4f}) r={tile_radius(task['tile']):.0f}m]"
+
+    def _in_area(self, place):
+        loc = place.get("geometry", {}).get("location")
+        if not loc:
+            return True
+        point = (loc["lat"], loc["lng"])
+        if self.polygon:
+            return in_polygon(point, self.polygon)
+        if self.bbox:
+            return in_bbox(point, self.bbox)
+        return True
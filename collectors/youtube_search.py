@@ -1,65 +1,84 @@
-from pathlib import Path
 import os
 import json
-from googleapiclient.discovery import build
+from functools import lru_cache
 from dotenv import load_dotenv
-from datetime import datetime
-
-
-OUTPUT_DIR = Path("data/raw/search")
-OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+from datetime import datetime, timezone
+from utils.config import load_config
+from utils.metrics import API_QUOTA, get_metrics
+from collectors.search_planner import (
+    EXPLORATION_SHARE, load_yield_history, max_window_requests, plan_report, plan_requests, print_plan, print_report,
+    save_plan, save_yield_history, update_yield_history, window_label
+)
+from collectors.search_scheduler import MAX_PAGES_PER_WINDOW, RequestBudget, SearchScheduler
+from collectors.search_store import SEARCH_DIR, get_search_store
+from collectors.search_windows import (
+    quarter_windows, select_pending_windows, merge_quiet_windows, record_window
+)
+
+
+OUTPUT_DIR = SEARCH_DIR
+QUERIES_CONFIG = "youtube_search_queries.yaml"
+
+
+def youtube_search(query: str, max_requests=10, start_year=None, end_year=None, incremental=False, backfill=False,
+                   max_workers=4, plan=True, explore=EXPLORATION_SHARE, plan_only=False):
+    youtube_search_many(
+        [query], max_requests=max_requests, start_year=start_year, end_year=end_year,
+        incremental=incremental, backfill=backfill, max_workers=max_workers,
+        plan=plan, explore=explore, plan_only=plan_only
+    )
 
 
-def youtube_search(query: str, max_requests=10, start_year=None, end_year=None):
+def youtube_search_many(queries=None, max_requests=20, start_year=None, end_year=None, incremental=False,
+                        backfill=False, max_workers=4, plan=True, explore=EXPLORATION_SHARE, plan_only=False):
     load_dotenv()
-    API_KEY = os.getenv("YOUTUBE_API_KEY")
-    if not API_KEY:
-        raise ValueError("Please set YOUTUBE_API_KEY in .env")
-    yt = get_youtube_client(API_KEY)
-
-    print(f"Fetching search results for: {query}")
-    results = run_split_search(yt, query, max_requests, start_year=start_year, end_year=end_year)
-    save_search_results(query, results)
+    if plan_only:
+        # the plan only needs the saved search states and yield history
+        yt = None
+    else:
+        API_KEY = os.getenv("YOUTUBE_API_KEY")
+        if not API_KEY:
+            raise ValueError("Please set YOUTUBE_API_KEY in .env")
+        yt = get_youtube_client(API_KEY)
+
+    queries = queries or load_search_queries()
+    print(f"Fetching search results for: {', '.join(queries)}")
+    results = run_multi_search(
+        yt, queries, max_requests, start_year=start_year, end_year=end_year,
+        incremental=incremental, backfill=backfill, max_workers=max_workers,
+        plan=plan or plan_only, explore=explore, plan_only=plan_only
+    )
+    if plan_only:
+        return
+    for query in queries:
+        save_search_results(query, results[query])
+    get_metrics().rows(rows_out=sum(len(items) for items in results.values()))
 
 
+@lru_cache(maxsize=None)
 def get_youtube_client(api_key: str):
+    # the discovery client is slow to import and to build, so both happen on first use
+    from googleapiclient.discovery import build
     return build("youtube", "v3", developerKey=api_key)
 
 
-def run_search(youtube, query: str, published_after=None, published_before=None, request_budget=10):
-    all_items = []
-    next_page_token = None
-    requests_used = 0
-
-    while requests_used < request_budget:
-        request = youtube.search().list(
-            q=query,
-            part="id,snippet",
-            type="video",
-            order="date",
-            maxResults=50,
-            publishedAfter=published_after,
-            publishedBefore=published_before,
-            pageToken=next_page_token
-        )
-        response = request.execute()
-        requests_used += 1
-
-        items = response.get("items", [])
-        for item in items:
-            item["query"] = query
-        all_items.extend(items)
+def load_search_queries():
+    return load_config(QUERIES_CONFIG)["queries"]
 
-        next_page_token = response.get("nextPageToken")
-        if not next_page_token:
-            break
 
-    return all_items, requests_used
+def run_split_search(youtube, query: str, max_requests: int, start_year=None, end_year=None,
+                     incremental=False, backfill=False, max_workers=4, plan=True):
+    results = run_multi_search(
+        youtube, [query], max_requests, start_year=start_year, end_year=end_year,
+        incremental=incremental, backfill=backfill, max_workers=max_workers, plan=plan
+    )
+    return results[query]
 
 
-def run_split_search(youtube, query: str, max_requests: int, start_year=None, end_year=None):
-    collected = {}
-    request_count = 0
+def run_multi_search(youtube, queries, max_requests: int, start_year=None, end_year=None,
+                     incremental=False, backfill=False, max_workers=4, plan=True, explore=EXPLORATION_SHARE,
+                     plan_only=False):
+    fetched_at = datetime.now(timezone.utc).replace(tzinfo=None)
 
     if end_year:
         end_year = int(end_year)
@@ -71,87 +90,129 @@ def run_split_search(youtube, query: str, max_requests: int, start_year=None, en
     else:
         start_year = end_year - 1
 
-    quarter_starts = [(1,1), (4,1), (7,1), (10,1)]
-    quarter_ends   = [(4,1), (7,1), (10,1), (1,1)] 
-
-    for year in range(end_year, start_year - 1, -1):
-        for q in range(4):
-            if request_count >= max_requests:
-                break
-
-            published_after = datetime(year, *quarter_starts[q]).isoformat("T") + "Z"
-
-            if q < 3:
-                published_before = datetime(year, *quarter_ends[q]).isoformat("T") + "Z"
-            else:
-                published_before = datetime(year + 1, *quarter_ends[q]).isoformat("T") + "Z"
-
-            items, used_requests = run_search(
-                youtube,
-                query,
-                published_after=published_after,
-                published_before=published_before,
-                request_budget=max_requests - request_count
-            )
+    quarters = [(start, end) for start, end in quarter_windows(start_year, end_year) if start < fetched_at]
+
+    states, pending = {}, {}
+    for query in queries:
+        states[query] = load_search_state(query)
+        if incremental:
+            pending[query] = select_pending_windows(quarters, states[query], backfill=backfill)
+            print(f"Incremental search '{query}': {len(pending[query])} of {len(quarters)} windows to fetch")
+        else:
+            pending[query] = [(start, end, start) for start, end in quarters]
+
+    windows = {query: merge_quiet_windows(pending[query], states[query]) for query in queries}
+    # interleave queries so every query gets its newest windows in early
+    order = [
+        (query, *windows[query][i])
+        for i in range(max(map(len, windows.values()), default=0))
+        for query in queries if i < len(windows[query])
+    ]
+
+    search_plan = history = None
+    if plan:
+        history = load_yield_history()
+        candidates = [
+            (query, window_label(end), max_window_requests(states[query], start, end, MAX_PAGES_PER_WINDOW))
+            for query, start, end in order
+        ]
+        search_plan = plan_requests(candidates, max_requests, history, explore=explore)
+        print_plan(search_plan, max_requests)
+        if plan_only:
+            print(f"Saved search plan → {save_plan(search_plan, budget=max_requests)}")
+            return None
+        # planned windows first, in order of expected yield; the rest keep the interleaved order
+        rank = {(e["query"], e["window"]): i for i, e in enumerate(search_plan)}
+        order.sort(key=lambda w: rank.get((w[0], window_label(w[2])), len(rank)))
+
+    scheduler = SearchScheduler(
+        youtube, RequestBudget(max_requests), max_workers=max_workers, known_ids=load_known_video_ids(),
+        allocation={(e["query"], e["window"]): e["requests"] for e in search_plan} if plan else None
+    )
+    for query, start, end in order:
+        scheduler.add_window(query, start, end, label=window_label(end))
 
-            request_count += used_requests
+    found = scheduler.run()
+    results = {}
+    for query in queries:
+        items = list(found[query].values())
+        for start, end, _ in pending[query]:
+            record_window(states[query], start, end, items, scheduler.leaves[query], fetched_at)
+        save_search_state(query, states[query])
+        results[query] = items
+        print(f"'{query}': {scheduler.requests[query]} requests, {scheduler.new_counts[query]} new videos")
 
-            for item in items:
-                vid = item["id"]["videoId"]
-                collected[vid] = item
+    print(f"Total requests: {scheduler.budget.used}, unique videos this run: {len(scheduler.collected)}")
+    if plan:
+        save_yield_history(update_yield_history(history, scheduler.usage))
+        report = plan_report(search_plan, scheduler.usage)
+        print_report(report)
+        print(f"Saved search plan and report → {save_plan(search_plan, report, budget=max_requests)}")
+    return results
 
-            print(f"[{year} Q{q+1}] Total requests: {request_count}, Collected: {len(collected)}")
 
-            if request_count >= max_requests:
-                break
+def load_known_video_ids():
+    return get_search_store().video_ids()
 
-    return list(collected.values())
 
+def search_state_path(query: str):
+    return OUTPUT_DIR / f"{query}_state.json".replace(" ", "_")
 
-def save_search_results(query: str, results):
-    filename = f"{query}_search.json".replace(" ", "_")
-    filepath = OUTPUT_DIR / filename
 
+def load_search_state(query: str):
+    filepath = search_state_path(query)
     if filepath.exists():
         with open(filepath, "r", encoding="utf-8") as f:
-            try:
-                existing = json.load(f)
-            except json.JSONDecodeError:
-                existing = []
-    else:
-        existing = []
-
-    combined = {item["id"]["videoId"]: item for item in existing}
-    for item in results:
-        vid = item["id"]["videoId"]
-        combined[vid] = item
-
-    sorted_items = sorted(
-        combined.values(),
-        key=lambda x: datetime.fromisoformat(
-            x["snippet"]["publishedAt"].replace("Z", "+00:00")
-        ),
-        reverse=True
-    )
+            return json.load(f)
+    return {"query": query, "newest_published_at": None, "windows": {}}
 
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(sorted_items, f, ensure_ascii=False, indent=2)
 
-    print(f"Saved {len(sorted_items)} unique results for '{query}' → {filepath}")
+def save_search_state(query: str, state):
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    with open(search_state_path(query), "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
 
 
+def save_search_results(query: str, results):
+    store = get_search_store()
+    new = store.upsert(query, results)
+    print(f"Saved {len(results)} results for '{query}' ({new} new videos, {store.count(query)} in total) → {store.path}")
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("--query", type=str, required=True)
+    parser.add_argument("--query", type=str, nargs="+", default=None,
+                        help="One or more queries (default: config/youtube_search_queries.yaml)")
     parser.add_argument("--max_requests", type=int, default=90)
     parser.add_argument("--start_year", type=int, default=None)
     parser.add_argument("--end_year", type=int, default=None)
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only fetch windows that are new or still open since the last run")
+    parser.add_argument("--backfill", action="store_true",
+                        help="With --incremental, also fill in older incomplete windows")
+    parser.add_argument("--max_workers", type=int, default=4)
+    parser.add_argument("--quota_units", type=int, default=None,
+                        help="YouTube Data API units to spend instead of --max_requests (search.list costs 100)")
+    parser.add_argument("--explore", type=float, default=EXPLORATION_SHARE,
+                        help="Share of the requests reserved for the least-tried (query, window) pairs")
+    parser.add_argument("--no_plan", action="store_true",
+                        help="Spend the requests newest window first instead of by expected new videos")
+    parser.add_argument("--plan_only", action="store_true", help="Print and save the plan without searching")
     args = parser.parse_args()
 
-    youtube_search(
-        query=args.query,
-        max_requests=args.max_requests,
+    max_requests = args.max_requests
+    if args.quota_units is not None:
+        max_requests = args.quota_units // API_QUOTA["youtube.search.list"][1]
+
+    youtube_search_many(
+        queries=args.query,
+        max_requests=max_requests,
         start_year=args.start_year,
         end_year=args.end_year,
+        incremental=args.incremental,
+        backfill=args.backfill,
+        max_workers=args.max_workers,
+        plan=not args.no_plan,
+        explore=args.explore,
+        plan_only=args.plan_only,
     )
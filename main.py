@@ -1,25 +1,105 @@
-from collectors.youtube_search import youtube_search
+from collectors.youtube_search import youtube_search_many
 from preprocess.youtube_enricher import youtube_enricher
+from preprocess.youtube_dedup import youtube_dedup
 from preprocess.youtube_captions import youtube_captions
 from analysis.youtube_strategy import generate_video_report
 from collectors.places_search import collect_nearby_places
 from preprocess.places_cleaner import clean_places_data
 from analysis.places_strategy import generate_tourism_report
 from analysis.bq_table_builder import run_bq_sql
+from analysis.duckdb_table_builder import run_duckdb_sql
+from analysis.text_index import INDEX_PATH, build_text_index
+from utils.config import CONFIG_DIR, REPO_ROOT
+from utils.metrics import get_metrics
+from utils.pipeline import Pipeline, Stage
 
-def analyze_youtube():
-    youtube_search(query="川越", start_year=2020)
-    youtube_search(query="Kawagoe", start_year=2020)
-    youtube_enricher()
-    youtube_captions()
-    generate_video_report()
+# only the store: query states, yield history and plans in data/raw/search change on every search run
+SEARCH_STORE = "data/raw/search/search_results.sqlite"
+PLACE_DETAILS = "data/raw/place_details.json"
+VIDEO_DETAILS = "data/processed/youtube_video_details"
+DUPLICATES = "data/processed/youtube_duplicates.parquet"
+CAPTIONS = "data/processed/youtube_captions.parquet"
+CAPTION_SEGMENTS = "data/processed/youtube_caption_segments.parquet"
+CAPTION_TEXT = "data/processed/youtube_caption_text.parquet"
+GMAP_PLACES = "data/processed/gmap_places"
+GMAP_REVIEWS = "data/processed/gmap_reviews"
 
-def analyze_gmap():
-    collect_nearby_places()
-    clean_places_data()
-    generate_tourism_report()
+def build_pipeline(backend="bigquery", incremental=False):
+    if backend == "duckdb":
+        features = Stage(
+            "build_features", run_duckdb_sql,
+            inputs=[VIDEO_DETAILS, GMAP_PLACES, REPO_ROOT / "sql" / "duckdb"],
+            outputs=["data/features/youtube_video_features.parquet", "data/features/gmap_place_features.parquet"]
+        )
+    else:
+        # the tables live in BigQuery, so there is no local output to check
+        features = Stage(
+            "build_features", run_bq_sql,
+            inputs=[VIDEO_DETAILS, GMAP_PLACES, REPO_ROOT / "sql"],
+            kwargs={"incremental": incremental}
+        )
+
+    return Pipeline([
+        # YouTube
+        Stage(
+            "youtube_search", youtube_search_many,
+            inputs=[CONFIG_DIR / "youtube_search_queries.yaml"],
+            outputs=[SEARCH_STORE],
+            kwargs={"max_requests": 20, "start_year": 2020},
+            always_run=True
+        ),
+        Stage(
+            "youtube_enricher", youtube_enricher,
+            inputs=[
+                SEARCH_STORE, CONFIG_DIR / "kawagoe_keywords.yaml",
+                CONFIG_DIR / "youtube_category_map.yaml", CONFIG_DIR / "tourism_keyword_rules.yaml"
+            ],
+            outputs=[VIDEO_DETAILS]
+        ),
+        Stage("youtube_dedup", youtube_dedup, inputs=[VIDEO_DETAILS], outputs=[DUPLICATES]),
+        Stage("youtube_captions", youtube_captions, inputs=[VIDEO_DETAILS, DUPLICATES],
+              outputs=[CAPTIONS, CAPTION_SEGMENTS, CAPTION_TEXT]),
+        Stage(
+            "generate_video_report", generate_video_report,
+            inputs=[CAPTIONS],
+            outputs=["outputs/generated_video_report.txt", "outputs/generated_video_report.md"]
+        ),
+        # Google Maps
+        Stage("collect_nearby_places", collect_nearby_places, outputs=[PLACE_DETAILS], always_run=True),
+        Stage("clean_places_data", clean_places_data, inputs=[PLACE_DETAILS], outputs=[GMAP_PLACES, GMAP_REVIEWS]),
+        Stage(
+            "generate_tourism_report", generate_tourism_report,
+            inputs=[GMAP_PLACES, GMAP_REVIEWS],
+            outputs=["outputs/generated_tourism_report.txt", "outputs/generated_tourism_report.md"]
+        ),
+        Stage(
+            "build_text_index", build_text_index,
+            inputs=[VIDEO_DETAILS, CAPTIONS, GMAP_PLACES, GMAP_REVIEWS],
+            outputs=[INDEX_PATH]
+        ),
+        features,
+    ])
 
 if __name__ == "__main__":
-    analyze_youtube()
-    analyze_gmap()
-    run_bq_sql()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["bigquery", "duckdb"], default="bigquery",
+                        help="Where to build the feature tables (duckdb: locally from data/processed)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="BigQuery: MERGE only partitions changed since the last build")
+    parser.add_argument("--only", nargs="+", metavar="STAGE", help="Run only these stages")
+    parser.add_argument("--from", dest="start", metavar="STAGE", help="Run this stage and everything downstream")
+    parser.add_argument("--force", action="store_true", help="Run selected stages even if up to date")
+    parser.add_argument("--max_workers", type=int, default=4)
+    parser.add_argument("--prometheus_textfile", type=str,
+                        help="Also export the run metrics to this .prom file for the node exporter")
+    args = parser.parse_args()
+
+    pipeline = build_pipeline(backend=args.backend, incremental=args.incremental)
+    pipeline.max_workers = args.max_workers
+    metrics = get_metrics()
+    try:
+        pipeline.run(only=args.only, start=args.start, force=args.force)
+    finally:
+        metrics.print_summary()
+        metrics.write(prometheus_textfile=args.prometheus_textfile)
@@ -0,0 +1,65 @@
+from collections import deque
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over case-folded keywords, grouped by label.
+
+    `find` scans a text once and returns every group that matched together
+    with the configured terms that hit, so filtering and tagging cost
+    O(len(text)) regardless of how many keywords are configured. Keywords are
+    matched literally (no regex), with Unicode case folding on both sides.
+    """
+
+    def __init__(self, groups):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for group, terms in groups.items():
+            for term in terms or []:
+                term = str(term)
+                if term.strip():
+                    self._add(term.casefold(), (group, term))
+        self._build()
+
+    def _add(self, word, hit):
+        state = 0
+        for ch in word:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append(hit)
+
+    def _build(self):
+        # depth-1 states keep fail = 0
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        """Return {group: [matched terms]} for every group with at least one hit."""
+        hits = {}
+        if not isinstance(text, str):
+            return hits
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in text.casefold():
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for group, term in out[state]:
+                terms = hits.setdefault(group, [])
+                if term not in terms:
+                    terms.append(term)
+        return hits
@@ -1,72 +1,106 @@
 from pathlib import Path
 import json
-import pandas as pd
-import os
+import pyarrow as pa
+from datetime import date
+from utils.arrow_builder import BATCH_SIZE, DICTIONARY_STRING, build_batches
+from utils.metrics import get_metrics
+from utils.parquet_io import PartitionedWriter
 
 JSON_DIR = Path("data/raw")
 PROCESSED_DIR = Path("data/processed")
-PROCESSED_DIR.mkdir(exist_ok=True)
 
-def clean_places_data(rating_threshold=3.9):
+PLACE_LABELS = ["tourist_attraction", "food"]
+PLACE_SCHEMA = pa.schema([
+    ("place_id", pa.string()),
+    ("types", pa.list_(pa.string())),
+    ("address", pa.string()),
+    ("lat", pa.float64()),
+    ("lng", pa.float64()),
+    ("rating", pa.float64()),
+    ("rating_count", pa.int32()),
+    ("priceLevel", DICTIONARY_STRING),
+    ("name", pa.string()),
+    ("display_name_lang", DICTIONARY_STRING),
+    ("summary", pa.string()),
+    ("editorial_lang", DICTIONARY_STRING),
+    *[(label, pa.int8()) for label in PLACE_LABELS],
+])
+REVIEW_SCHEMA = pa.schema([
+    ("place_id", pa.string()),
+    ("place_name", pa.string()),
+    ("review_author", pa.string()),
+    ("review_rating", pa.int8()),
+    ("review_text", pa.string()),
+    ("review_time", pa.string()),
+    ("review_language", DICTIONARY_STRING),
+])
+
+def clean_places_data(rating_threshold=3.9, snapshot_date=None, batch_size=BATCH_SIZE):
     json_path = Path(JSON_DIR / "place_details.json")
     with open(json_path, "r", encoding="utf-8") as f:
         details = json.load(f)
 
+    rows_in = len(details)
     details = [p for p in details if p.get("rating", 0) >= rating_threshold]
 
-    df_places = flatten_places(details)
-    df_reviews = flatten_reviews(details)
-
-    df_places.to_parquet(PROCESSED_DIR / "gmap_places.parquet", engine="pyarrow", index=False)
-    df_reviews.to_parquet(PROCESSED_DIR / "gmap_reviews.parquet", engine="pyarrow", index=False)
+    # each run is one snapshot; rerunning on the same day replaces that day's partition
+    snapshot_date = snapshot_date or date.today().isoformat()
+    with PartitionedWriter(PROCESSED_DIR / "gmap_places", "snapshot_date", PLACE_SCHEMA,
+                           partitions=[snapshot_date]) as places, \
+            PartitionedWriter(PROCESSED_DIR / "gmap_reviews", "snapshot_date", REVIEW_SCHEMA,
+                              partitions=[snapshot_date]) as reviews:
+        for batch in flatten_places(details, batch_size):
+            places.write(batch, snapshot_date)
+        for batch in flatten_reviews(details, batch_size):
+            reviews.write(batch, snapshot_date)
 
-    print(f"Saved {len(df_places)} places → gmap_places.parquet")
-    print(f"Saved {len(df_reviews)} reviews → gmap_reviews.parquet")
+    get_metrics().rows(rows_in=rows_in, rows_out=places.rows + reviews.rows)
+    print(f"Saved {places.rows} places → gmap_places/snapshot_date={snapshot_date}")
+    print(f"Saved {reviews.rows} reviews → gmap_reviews/snapshot_date={snapshot_date}")
 
-def flatten_places(details):
-    for p in details:
-        p.pop("regularOpeningHours", None)
-    df_places = pd.json_normalize(details).drop(columns=["reviews"], errors="ignore")
-    df_places = df_places.rename(columns={
-        "id": "place_id",
-        "displayName.text": "name",
-        "displayName.languageCode": "display_name_lang",
-        "formattedAddress": "address",
-        "location.latitude": "lat",
-        "location.longitude": "lng",
-        "userRatingCount": "rating_count",
-        "editorialSummary.text": "summary",
-        "editorialSummary.languageCode": "editorial_lang"
-    })
+def flatten_places(details, batch_size=BATCH_SIZE):
+    """Yields PLACE_SCHEMA record batches; the input dicts are left as they are."""
+    return build_batches(map(place_row, details), PLACE_SCHEMA, batch_size)
 
-    selected_labels = ["tourist_attraction", "food"]
-    for label in selected_labels:
-        df_places[label] = df_places["types"].apply(lambda x: int(label in x))
-    return df_places
+def place_row(p):
+    display_name = p.get("displayName", {})
+    location = p.get("location", {})
+    summary = p.get("editorialSummary", {})
+    types = p.get("types", [])
+    return {
+        "place_id": p.get("id"),
+        "types": types,
+        "address": p.get("formattedAddress"),
+        "lat": location.get("latitude"),
+        "lng": location.get("longitude"),
+        "rating": p.get("rating"),
+        "rating_count": p.get("userRatingCount"),
+        "priceLevel": p.get("priceLevel"),
+        "name": display_name.get("text"),
+        "display_name_lang": display_name.get("languageCode"),
+        "summary": summary.get("text"),
+        "editorial_lang": summary.get("languageCode"),
+        **{label: int(label in types) for label in PLACE_LABELS},
+    }
 
-def flatten_reviews(details):
-    all_reviews = []
-    for p in details:
-        pid = p.get("id")
-        pname = p.get("displayName", {}).get("text")
+def flatten_reviews(details, batch_size=BATCH_SIZE):
+    """Yields REVIEW_SCHEMA record batches, one row per review."""
+    return build_batches(
+        (review_row(p, r) for p in details for r in p.get("reviews", [])), REVIEW_SCHEMA, batch_size
+    )
 
-        for r in p.get("reviews", []):
-            all_reviews.append({
-                "place_id": pid,
-                "place_name": pname,
-                "review_author": r.get("authorAttribution", {}).get("displayName"),
-                "review_rating": r.get("rating"),
-                "review_text": (
-                    r.get("originalText", {}).get("text")
-                    or r.get("text", {}).get("text") 
-                ),
-                "review_time": r.get("publishTime"),
-                "review_language": (
-                    r.get("originalText", {}).get("languageCode")
-                    or r.get("text", {}).get("languageCode")
-                )
-            })
-    return pd.DataFrame(all_reviews)
+def review_row(p, r):
+    original = r.get("originalText", {})
+    translated = r.get("text", {})
+    return {
+        "place_id": p.get("id"),
+        "place_name": p.get("displayName", {}).get("text"),
+        "review_author": r.get("authorAttribution", {}).get("displayName"),
+        "review_rating": r.get("rating"),
+        "review_text": original.get("text") or translated.get("text"),
+        "review_time": r.get("publishTime"),
+        "review_language": original.get("languageCode") or translated.get("languageCode"),
+    }
 
 if __name__ == "__main__":
     clean_places_data()
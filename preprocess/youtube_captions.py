@@ -1,49 +1,323 @@
 from pathlib import Path
+import hashlib
+import json
+import re
+import threading
+import time
+from concurrent.futures import as_completed
 import pandas as pd
-from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
-import time, random
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from preprocess.youtube_dedup import load_representatives
+from utils.arrow_builder import DICTIONARY_STRING, build_batches
+from utils.metrics import ContextThreadPoolExecutor, get_metrics
+from utils.parquet_io import read_dataset
+from utils.rate_limiter import RateLimiter, backoff_delay
 
 PROCESSED_DIR = Path("data/processed")
+CHECKPOINT_PATH = PROCESSED_DIR / "youtube_captions_checkpoint.jsonl"
+CAPTION_SEGMENTS_PATH = PROCESSED_DIR / "youtube_caption_segments.parquet"
+# the cleaned caption of each video, joined from its segments, for the report and index stages
+CAPTION_TEXT_PATH = PROCESSED_DIR / "youtube_caption_text.parquet"
+SEGMENTS_ROW_GROUP_SIZE = 100_000
 
-def youtube_captions(max_fetches=20):
-    df = pd.read_parquet(PROCESSED_DIR /"youtube_video_details.parquet")
+# applied in this order: a removed cue can join two ー/… runs or two stretches of whitespace,
+# so runs are squeezed only after every removal
+_CAPTION_PASSES = [
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"\[.*?\]"), ""),
+    (re.compile(r"\(.*?\)"), ""),
+    (re.compile(r"[♪★☆※]+"), ""),
+    (re.compile(r"([ー…])\1+"), r"\1"),
+    (re.compile(r"\s+"), " "),
+]
+# cached clean_text is reused only while the normalizer is unchanged
+NORMALIZER_VERSION = hashlib.sha1(
+    "\n".join(pattern.pattern + "\t" + repl for pattern, repl in _CAPTION_PASSES).encode("utf-8")
+).hexdigest()[:12]
+
+SEGMENT_SCHEMA = pa.schema([
+    ("video_id", pa.string()),
+    ("segment", pa.int32()),
+    ("start", pa.float64()),
+    ("duration", pa.float64()),
+    ("text", pa.string()),
+    ("clean_text", pa.string()),
+    ("language", DICTIONARY_STRING),
+    ("is_generated", pa.bool_()),
+], metadata={"normalizer": NORMALIZER_VERSION})
+
+CAPTION_TEXT_SCHEMA = pa.schema([
+    ("video_id", pa.string()),
+    ("caption", pa.string()),
+], metadata={"normalizer": NORMALIZER_VERSION})
+
+_thread_local = threading.local()
+
+
+def youtube_captions(max_fetches=20, max_workers=4, rate=0.5):
+    df = read_dataset(PROCESSED_DIR / "youtube_video_details")
+    representatives = load_representatives()
+    if representatives is None:
+        print("No near-duplicate clusters found (run preprocess.youtube_dedup first); using all videos")
+    else:
+        # near-duplicates share their representative's caption fetch and summary
+        df = df[df["video_id"].isin(representatives)]
     df["view_count"] = pd.to_numeric(df["view_count"], errors="coerce")
     df = df.sort_values("view_count", ascending=False).head(max_fetches)
-    print(f"Fetching captions for {len(df)} videos with top views")
-    captions = []
-    for _, row in df.iterrows():
-        video_id = row["video_id"]
-        caps = fetch_captions(video_id, languages=['ja', 'en'])
-        captions.append(caps)
-    df["caption"] = captions
+
+    done = load_checkpoint()
+    todo = [vid for vid in df["video_id"] if vid not in done]
+    print(f"Fetching captions for {len(todo)} videos with top views "
+          f"({len(df) - len(todo)} already fetched)")
+    done.update(fetch_captions_parallel(todo, max_workers=max_workers, rate=rate))
+
+    segments = update_caption_segments({vid: done[vid] for vid in df["video_id"] if done.get(vid)})
+    df["caption"] = df["video_id"].map(update_clean_captions(segments))
+    rows_in = len(df)
     df = df[df["caption"].notnull()]
-    print(f"Saved {len(df)} videos with captions")
+    get_metrics().rows(rows_in=rows_in, rows_out=len(df))
+    print(f"Saved {len(df)} videos with captions ({segments.num_rows} segments → {CAPTION_SEGMENTS_PATH})")
     df.to_parquet(PROCESSED_DIR / "youtube_captions.parquet")
 
+
+def clean_caption(caption: str) -> str:
+    """Drop cues like [音楽] or (笑) and decorative symbols, squeeze ー/… runs and whitespace."""
+    for pattern, repl in _CAPTION_PASSES:
+        caption = pattern.sub(repl, caption)
+    return caption.strip()
+
+
+def update_caption_segments(transcripts):
+    """Write the segments of `transcripts` (video_id -> transcript) with their cleaned text.
+
+    Videos already in the segment file keep their clean_text, so captions are
+    only normalized once; the file is rewritten with exactly these videos,
+    sorted by video and start so readers can filter by row-group statistics.
+    """
+    cached = None
+    if CAPTION_SEGMENTS_PATH.exists():
+        metadata = pq.read_schema(CAPTION_SEGMENTS_PATH).metadata or {}
+        if metadata.get(b"normalizer", b"").decode() == NORMALIZER_VERSION:
+            cached = pq.read_table(CAPTION_SEGMENTS_PATH, filters=[("video_id", "in", list(transcripts))])
+            cached = cached.cast(SEGMENT_SCHEMA)
+    cached_ids = set(cached.column("video_id").to_pylist()) if cached is not None else set()
+    new = {vid: transcript for vid, transcript in transcripts.items() if vid not in cached_ids}
+    tables = [cached] if cached is not None else []
+    tables.append(pa.Table.from_batches(list(build_batches(segment_rows(new), SEGMENT_SCHEMA)), schema=SEGMENT_SCHEMA))
+    table = pa.concat_tables(tables).sort_by([("video_id", "ascending"), ("segment", "ascending")])
+
+    PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = CAPTION_SEGMENTS_PATH.with_suffix(".tmp")
+    pq.write_table(
+        table, tmp_path, compression="zstd", row_group_size=SEGMENTS_ROW_GROUP_SIZE, write_statistics=True
+    )
+    tmp_path.replace(CAPTION_SEGMENTS_PATH)
+    print(f"Normalized captions of {len(new)} videos ({len(cached_ids)} cached)")
+    return table
+
+
+def segment_rows(transcripts):
+    for vid, transcript in transcripts.items():
+        for i, (start, duration, text) in enumerate(transcript["segments"]):
+            yield {
+                "video_id": vid,
+                "segment": i,
+                "start": start,
+                "duration": duration,
+                "text": text,
+                "clean_text": clean_caption(text or ""),
+                "language": transcript.get("language"),
+                "is_generated": transcript.get("is_generated"),
+            }
+
+
+def clean_captions(segments):
+    """video_id -> cleaned caption ("" when nothing is left after cleaning).
+
+    The raw segments are joined before cleaning, since a cue such as [音楽]
+    can be split across two segments; the per-segment clean_text is meant for
+    reading parts of a caption, not for rebuilding the whole one.
+    """
+    captions = {}
+    for vid, text in zip(segments.column("video_id").to_pylist(), segments.column("text").to_pylist()):
+        captions.setdefault(vid, [])
+        if text:
+            captions[vid].append(text)
+    return {vid: clean_caption(" ".join(texts)) for vid, texts in captions.items()}
+
+
+def update_clean_captions(segments):
+    """video_id -> non-empty cleaned caption for the videos in `segments`.
+
+    Like the segments' clean_text, each video's caption is cleaned once and
+    cached in CAPTION_TEXT_PATH while the normalizer is unchanged; the file is
+    rewritten with exactly these videos.
+    """
+    video_ids = sorted(set(segments.column("video_id").to_pylist()))
+    cached = {}
+    if CAPTION_TEXT_PATH.exists():
+        metadata = pq.read_schema(CAPTION_TEXT_PATH).metadata or {}
+        if metadata.get(b"normalizer", b"").decode() == NORMALIZER_VERSION:
+            table = pq.read_table(CAPTION_TEXT_PATH, filters=[("video_id", "in", video_ids)])
+            cached = dict(zip(table.column("video_id").to_pylist(), table.column("caption").to_pylist()))
+    new = segments.filter(pc.invert(pc.is_in(segments.column("video_id"), pa.array(list(cached), pa.string()))))
+    captions = {**cached, **clean_captions(new)}
+
+    table = pa.table(
+        {"video_id": video_ids, "caption": [captions[vid] for vid in video_ids]}, schema=CAPTION_TEXT_SCHEMA
+    )
+    PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = CAPTION_TEXT_PATH.with_suffix(".tmp")
+    pq.write_table(table, tmp_path, compression="zstd")
+    tmp_path.replace(CAPTION_TEXT_PATH)
+    print(f"Cleaned captions of {len(video_ids) - len(cached)} videos ({len(cached)} cached)")
+    return {vid: text for vid, text in captions.items() if text}
+
+
+def read_caption_segments(video_ids=None, start=None, end=None, columns=None):
+    """Caption segments as pandas, optionally only some videos and the segments starting in [start, end) seconds."""
+    filters = []
+    if video_ids is not None:
+        filters.append(("video_id", "in", list(video_ids)))
+    if start is not None:
+        filters.append(("start", ">=", start))
+    if end is not None:
+        filters.append(("start", "<", end))
+    return pq.read_table(CAPTION_SEGMENTS_PATH, columns=columns, filters=filters or None).to_pandas()
+
+
+def transcript_text(transcript):
+    """The raw caption text of a checkpointed transcript."""
+    return " ".join(text for _, _, text in transcript["segments"] if text)
+
+
+def fetch_captions_parallel(video_ids, languages=['ja', 'en'], max_workers=4, rate=0.5):
+    """Fetch captions on a worker pool, checkpointing each finished video as it completes."""
+    throttle = AdaptiveThrottle(rate)
+    captions = {}
+    with ContextThreadPoolExecutor(max_workers=max_workers) as pool, \
+            open(CHECKPOINT_PATH, "a", encoding="utf-8") as checkpoint:
+        futures = {
+            pool.submit(fetch_with_backoff, vid, throttle, languages): vid
+            for vid in video_ids
+        }
+        for future in as_completed(futures):
+            video_id = futures[future]
+            ok, transcript = future.result()
+            if not ok:
+                # failed fetches are not checkpointed, so the next run retries them
+                continue
+            captions[video_id] = transcript
+            checkpoint.write(json.dumps({"video_id": video_id, "transcript": transcript}, ensure_ascii=False) + "\n")
+            checkpoint.flush()
+    return captions
+
+
+def load_checkpoint():
+    done = {}
+    if CHECKPOINT_PATH.exists():
+        with open(CHECKPOINT_PATH, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line of an interrupted run may be cut off
+                    continue
+                if "caption" in record:
+                    # older checkpoints kept only the joined text
+                    caption = record["caption"]
+                    record["transcript"] = caption and {"segments": [[0.0, None, caption]]}
+                done[record["video_id"]] = record["transcript"]
+    return done
+
+
+class AdaptiveThrottle:
+    """Token bucket that halves its rate when YouTube throttles us and slowly recovers on success."""
+
+    def __init__(self, rate, min_rate=0.05, recovery=1.1):
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self.limiter = RateLimiter(rate, capacity=1)
+        self._lock = threading.Lock()
+
+    def wait(self):
+        self.limiter.acquire()
+
+    def on_success(self):
+        with self._lock:
+            self.limiter.set_rate(min(self.max_rate, self.limiter.rate * self.recovery))
+
+    def on_throttled(self):
+        with self._lock:
+            rate = max(self.min_rate, self.limiter.rate / 2)
+            self.limiter.set_rate(rate)
+        print(f"Throttled by YouTube, slowing down to {rate:.2f} requests/s")
+
+
+def fetch_with_backoff(video_id, throttle, languages=['ja', 'en'], max_retries=4):
+    for attempt in range(max_retries + 1):
+        throttle.wait()
+        try:
+            transcript = fetch_captions(video_id, languages=languages)
+        except Exception as e:
+            get_metrics().api_call("youtube.transcript", error=True)
+            if not is_throttled(e):
+                print(f"Error fetching captions for {video_id}: {e}")
+                return False, None
+            throttle.on_throttled()
+            time.sleep(backoff_delay(attempt, base=5))
+        else:
+            get_metrics().api_call("youtube.transcript")
+            throttle.on_success()
+            return True, transcript
+    print(f"Giving up on {video_id} after {max_retries + 1} throttled attempts")
+    return False, None
+
+
+def is_throttled(error):
+    from youtube_transcript_api import RequestBlocked
+    return isinstance(error, RequestBlocked) or "429" in str(error) or "Too Many Requests" in str(error)
+
+
+def get_transcript_api():
+    # one client (and HTTP session) per worker thread, reused across videos
+    if not hasattr(_thread_local, "api"):
+        from youtube_transcript_api import YouTubeTranscriptApi
+        _thread_local.api = YouTubeTranscriptApi()
+    return _thread_local.api
+
+
 def fetch_captions(video_id, languages=['ja', 'en']):
-    time.sleep(random.uniform(5, 15))  
-    api = YouTubeTranscriptApi() 
+    """The video's transcript as {language, is_generated, segments: [[start, duration, text], ...]}, or None."""
+    from youtube_transcript_api import TranscriptsDisabled, NoTranscriptFound
+    api = get_transcript_api()
     try:
-        transcript = api.fetch(video_id, languages=languages)
-        return " ".join(seg.text for seg in transcript)  
+        return transcript_record(api.fetch(video_id, languages=languages))
     except NoTranscriptFound:
         try:
-            transcript = api.fetch(video_id, languages=[f"a.{lang}" for lang in languages])
-            return " ".join(seg.text for seg in transcript)  
+            return transcript_record(api.fetch(video_id, languages=[f"a.{lang}" for lang in languages]))
         except NoTranscriptFound:
             print(f"No transcript found for {video_id} in {languages} or auto")
             return None
     except TranscriptsDisabled:
         print(f"Transcripts disabled for {video_id}")
         return None
-    except Exception as e:
-        print(f"Error fetching captions for {video_id}: {e}")
-        return None
+
+def transcript_record(transcript):
+    return {
+        "language": transcript.language_code,
+        "is_generated": transcript.is_generated,
+        "segments": [[seg.start, seg.duration, seg.text] for seg in transcript],
+    }
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--max_fetches", type=int, default=100)
+    parser.add_argument("--max_workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0.5, help="Max caption requests per second")
     args = parser.parse_args()
-    youtube_captions(max_fetches=args.max_fetches)
-
+    youtube_captions(max_fetches=args.max_fetches, max_workers=args.max_workers, rate=args.rate)
@@ -0,0 +1,238 @@
+from pathlib import Path
+import hashlib
+import re
+import unicodedata
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils.metrics import get_metrics
+from utils.parquet_io import read_dataset
+
+PROCESSED_DIR = Path("data/processed")
+VIDEO_DETAILS_DIR = PROCESSED_DIR / "youtube_video_details"
+DUPLICATES_PATH = PROCESSED_DIR / "youtube_duplicates.parquet"
+# MinHash signatures by video and text kind, reused while the text is unchanged
+SIGNATURES_PATH = PROCESSED_DIR / "youtube_minhash.parquet"
+
+NUM_PERM = 128
+# 16 bands of 8 rows: pairs above ~0.7 Jaccard almost always share a bucket
+BANDS = 16
+THRESHOLD = 0.7
+SHINGLE_SIZE = 4
+# texts with fewer distinct shingles than this (a short title and nothing else) estimate
+# Jaccard close to 1.0 against any similar short text, so they stay out of LSH as singletons
+MIN_SHINGLES = 20
+# buckets larger than this are only compared against their first member
+MAX_BUCKET_PAIRS = 200
+SEED = 1
+
+_SHINGLE_BASE = np.uint64(0x100000001B3)
+# multiply-shift hash functions: the top 32 bits of a*x + b (mod 2**64), a odd
+_rng = np.random.RandomState(SEED)
+_PERM_A = _rng.randint(0, 1 << 63, size=NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_PERM_B = _rng.randint(0, 1 << 63, size=NUM_PERM, dtype=np.uint64)
+
+SIGNATURES_SCHEMA = pa.schema([
+    ("video_id", pa.string()),
+    ("kind", pa.string()),
+    ("text_hash", pa.string()),
+    ("signature", pa.binary()),
+])
+
+_URL = re.compile(r"https?://\S+")
+# everything but letters and digits (kana and kanji count as letters)
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def youtube_dedup(threshold=THRESHOLD):
+    """Cluster near-duplicate videos (re-uploads, shorts, copies) and pick one representative per cluster.
+
+    Titles and descriptions (and captions already fetched) are shingled into
+    character n-grams and reduced to MinHash signatures; LSH banding finds
+    candidate pairs, which are kept when their estimated Jaccard similarity
+    reaches `threshold`. Texts with fewer than MIN_SHINGLES shingles are not
+    compared, so a video whose only text is a short title stays on its own.
+    The representative is the most viewed video of a cluster, and only
+    representatives go on to caption fetching.
+    """
+    from preprocess.youtube_captions import load_checkpoint, transcript_text
+
+    df = read_dataset(VIDEO_DETAILS_DIR, columns=["video_id", "title", "description", "view_count", "publish_date"])
+    captions = load_checkpoint()
+    texts = {
+        "meta": dict(zip(df["video_id"], (df["title"].fillna("") + " " + df["description"].fillna("")))),
+        "caption": {vid: transcript_text(captions[vid]) for vid in df["video_id"] if captions.get(vid)},
+    }
+
+    cache = load_signatures()
+    signatures, computed, too_short = {}, 0, 0
+    for kind, by_video in texts.items():
+        signatures[kind] = {}
+        for vid, text in by_video.items():
+            text = normalize(text)
+            if len(text) - SHINGLE_SIZE + 1 < MIN_SHINGLES:
+                too_short += 1
+                continue
+            text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            cached = cache.get((vid, kind))
+            if cached is not None and cached[0] == text_hash:
+                signatures[kind][vid] = (text_hash, cached[1])
+                continue
+            hashes = shingles(text)
+            if len(hashes) < MIN_SHINGLES:
+                too_short += 1
+                continue
+            signatures[kind][vid] = (text_hash, minhash(hashes))
+            computed += 1
+    save_signatures(signatures)
+    print(f"Computed MinHash signatures for {computed} texts "
+          f"({sum(len(s) for s in signatures.values()) - computed} from cache, "
+          f"{too_short} with fewer than {MIN_SHINGLES} shingles left out)")
+
+    clusters = UnionFind(df["video_id"])
+    for kind, by_video in signatures.items():
+        ids = list(by_video)
+        if len(ids) < 2:
+            continue
+        matrix = np.stack([by_video[vid][1] for vid in ids])
+        for i, j in similar_pairs(matrix, threshold):
+            clusters.union(ids[i], ids[j])
+
+    result = assign_representatives(df, clusters)
+    result.to_parquet(DUPLICATES_PATH, index=False)
+    duplicates = int((~result["is_representative"]).sum())
+    get_metrics().rows(rows_in=len(df), rows_out=len(df) - duplicates)
+    print(f"Found {duplicates} near-duplicates of {result.loc[result['cluster_size'] > 1, 'cluster_id'].nunique()} "
+          f"videos among {len(df)} → {DUPLICATES_PATH}")
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return _NON_WORD.sub("", _URL.sub(" ", text))
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Distinct 32-bit hashes of the character n-grams of a normalized text."""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(codes) < size:
+        size = len(codes)
+    if not size:
+        return np.empty(0, dtype=np.uint64)
+    # polynomial hash of each window, computed for all windows at once (wrapping at 2**64)
+    hashes = np.zeros(len(codes) - size + 1, dtype=np.uint64)
+    for k in range(size):
+        hashes = hashes * _SHINGLE_BASE + codes[k:len(codes) - size + 1 + k]
+    return np.unique(hashes >> np.uint64(32))
+
+
+def minhash(hashes):
+    """NUM_PERM minimum values of the hash functions over the shingle hashes, or None for an empty text."""
+    if not len(hashes):
+        return None
+    permuted = np.outer(_PERM_A, hashes)
+    permuted += _PERM_B[:, None]
+    # the shift is monotonic, so it can come after the minimum
+    return (permuted.min(axis=1) >> np.uint64(32)).astype(np.uint32)
+
+
+def similar_pairs(matrix, threshold=THRESHOLD, bands=BANDS):
+    """Index pairs of signature rows that share an LSH band and agree on at least `threshold` of their values."""
+    rows = matrix.shape[1] // bands
+    pairs = set()
+    for band in range(bands):
+        keys = np.ascontiguousarray(matrix[:, band * rows:(band + 1) * rows])
+        _, inverse, counts = np.unique(keys.view(f"V{keys.itemsize * rows}").ravel(), return_inverse=True,
+                                       return_counts=True)
+        order = np.argsort(inverse, kind="stable")
+        bounds = np.cumsum(counts)
+        for bucket in np.flatnonzero(counts > 1):
+            members = order[bounds[bucket] - counts[bucket]:bounds[bucket]]
+            if len(members) > MAX_BUCKET_PAIRS:
+                candidates = [(members[0], other) for other in members[1:]]
+            else:
+                candidates = [(a, b) for k, a in enumerate(members) for b in members[k + 1:]]
+            for a, b in candidates:
+                if (a, b) not in pairs and similarity(matrix[a], matrix[b]) >= threshold:
+                    pairs.add((a, b))
+    return pairs
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class UnionFind:
+    def __init__(self, items):
+        self.parent = {item: item for item in items}
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+
+    def groups(self):
+        return {item: self.find(item) for item in self.parent}
+
+
+def assign_representatives(df, clusters):
+    """One row per video: its cluster, the cluster size and whether it is the representative (most views)."""
+    df = df[["video_id", "view_count", "publish_date"]].copy()
+    df["root"] = df["video_id"].map(clusters.groups())
+    df = df.sort_values(["view_count", "publish_date", "video_id"], ascending=[False, True, True], na_position="last")
+    df["cluster_id"] = df.groupby("root")["video_id"].transform("first")
+    df["cluster_size"] = df.groupby("root")["video_id"].transform("size").astype("int32")
+    df["is_representative"] = df["video_id"] == df["cluster_id"]
+    return df[["video_id", "cluster_id", "cluster_size", "is_representative"]].reset_index(drop=True)
+
+
+def load_representatives():
+    """Video IDs that represent their cluster, or None when the dedup stage has not run."""
+    if not DUPLICATES_PATH.exists():
+        return None
+    df = pd.read_parquet(DUPLICATES_PATH, columns=["video_id", "is_representative"])
+    return set(df.loc[df["is_representative"], "video_id"])
+
+
+def load_signatures():
+    if not SIGNATURES_PATH.exists():
+        return {}
+    table = pq.read_table(SIGNATURES_PATH)
+    return {
+        (vid, kind): (text_hash, np.frombuffer(signature, dtype=np.uint32))
+        for vid, kind, text_hash, signature in zip(*(table.column(c).to_pylist() for c in SIGNATURES_SCHEMA.names))
+    }
+
+
+def save_signatures(signatures):
+    rows = [
+        (vid, kind, text_hash, signature.tobytes())
+        for kind, by_video in signatures.items()
+        for vid, (text_hash, signature) in by_video.items()
+    ]
+    table = pa.Table.from_arrays(
+        [pa.array(list(col), type=field.type) for col, field in zip(zip(*rows) if rows else [()] * 4, SIGNATURES_SCHEMA)],
+        schema=SIGNATURES_SCHEMA
+    )
+    SIGNATURES_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = SIGNATURES_PATH.with_suffix(".tmp")
+    pq.write_table(table, tmp_path)
+    tmp_path.replace(SIGNATURES_PATH)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate videos with MinHash/LSH.")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="Minimum estimated Jaccard similarity of two videos' shingles")
+    args = parser.parse_args()
+    youtube_dedup(threshold=args.threshold)
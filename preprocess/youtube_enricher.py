@@ -1,131 +1,410 @@
 from pathlib import Path
 import os
 import json
-import yaml
 import pandas as pd
-import numpy as np
-import re
-from googleapiclient.discovery import build
+import pyarrow as pa
+from collections import Counter
+from functools import lru_cache
 from dotenv import load_dotenv
 import isodate
+from datetime import datetime, timezone
+from utils.api_cache import CACHE_MISS, get_api_cache
+from collectors.search_store import get_search_store
+from preprocess.keyword_matcher import KeywordMatcher
+from utils.arrow_builder import BATCH_SIZE, DICTIONARY_STRING, build_batches
+from utils.parquet_io import PartitionedWriter, read_dataset, write_partitions
+from utils.config import load_config
+from utils.metrics import get_metrics
 
-with open("config/kawagoe_keywords.yaml", "r", encoding="utf-8") as f:
-    keywords = yaml.safe_load(f)
-NEGATIVE_KEYWORDS = keywords["negative_keywords"]
+VIDEO_SCHEMA = pa.schema([
+    ("video_id", pa.string()),
+    ("title", pa.string()),
+    ("description", pa.string()),
+    ("publish_date", pa.timestamp("us", tz="UTC")),
+    ("channel_id", pa.string()),
+    ("channel_title", pa.string()),
+    ("tags", pa.list_(pa.string())),
+    ("view_count", pa.int64()),
+    ("like_count", pa.int64()),
+    ("comment_count", pa.int64()),
+    ("favorite_count", pa.int64()),
+    ("duration", pa.float64()),
+    ("definition", DICTIONARY_STRING),
+    ("category_id", DICTIONARY_STRING),
+    ("default_language", DICTIONARY_STRING),
+    ("default_audio_language", DICTIONARY_STRING),
+])
 
-with open("config/youtube_category_map.yaml", "r", encoding="utf-8") as f:
-    cfg = yaml.safe_load(f)
-CATEGORY_MAP = cfg["category_map"]
+NEGATIVE_GROUP = "negative"
 
-with open("config/tourism_keyword_rules.yaml", "r", encoding="utf-8") as f: 
-    KEYWORD_DICT = yaml.safe_load(f)
-
-SEARCH_DIR = Path("data/raw/search")
 PROCESSED_DIR = Path("data/processed")
-PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+VIDEO_DETAILS_DIR = PROCESSED_DIR / "youtube_video_details"
+REFRESH_INDEX_PATH = PROCESSED_DIR / "youtube_video_refresh.json"
+# sequence number of the last search store save the enricher has read
+ENRICHER_STATE_PATH = PROCESSED_DIR / "youtube_enricher_state.json"
+
+# (max video age in days, statistics refresh interval in days), youngest first
+STATS_REFRESH_TIERS = [
+    (30, 1),
+    (365, 7),
+    (None, 30),
+]
+STATS_COLUMNS = {
+    "viewCount": "view_count",
+    "likeCount": "like_count",
+    "commentCount": "comment_count",
+    "favoriteCount": "favorite_count",
+}
+
+def category_map():
+    return load_config("youtube_category_map.yaml")["category_map"]
+
+def keyword_rules():
+    return load_config("tourism_keyword_rules.yaml")
+
+@lru_cache(maxsize=None)
+def get_keyword_matcher():
+    negative_keywords = load_config("kawagoe_keywords.yaml")["negative_keywords"]
+    return KeywordMatcher({NEGATIVE_GROUP: negative_keywords, **keyword_rules()})
 
-def youtube_enricher(max_requests=10000, min_views=1000):
+def youtube_enricher(max_requests=10000, min_views=1000, incremental=False):
     load_dotenv()
-    API_KEY = os.getenv("YOUTUBE_API_KEY")
-    if not API_KEY:
-        raise ValueError("Please set YOUTUBE_API_KEY in .env")
-    yt = build("youtube", "v3", developerKey=API_KEY)
-
-
-    all_items = []
-    search_files = SEARCH_DIR.glob("*_search.json")
-    for file in search_files:
-        print(f"Loading {file}")
-        with open(file, "r", encoding="utf-8") as f:
-            items = json.load(f)
-        all_items.extend(items)
-
-    df_all = pd.json_normalize(all_items).drop_duplicates(subset=["id.videoId"])
-    df_all["text"] = df_all["snippet.title"].fillna("") + " " + df_all["snippet.description"].fillna("")
-    pattern = re.compile("|".join(map(re.escape, NEGATIVE_KEYWORDS)), flags=re.IGNORECASE)
-    mask_negative = ~df_all["text"].str.contains(pattern, na=False)
-    df_tourism = df_all[mask_negative].reset_index(drop=True)
-    print(f"Processing {len(df_tourism)} videos after keyword filtering.")
-
-    final_df = enrich_videos_from_df(df_tourism[:max_requests], yt, min_views=min_views)
-    filepath = PROCESSED_DIR / "youtube_video_details.parquet"
-    final_df = final_df.sort_values("publish_date", ascending=False).reset_index(drop=True)
-    final_df.to_parquet(filepath, engine="pyarrow", index=False)
-    print(f"Saved {len(final_df)} enriched records → {filepath}")
-
-
-def get_video_details(youtube, video_ids, chunk_size=50):
-    all_items = []
-    for i in range(0, len(video_ids), chunk_size):
-        batch_ids = video_ids[i:i+chunk_size]
-        request = youtube.videos().list(
-            part="snippet,contentDetails,statistics",
-            id=",".join(batch_ids)
-        )
-        response = request.execute()
-        all_items.extend(response.get("items", []))
-    return {"items": all_items}
-
-
-def enrich_videos_from_df(df_tourism, youtube, min_views):
-    video_ids = df_tourism["id.videoId"].tolist()
-    details = get_video_details(youtube, video_ids)
-
-    rows = []
-    for item in details.get("items", []):
-        stats = item.get("statistics", {})
-        snippet = item["snippet"]
-        content = item.get("contentDetails", {})
+    if get_api_cache().offline:
+        # offline reruns are served entirely from the response cache
+        yt = None
+    else:
+        API_KEY = os.getenv("YOUTUBE_API_KEY")
+        if not API_KEY:
+            raise ValueError("Please set YOUTUBE_API_KEY in .env")
+        from googleapiclient.discovery import build
+        yt = build("youtube", "v3", developerKey=API_KEY)
+
+
+    base = load_video_details() if incremental else None
+    # incremental runs only read the search results added or updated since the last run
+    after_seq = load_enricher_state().get("search_seq", 0) if base is not None else 0
+    seqs = {}
+
+    def search_items():
+        for seq, item in get_search_store().iter_items(after_seq=after_seq):
+            seqs[item["id"]["videoId"]] = seq
+            yield item
 
-        view_count = int(stats.get("viewCount", 0))
-        if view_count < min_views:
+    video_ids = filter_search_items(search_items())
+    last_seq = max(seqs.values(), default=after_seq)
+    if len(video_ids) > max_requests:
+        # videos past the cap are picked up by the next run
+        last_seq = seqs[video_ids[max_requests]] - 1
+        video_ids = video_ids[:max_requests]
+
+    if base is not None:
+        final_df = refresh_videos(video_ids, yt, min_views, base)
+        final_df = final_df.sort_values("publish_date", ascending=False).reset_index(drop=True)
+        final_df["publish_month"] = publish_months(final_df)
+        # a base read from the legacy single file has no dataset to leave unchanged months in
+        partitions = changed_partitions(base, final_df) if VIDEO_DETAILS_DIR.exists() else None
+        written = write_partitions(final_df, VIDEO_DETAILS_DIR, "publish_month", partitions=partitions)
+        rows_out = len(final_df)
+    else:
+        # full runs stream the details straight into the partition files
+        published = {}
+        with PartitionedWriter(VIDEO_DETAILS_DIR, "publish_month", video_schema(), replace_all=True) as writer:
+            for batch in enrich_videos(video_ids, yt, min_views=min_views):
+                writer.write(batch)
+                published.update(zip(batch["video_id"].to_pylist(), batch["publish_date"].to_pylist()))
+        update_refresh_index(details_index(video_ids, published))
+        written, rows_out = writer.written, writer.rows
+    # once per run, after both the full and the statistics-only fetches
+    get_api_cache().print_stats()
+    save_enricher_state({"search_seq": last_seq})
+    get_metrics().rows(rows_in=len(seqs), rows_out=rows_out)
+    print(f"Saved {rows_out} enriched records → {VIDEO_DETAILS_DIR} ({len(written)} partitions rewritten)")
+
+
+def filter_search_items(items):
+    """IDs of the (deduplicated) search results whose title and description hit no negative keyword."""
+    matcher = get_keyword_matcher()
+    seen, video_ids, negative = set(), [], Counter()
+    for item in items:
+        vid = item["id"]["videoId"]
+        if vid in seen:
             continue
+        seen.add(vid)
+        snippet = item["snippet"]
+        hits = matcher.find(f"{snippet.get('title') or ''} {snippet.get('description') or ''}").get(NEGATIVE_GROUP, [])
+        if hits:
+            negative.update(hits)
+        else:
+            video_ids.append(vid)
+    print(f"Processing {len(video_ids)} of {len(seen)} videos after keyword filtering.")
+    print(f"Top negative keywords: {negative.most_common(10)}")
+    return video_ids
 
-        row = {
-            "video_id": item["id"],
-            "title": snippet.get("title"),
-            "description": snippet.get("description"),
-            "publish_date": snippet.get("publishedAt"),
-            "channel_id": snippet.get("channelId"),
-            "channel_title": snippet.get("channelTitle"),
-            "tags": snippet.get("tags", []),
-
-            "view_count": view_count,
-            "like_count": int(stats.get("likeCount", 0)),
-            "comment_count": int(stats.get("commentCount", 0)),
-            "favorite_count": int(stats.get("favoriteCount", 0)),
-            "duration": isodate.parse_duration(content.get("duration")).total_seconds() if content.get("duration") else np.nan,
-            "definition": content.get("definition"),
-            "category_id": snippet.get("categoryId"),
-            "default_language": snippet.get("defaultLanguage"),
-            "default_audio_language": snippet.get("defaultAudioLanguage"),
-        }
-        rows.append(row)
 
-    df = pd.DataFrame(rows)
-    df["publish_date"] = pd.to_datetime(
-        df["publish_date"].str.replace("Z", "+00:00"),
-        errors="coerce",
-        utc=True
+def load_video_details():
+    if VIDEO_DETAILS_DIR.exists():
+        return read_dataset(VIDEO_DETAILS_DIR).drop(columns=["publish_month"])
+    legacy_path = PROCESSED_DIR / "youtube_video_details.parquet"
+    if legacy_path.exists():
+        return pd.read_parquet(legacy_path)
+    return None
+
+
+def publish_months(df):
+    return pd.to_datetime(df["publish_date"], utc=True).dt.strftime("%Y-%m").fillna("unknown")
+
+
+def changed_partitions(base, df):
+    """publish_month partitions whose rows, statistics or tags differ from the previous output."""
+    cols = ["video_id", *STATS_COLUMNS.values(), *keyword_rules()]
+
+    def fingerprints(frame):
+        rows = frame[[c for c in cols if c in frame]].astype(str).agg("|".join, axis=1)
+        return rows.groupby(publish_months(frame)).agg(frozenset).to_dict()
+
+    before, after = fingerprints(base), fingerprints(df)
+    return sorted(m for m in set(before) | set(after) if before.get(m) != after.get(m))
+
+
+def get_video_details(youtube, video_ids, chunk_size=50, part="snippet,contentDetails,statistics"):
+    return {"items": list(iter_video_details(youtube, video_ids, chunk_size, part))}
+
+
+def iter_video_details(youtube, video_ids, chunk_size=50, part="snippet,contentDetails,statistics"):
+    """Yields video items: cached ones as they are found, missing ones in requests of `chunk_size` IDs.
+
+    Items come out in cache/request order rather than in `video_ids` order;
+    deleted and private videos are skipped.
+    """
+    # cached per video ID so partial reruns only request the IDs that are missing
+    cache = get_api_cache()
+    endpoint = "youtube.videos.list"
+    missing_ids = []
+    for vid in video_ids:
+        item = cache.get(endpoint, {"id": vid, "part": part})
+        if item is CACHE_MISS:
+            missing_ids.append(vid)
+            if len(missing_ids) == chunk_size:
+                yield from fetch_video_details(youtube, missing_ids, part)
+                missing_ids = []
+        elif item:
+            yield item
+    if missing_ids:
+        yield from fetch_video_details(youtube, missing_ids, part)
+
+
+def fetch_video_details(youtube, video_ids, part):
+    cache = get_api_cache()
+    endpoint = "youtube.videos.list"
+    cache.require_online(endpoint)
+    request = youtube.videos().list(
+        part=part,
+        id=",".join(video_ids)
     )
-    df["duration"] = pd.to_numeric(df["duration"], errors="coerce").astype("float64")
-    df["category_id"] = df["category_id"].map(CATEGORY_MAP).fillna("Other")
+    get_metrics().api_call(endpoint)
+    response = request.execute()
+    fetched = {item["id"]: item for item in response.get("items", [])}
+    for vid in video_ids:
+        # deleted/private videos are cached as None so they are not requested again
+        cache.set(endpoint, {"id": vid, "part": part}, fetched.get(vid))
+        if fetched.get(vid):
+            yield fetched[vid]
+
+
+def enrich_videos(video_ids, youtube, min_views, batch_size=BATCH_SIZE):
+    """Yields tagged video_schema() record batches for `video_ids`."""
+    return video_batches(iter_video_details(youtube, video_ids), min_views, batch_size)
+
+
+def refresh_videos(new_ids, youtube, min_views, base):
+    """Incremental enrichment on top of the previous output.
+
+    Search results not enriched before (`new_ids`) get all parts; known videos
+    only get `statistics`, and only once their age tier says they are due
+    (see STATS_REFRESH_TIERS).
+    """
+    now = datetime.now(timezone.utc)
+    index = load_refresh_index()
+    in_base = set(base["video_id"])
+
+    due = [vid for vid, entry in index.items() if is_stats_due(entry, now)]
+    # videos below min_views (or missing) are not in the base, so they need all parts again
+    full_ids = [vid for vid in new_ids if vid not in index] + [vid for vid in due if vid not in in_base]
+    stats_ids = [vid for vid in due if vid in in_base]
+    print(f"Incremental enrichment: {len(full_ids)} full fetches, {len(stats_ids)} statistics refreshes, "
+          f"{len(index) - len(due)} up to date")
+
+    new_df = videos_to_frame(get_video_details(youtube, full_ids).get("items", []), min_views)
+    stats = {
+        item["id"]: item.get("statistics", {})
+        for item in get_video_details(youtube, stats_ids, part="statistics").get("items", [])
+    }
+
+    base = base[~base["video_id"].isin(new_df["video_id"])]
+    base = base[~base["video_id"].isin(set(stats_ids) - set(stats))].copy()
+    for key, col in STATS_COLUMNS.items():
+        updated = {vid: int(s.get(key, 0)) for vid, s in stats.items()}
+        base[col] = base["video_id"].map(updated).fillna(base[col]).astype("int64")
+
+    entries = details_index(full_ids, dict(zip(new_df["video_id"], new_df["publish_date"])), now)
+    entries.update({
+        vid: {**index[vid], "stats_updated_at": now.isoformat()}
+        for vid in stats_ids
+    })
+    update_refresh_index(entries)
+
+    df = pd.concat([base, new_df], ignore_index=True) if len(new_df) else base
+    return tag_videos(df)
+
+
+def video_schema():
+    """VIDEO_SCHEMA plus the keyword tag columns and the publish_month partition key."""
+    return pa.schema([
+        *VIDEO_SCHEMA,
+        *[pa.field(cat, pa.int8()) for cat in keyword_rules()],
+        pa.field("matched_keywords", pa.list_(pa.string())),
+        pa.field("publish_month", pa.string()),
+    ])
+
+
+def video_batches(items, min_views, batch_size=BATCH_SIZE):
+    rules = keyword_rules()
+    matcher = get_keyword_matcher()
+    categories = category_map()
+    rows = (video_row(item, rules, matcher, categories) for item in items
+            if int(item.get("statistics", {}).get("viewCount", 0)) >= min_views)
+    return build_batches(rows, video_schema(), batch_size)
+
+
+def video_row(item, rules, matcher, categories):
+    stats = item.get("statistics", {})
+    snippet = item["snippet"]
+    content = item.get("contentDetails", {})
+    publish_date = parse_timestamp(snippet.get("publishedAt"))
+    category_id = snippet.get("categoryId")
+    row = {
+        "video_id": item["id"],
+        "title": snippet.get("title"),
+        "description": snippet.get("description"),
+        "publish_date": publish_date,
+        "channel_id": snippet.get("channelId"),
+        "channel_title": snippet.get("channelTitle"),
+        "tags": snippet.get("tags", []),
+
+        "view_count": int(stats.get("viewCount", 0)),
+        "like_count": int(stats.get("likeCount", 0)),
+        "comment_count": int(stats.get("commentCount", 0)),
+        "favorite_count": int(stats.get("favoriteCount", 0)),
+        "duration": isodate.parse_duration(content.get("duration")).total_seconds() if content.get("duration") else None,
+        "definition": content.get("definition"),
+        # the category map is keyed by the numeric ID, the API returns it as a string
+        "category_id": categories.get(int(category_id), "Other") if category_id and category_id.isdigit() else "Other",
+        "default_language": snippet.get("defaultLanguage"),
+        "default_audio_language": snippet.get("defaultAudioLanguage"),
+        "publish_month": publish_date.strftime("%Y-%m") if publish_date else "unknown",
+    }
+    # same text as tag_videos, so streamed and DataFrame rows get the same tags
+    hits = matcher.find(f"{row['title'] or ''} {row['description'] or ''} {row['tags']}")
+    for cat in rules:
+        row[cat] = int(cat in hits)
+    row["matched_keywords"] = [f"{cat}:{term}" for cat in rules for term in hits.get(cat, [])]
+    return row
+
+
+def parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc)
+    except (AttributeError, ValueError):
+        return None
+
+
+def videos_to_frame(items, min_views):
+    table = pa.Table.from_batches(list(video_batches(items, min_views)), schema=video_schema())
+    return table.drop_columns(["publish_month"]).to_pandas()
+
+
+def tag_videos(df):
+    rules = keyword_rules()
+    df = df.drop(columns=[*rules, "matched_keywords"], errors="ignore")
     df["text"] = df["title"].fillna("") + " " + df["description"].fillna("") + " " + df["tags"].astype(str).fillna("") 
-    for cat, words in KEYWORD_DICT.items():
-        pattern = "|".join(words)
-        df[cat] = df["text"].str.contains(pattern, case=False, regex=True, na=False).astype(int)
+    hits = df["text"].map(get_keyword_matcher().find)
+    for cat in rules:
+        df[cat] = hits.map(lambda h: int(cat in h)).astype("int8")
+    # category:term pairs kept for auditing the tags
+    df["matched_keywords"] = hits.map(
+        lambda h: [f"{cat}:{term}" for cat in rules for term in h.get(cat, [])]
+    )
     return df.drop(columns=["text"])
 
 
+def stats_refresh_interval(published_at, now):
+    age_days = (now - published_at).days if published_at else None
+    for max_age, interval in STATS_REFRESH_TIERS:
+        if max_age is None or (age_days is not None and age_days <= max_age):
+            return interval
+    return STATS_REFRESH_TIERS[-1][1]
+
+
+def is_stats_due(entry, now):
+    published_at = datetime.fromisoformat(entry["published_at"]) if entry.get("published_at") else None
+    updated_at = datetime.fromisoformat(entry["stats_updated_at"])
+    return (now - updated_at).days >= stats_refresh_interval(published_at, now)
+
+
+def details_index(video_ids, published, now=None):
+    """Refresh-index entries for videos whose full details were just fetched ({video_id: publish_date} in `published`)."""
+    now = now or datetime.now(timezone.utc)
+    entries = {}
+    for vid in video_ids:
+        publish_date = published.get(vid)
+        entries[vid] = {
+            "published_at": publish_date.isoformat() if pd.notna(publish_date) else None,
+            "stats_updated_at": now.isoformat(),
+            # below min_views (or no longer available): not in the output
+            "below_min_views": vid not in published,
+        }
+    return entries
+
+
+def load_enricher_state():
+    if ENRICHER_STATE_PATH.exists():
+        with open(ENRICHER_STATE_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_enricher_state(state):
+    ENRICHER_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(ENRICHER_STATE_PATH, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+
+
+def load_refresh_index():
+    if REFRESH_INDEX_PATH.exists():
+        with open(REFRESH_INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def update_refresh_index(entries):
+    index = load_refresh_index()
+    index.update(entries)
+    with open(REFRESH_INDEX_PATH, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Fetch video details for saved search results.")
     parser.add_argument("--max_requests", type=int, default=10000)
     parser.add_argument("--min_views", type=int, default=1000)
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse the previous output and only refresh statistics that are due")
     args = parser.parse_args()
     youtube_enricher(
         max_requests=args.max_requests,
-        min_views=args.min_views
+        min_views=args.min_views,
+        incremental=args.incremental
     )
 
     
\ No newline at end of file
@@ -0,0 +1,59 @@
+-- DuckDB版（sql/gmap_place_features.sql と同じ特徴量をローカルのParquetから作成）
+SET VARIABLE center_lat = 35.9251;   -- 時の鐘の緯度
+SET VARIABLE center_lng = 139.4852;  -- 時の鐘の経度
+
+CREATE OR REPLACE VIEW gmap_place_details AS
+SELECT *
+FROM read_parquet('${PROCESSED_DIR}/gmap_places/*/*.parquet', hive_partitioning = true, union_by_name = true);
+
+-- 最新のスナップショットのみを読む（パーティションのプルーニング）
+SET VARIABLE latest_snapshot = (
+  SELECT MAX(snapshot_date) FROM gmap_place_details
+);
+
+CREATE OR REPLACE TABLE gmap_place_features AS
+WITH base AS (
+  SELECT
+    place_id,
+    name,
+    address,
+    rating,
+    rating_count,
+    -- BigQueryのLOGは自然対数
+    rating * LN(1 + rating_count) AS weighted_rating,
+    lat,
+    lng,
+    ST_AsText(ST_Point(lng, lat)) AS location,
+    display_name_lang,
+    summary,
+    editorial_lang,
+    priceLevel,
+    tourist_attraction,
+    food,
+
+    ARRAY_TO_STRING(types, ', ') AS types,
+
+    -- ST_Distance_Sphere は (緯度, 経度) の順
+    ST_Distance_Sphere(
+        ST_Point(lat, lng),
+        ST_Point(getvariable('center_lat'), getvariable('center_lng'))
+    ) / 1000 AS dist_km,
+
+    CASE
+        WHEN ST_Distance_Sphere(ST_Point(lat, lng), ST_Point(getvariable('center_lat'), getvariable('center_lng'))) <= 1000 THEN 'Central Kawagoe'
+        WHEN ST_Distance_Sphere(ST_Point(lat, lng), ST_Point(getvariable('center_lat'), getvariable('center_lng'))) <= 3000 THEN 'Inner Kawagoe'
+        ELSE 'Outer Kawagoe'
+    END AS kawagoe_zone,
+
+    CASE
+        WHEN lat >= getvariable('center_lat') AND lng >= getvariable('center_lng') THEN 'Northeast Kawagoe'
+        WHEN lat >= getvariable('center_lat') AND lng <  getvariable('center_lng') THEN 'Northwest Kawagoe'
+        WHEN lat <  getvariable('center_lat') AND lng >= getvariable('center_lng') THEN 'Southeast Kawagoe'
+        ELSE 'Southwest Kawagoe'
+    END AS kawagoe_quadrant,
+
+  FROM gmap_place_details
+  WHERE snapshot_date = getvariable('latest_snapshot')
+)
+
+SELECT * FROM base;
@@ -0,0 +1,64 @@
+-- DuckDB版（sql/youtube_video_features.sql と同じ特徴量をローカルのParquetから作成）
+CREATE OR REPLACE VIEW youtube_video_details AS
+SELECT *
+FROM read_parquet('${PROCESSED_DIR}/youtube_video_details/*/*.parquet', hive_partitioning = true, union_by_name = true);
+
+CREATE OR REPLACE TABLE youtube_video_features AS
+WITH base AS (
+  SELECT
+    video_id,
+    title,
+    description,
+    view_count,
+    like_count,
+    comment_count,
+    ARRAY_TO_STRING(tags, ', ') AS tags,
+    category_id,
+    default_language,
+    default_audio_language,
+    duration,
+    heritage,
+    food,
+    events,
+    nature,
+
+    CAST(like_count AS BIGINT) / NULLIF(CAST(view_count AS BIGINT), 0) AS like_ratio,
+    CAST(comment_count AS BIGINT) / NULLIF(CAST(view_count AS BIGINT), 0) AS comment_ratio,
+    CAST(view_count AS BIGINT)
+      / GREATEST(DATE_DIFF('day', CAST(publish_date AS DATE), CURRENT_DATE), 1) AS views_per_day_avg,
+
+    CASE
+      WHEN view_count < 10000 THEN '1k-10k'
+      WHEN view_count < 100000 THEN '10k-100k'
+      ELSE '100k+'
+    END AS view_count_bin,
+
+    -- Content category
+    CASE
+      WHEN nature = 1 THEN 'nature'
+      WHEN events = 1 THEN 'events'
+      WHEN heritage = 1 THEN 'heritage'
+      WHEN food = 1 THEN 'food'
+      ELSE 'other'
+    END AS content_category,
+
+    CAST(publish_date AS DATE) AS publish_date,
+    EXTRACT(MONTH FROM CAST(publish_date AS DATE)) AS publish_month,
+    -- BigQueryのDAYOFWEEKに合わせて 1 = 日曜日
+    DAYOFWEEK(CAST(publish_date AS DATE)) + 1 AS publish_day_of_week,
+
+    CASE
+      WHEN default_language IN ('ja')
+      THEN 1 ELSE 0
+    END AS is_japanese,
+
+    CASE
+      WHEN CAST(duration AS BIGINT) <= 90
+      THEN 1 ELSE 0
+    END AS is_short_video,
+
+  FROM youtube_video_details
+)
+
+SELECT *
+FROM base;
@@ -0,0 +1,33 @@
+-- 新しいスナップショット（@snapshot_date）だけを読み、最新の状態に合わせる
+MERGE `${PROJECT_ID}.${BQ_DATASET}.gmap_place_features` T
+USING (
+  SELECT *
+  FROM `${PROJECT_ID}.${BQ_DATASET}.gmap_place_features_source`
+  WHERE snapshot_date = @snapshot_date
+) S
+ON T.place_id = S.place_id
+WHEN MATCHED THEN UPDATE SET
+    name = S.name,
+    address = S.address,
+    rating = S.rating,
+    rating_count = S.rating_count,
+    weighted_rating = S.weighted_rating,
+    lat = S.lat,
+    lng = S.lng,
+    location = S.location,
+    display_name_lang = S.display_name_lang,
+    summary = S.summary,
+    editorial_lang = S.editorial_lang,
+    priceLevel = S.priceLevel,
+    tourist_attraction = S.tourist_attraction,
+    food = S.food,
+    types = S.types,
+    dist_km = S.dist_km,
+    kawagoe_zone = S.kawagoe_zone,
+    kawagoe_quadrant = S.kawagoe_quadrant,
+    snapshot_date = S.snapshot_date
+WHEN NOT MATCHED THEN
+  INSERT ROW
+-- 最新のスナップショットにないスポットは削除
+WHEN NOT MATCHED BY SOURCE THEN
+  DELETE;
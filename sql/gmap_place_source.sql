@@ -0,0 +1,62 @@
+CREATE OR REPLACE EXTERNAL TABLE `${PROJECT_ID}.${BQ_DATASET}.gmap_place_details`
+WITH PARTITION COLUMNS (
+  snapshot_date DATE
+)
+OPTIONS (
+  format = 'PARQUET',
+  uris = ['gs://${GCS_BUCKET}/processed/gmap_places/*'],
+  hive_partition_uri_prefix = 'gs://${GCS_BUCKET}/processed/gmap_places'
+);
+
+-- 特徴量の定義（全件作成と差分MERGEで共通）
+-- 中心は時の鐘（${CENTER_LAT}, ${CENTER_LNG}）
+CREATE OR REPLACE VIEW `${PROJECT_ID}.${BQ_DATASET}.gmap_place_features_source` AS
+WITH base AS (
+  SELECT
+    place_id,
+    name,
+    address,
+    rating,
+    rating_count,
+    rating * LOG(1 + rating_count) AS weighted_rating,
+    lat,
+    lng,
+    ST_GEOGPOINT(lng, lat) AS location,
+    display_name_lang,
+    summary,
+    editorial_lang,
+    priceLevel,
+    tourist_attraction,
+    food,
+
+    ARRAY_TO_STRING(
+      ARRAY(
+        SELECT t.element
+        FROM UNNEST(types.list) AS t
+      ), ', '
+    ) AS types,
+
+    ST_DISTANCE(
+        ST_GEOGPOINT(lng, lat),
+        ST_GEOGPOINT(${CENTER_LNG}, ${CENTER_LAT})
+    ) / 1000 AS dist_km,
+
+    CASE
+        WHEN ST_DISTANCE(ST_GEOGPOINT(lng, lat), ST_GEOGPOINT(${CENTER_LNG}, ${CENTER_LAT})) <= 1000 THEN "Central Kawagoe"
+        WHEN ST_DISTANCE(ST_GEOGPOINT(lng, lat), ST_GEOGPOINT(${CENTER_LNG}, ${CENTER_LAT})) <= 3000 THEN "Inner Kawagoe"
+        ELSE "Outer Kawagoe"
+    END AS kawagoe_zone,
+
+    CASE
+        WHEN lat >= ${CENTER_LAT} AND lng >= ${CENTER_LNG} THEN "Northeast Kawagoe"
+        WHEN lat >= ${CENTER_LAT} AND lng <  ${CENTER_LNG} THEN "Northwest Kawagoe"
+        WHEN lat <  ${CENTER_LAT} AND lng >= ${CENTER_LNG} THEN "Southeast Kawagoe"
+        ELSE "Southwest Kawagoe"
+    END AS kawagoe_quadrant,
+
+    snapshot_date,
+
+FROM `${PROJECT_ID}.${BQ_DATASET}.gmap_place_details`
+)
+
+SELECT * FROM base;
\ No newline at end of file
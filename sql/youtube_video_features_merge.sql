@@ -0,0 +1,40 @@
+-- 変更のあった月（@changed_partitions: 'YYYY-MM', @changed_months: その月初日）だけを反映する
+MERGE `${PROJECT_ID}.${BQ_DATASET}.youtube_video_features` T
+USING (
+  SELECT * EXCEPT (source_partition)
+  FROM `${PROJECT_ID}.${BQ_DATASET}.youtube_video_features_source`
+  WHERE source_partition IN UNNEST(@changed_partitions)
+) S
+ON T.video_id = S.video_id
+  AND DATE_TRUNC(T.publish_date, MONTH) IN UNNEST(@changed_months)
+WHEN MATCHED THEN UPDATE SET
+    title = S.title,
+    description = S.description,
+    view_count = S.view_count,
+    like_count = S.like_count,
+    comment_count = S.comment_count,
+    tags = S.tags,
+    category_id = S.category_id,
+    default_language = S.default_language,
+    default_audio_language = S.default_audio_language,
+    duration = S.duration,
+    heritage = S.heritage,
+    food = S.food,
+    events = S.events,
+    nature = S.nature,
+    like_ratio = S.like_ratio,
+    comment_ratio = S.comment_ratio,
+    views_per_day_avg = S.views_per_day_avg,
+    view_count_bin = S.view_count_bin,
+    content_category = S.content_category,
+    publish_date = S.publish_date,
+    publish_month = S.publish_month,
+    publish_day_of_week = S.publish_day_of_week,
+    is_japanese = S.is_japanese,
+    is_short_video = S.is_short_video
+WHEN NOT MATCHED THEN
+  INSERT ROW
+-- 変更された月から消えた動画は削除
+WHEN NOT MATCHED BY SOURCE
+  AND DATE_TRUNC(T.publish_date, MONTH) IN UNNEST(@changed_months) THEN
+  DELETE;
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+CACHE_DIR = Path("data/cache")
+
+DAY = 24 * 60 * 60
+DEFAULT_TTLS = {
+    "youtube.videos.list": 1 * DAY,
+    "places.details": 7 * DAY,
+}
+DEFAULT_TTL = 1 * DAY
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+CACHE_MISS = object()
+
+
+class OfflineCacheMiss(RuntimeError):
+    pass
+
+
+class ApiCache:
+    """On-disk (SQLite) response cache with per-endpoint TTLs and LRU size eviction."""
+
+    def __init__(self, path=None, ttls=None, max_bytes=DEFAULT_MAX_BYTES, offline=None):
+        self.path = Path(path or CACHE_DIR / "api_cache.sqlite")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        if offline is None:
+            offline = os.getenv("API_CACHE_OFFLINE", "").lower() in ("1", "true", "yes")
+        self.offline = offline
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+        # running total of payload sizes, kept by triggers in the same transaction as each write,
+        # so eviction does not have to sum the whole table on every set()
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO meta VALUES ('total_size', (SELECT COALESCE(SUM(size), 0) FROM responses));
+            CREATE TRIGGER IF NOT EXISTS responses_size_insert AFTER INSERT ON responses BEGIN
+                UPDATE meta SET value = value + NEW.size WHERE name = 'total_size';
+            END;
+            CREATE TRIGGER IF NOT EXISTS responses_size_delete AFTER DELETE ON responses BEGIN
+                UPDATE meta SET value = value - OLD.size WHERE name = 'total_size';
+            END;
+            CREATE TRIGGER IF NOT EXISTS responses_size_update AFTER UPDATE OF size ON responses BEGIN
+                UPDATE meta SET value = value + NEW.size - OLD.size WHERE name = 'total_size';
+            END;
+            """
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(endpoint, params):
+        raw = json.dumps([endpoint, params], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, endpoint, params):
+        key = self.make_key(endpoint, params)
+        ttl = self.ttls.get(endpoint, DEFAULT_TTL)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            # expired entries are still served in offline mode
+            if row is None or (now - row[1] > ttl and not self.offline):
+                self.misses[endpoint] += 1
+                return CACHE_MISS
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits[endpoint] += 1
+        return json.loads(row[0])
+
+    def set(self, endpoint, params, value):
+        if self.offline:
+            return
+        key = self.make_key(endpoint, params)
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            # an upsert rather than INSERT OR REPLACE, whose implicit delete does not fire triggers
+            self._conn.execute(
+                """
+                INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    endpoint = excluded.endpoint,
+                    payload = excluded.payload,
+                    size = excluded.size,
+                    created_at = excluded.created_at,
+                    accessed_at = excluded.accessed_at
+                """,
+                (key, endpoint, payload, len(payload), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def fetch(self, endpoint, params, fetch_fn):
+        value = self.get(endpoint, params)
+        if value is not CACHE_MISS:
+            return value
+        self.require_online(endpoint)
+        value = fetch_fn()
+        self.set(endpoint, params, value)
+        return value
+
+    def require_online(self, endpoint):
+        if self.offline:
+            raise OfflineCacheMiss(f"Offline mode: no cached response for {endpoint}")
+
+    def invalidate(self, endpoint=None):
+        with self._lock:
+            if endpoint:
+                self._conn.execute("DELETE FROM responses WHERE endpoint = ?", (endpoint,))
+            else:
+                self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def purge_expired(self, endpoint):
+        """Drop entries of `endpoint` older than its TTL (expired entries are otherwise only skipped)."""
+        cutoff = time.time() - self.ttls.get(endpoint, DEFAULT_TTL)
+        with self._lock:
+            cur = self._conn.execute(
+                "DELETE FROM responses WHERE endpoint = ? AND created_at < ?", (endpoint, cutoff)
+            )
+            self._conn.commit()
+        return cur.rowcount
+
+    def total_size(self):
+        return self._conn.execute("SELECT value FROM meta WHERE name = 'total_size'").fetchone()[0]
+
+    def _evict(self):
+        total = self.total_size()
+        if total <= self.max_bytes:
+            return
+        # drop least recently used entries until back under the size limit
+        cursor = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at")
+        stale = []
+        for key, size in cursor:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        cursor.close()
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def stats(self):
+        endpoints = sorted(set(self.hits) | set(self.misses))
+        return {ep: {"hits": self.hits[ep], "misses": self.misses[ep]} for ep in endpoints}
+
+    def print_stats(self):
+        for ep, s in self.stats().items():
+            print(f"API cache [{ep}] hits: {s['hits']}, misses: {s['misses']}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_api_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ApiCache()
+    return _cache
@@ -0,0 +1,57 @@
+import pyarrow as pa
+
+BATCH_SIZE = 10_000
+# low-cardinality strings (language codes, categories) stored as dictionary indices
+DICTIONARY_STRING = pa.dictionary(pa.int32(), pa.string())
+
+
+class RecordBatchBuilder:
+    """Collects rows column by column and hands them out as pyarrow RecordBatches.
+
+    `append` returns a batch every `batch_size` rows (None otherwise) and
+    `flush` returns whatever is left, so at most one batch of Python values
+    is held at a time. Missing keys become nulls.
+    """
+
+    def __init__(self, schema, batch_size=BATCH_SIZE):
+        self.schema = schema
+        self.batch_size = batch_size
+        self.rows = 0
+        self._columns = {name: [] for name in schema.names}
+        self._pending = 0
+
+    def append(self, row):
+        for name, values in self._columns.items():
+            values.append(row.get(name))
+        self._pending += 1
+        self.rows += 1
+        if self._pending >= self.batch_size:
+            return self.flush()
+        return None
+
+    def flush(self):
+        if not self._pending:
+            return None
+        arrays = [to_array(self._columns[field.name], field.type) for field in self.schema]
+        for values in self._columns.values():
+            values.clear()
+        self._pending = 0
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+
+def to_array(values, arrow_type):
+    if pa.types.is_dictionary(arrow_type):
+        return pa.array(values, type=arrow_type.value_type).dictionary_encode().cast(arrow_type)
+    return pa.array(values, type=arrow_type)
+
+
+def build_batches(rows, schema, batch_size=BATCH_SIZE):
+    """Yields RecordBatches of `schema` from an iterable of row dicts."""
+    builder = RecordBatchBuilder(schema, batch_size)
+    for row in rows:
+        batch = builder.append(row)
+        if batch is not None:
+            yield batch
+    batch = builder.flush()
+    if batch is not None:
+        yield batch
@@ -0,0 +1,22 @@
+import os
+from functools import lru_cache
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+CONFIG_DIR = REPO_ROOT / "config"
+
+
+@lru_cache(maxsize=None)
+def load_config(name):
+    """Load config/<name> once; paths are relative to the repo, not the working directory."""
+    import yaml
+    with open(CONFIG_DIR / name, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f)
+
+
+def require_env(name):
+    # checked when a client is first needed, not at import
+    value = os.getenv(name)
+    if not value:
+        raise RuntimeError(f"Missing {name} environment variable")
+    return value
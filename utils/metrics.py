@@ -0,0 +1,236 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+METRICS_DIR = Path("data/metrics")
+# set to a *.prom path inside the node exporter's --collector.textfile.directory
+PROMETHEUS_TEXTFILE_ENV = "METRICS_PROMETHEUS_TEXTFILE"
+
+# endpoint -> (quota or billing SKU, units per call)
+API_QUOTA = {
+    "youtube.search.list": ("youtube_data_api", 100),
+    "youtube.videos.list": ("youtube_data_api", 1),
+    "places.nearby_search": ("places_nearby_search", 1),
+    "places.details": ("places_details_enterprise_atmosphere", 1),
+}
+
+_stage = contextvars.ContextVar("metrics_stage", default=None)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor whose tasks run in the submitter's context, so metrics land in its stage."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        ctx = contextvars.copy_context()
+        return super().submit(ctx.run, fn, *args, **kwargs)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 ** 2 if sys.platform == "darwin" else 1024), 1)
+
+
+def _new_stage():
+    return {
+        "status": "running",
+        "wall_seconds": None,
+        "rows_in": 0,
+        "rows_out": 0,
+        # ru_maxrss is per process, so with stages running in parallel this is the peak of the
+        # whole run up to the end of the stage, not the stage's own memory use
+        "process_peak_rss_mb": None,
+        "api_calls": defaultdict(int),
+        "api_errors": defaultdict(int),
+    }
+
+
+class RunMetrics:
+    """Thread-safe collector for one pipeline run.
+
+    Stage timings, row counts and the process's peak RSS so far come from
+    `stage()`; API calls, quota units and LLM token usage are recorded where
+    the calls are made and attributed to the stage running in the current
+    context. Failed calls are counted under `errors`, not `calls`, so they do
+    not add to the quota estimate.
+    """
+
+    def __init__(self):
+        self.run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ") + "-" + uuid.uuid4().hex[:6]
+        self.started_at = time.time()
+        self.stages = {}
+        self.api_calls = defaultdict(lambda: {"calls": 0, "errors": 0})
+        self.llm = defaultdict(lambda: {
+            "calls": 0, "input_tokens": 0, "output_tokens": 0, "thinking_tokens": 0,
+            "latency_seconds_total": 0.0, "latency_seconds_max": 0.0,
+        })
+        self.counters = defaultdict(float)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        with self._lock:
+            self.stages[name] = _new_stage()
+        token = _stage.set(name)
+        start = time.perf_counter()
+        status = "failed"
+        try:
+            yield self
+            status = "ok"
+        finally:
+            _stage.reset(token)
+            with self._lock:
+                stage = self.stages[name]
+                stage["status"] = status
+                stage["wall_seconds"] = round(time.perf_counter() - start, 3)
+                stage["process_peak_rss_mb"] = peak_rss_mb()
+
+    def _current(self):
+        name = _stage.get()
+        return self.stages.get(name) if name else None
+
+    def rows(self, rows_in=0, rows_out=0):
+        with self._lock:
+            stage = self._current()
+            if stage is not None:
+                stage["rows_in"] += int(rows_in)
+                stage["rows_out"] += int(rows_out)
+
+    def api_call(self, endpoint, n=1, error=False):
+        with self._lock:
+            self.api_calls[endpoint]["errors" if error else "calls"] += n
+            stage = self._current()
+            if stage is not None:
+                stage["api_errors" if error else "api_calls"][endpoint] += n
+
+    def llm_call(self, model, usage, latency):
+        """Record one generate_content call from its usage_metadata (may be None)."""
+        with self._lock:
+            m = self.llm[model]
+            m["calls"] += 1
+            if usage is not None:
+                m["input_tokens"] += usage.prompt_token_count or 0
+                m["output_tokens"] += usage.candidates_token_count or 0
+                m["thinking_tokens"] += getattr(usage, "thoughts_token_count", None) or 0
+            m["latency_seconds_total"] += latency
+            m["latency_seconds_max"] = max(m["latency_seconds_max"], latency)
+            stage = self._current()
+            if stage is not None:
+                stage["api_calls"][f"gemini.{model}"] += 1
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def quota_units(self):
+        units = defaultdict(int)
+        for endpoint, calls in self.api_calls.items():
+            if endpoint in API_QUOTA:
+                quota, per_call = API_QUOTA[endpoint]
+                units[quota] += calls["calls"] * per_call
+        return dict(units)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "run_id": self.run_id,
+                "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+                "wall_seconds": round(time.time() - self.started_at, 3),
+                "peak_rss_mb": peak_rss_mb(),
+                "stages": {
+                    name: {**s, "api_calls": dict(s["api_calls"]), "api_errors": dict(s["api_errors"])}
+                    for name, s in self.stages.items()
+                },
+                "api_calls": {k: dict(v) for k, v in self.api_calls.items()},
+                "quota_units": self.quota_units(),
+                "llm": {k: dict(v) for k, v in self.llm.items()},
+                "counters": dict(self.counters),
+            }
+
+    def write(self, directory=METRICS_DIR, prometheus_textfile=None):
+        data = self.to_dict()
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"run_{self.run_id}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"Saved run metrics to {path}")
+
+        prometheus_textfile = prometheus_textfile or os.getenv(PROMETHEUS_TEXTFILE_ENV)
+        if prometheus_textfile:
+            write_prometheus_textfile(data, prometheus_textfile)
+        return path
+
+    def print_summary(self):
+        data = self.to_dict()
+        for name, s in data["stages"].items():
+            print(f"[metrics] {name}: {s['status']}, {s['wall_seconds']}s, rows {s['rows_in']} → {s['rows_out']}, "
+                  f"process peak RSS {s['process_peak_rss_mb']} MB, API calls {sum(s['api_calls'].values())}"
+                  f" ({sum(s['api_errors'].values())} failed)")
+        for quota, units in data["quota_units"].items():
+            print(f"[metrics] quota {quota}: {units} units")
+        for model, m in data["llm"].items():
+            print(f"[metrics] {model}: {m['calls']} calls, {m['input_tokens']} in / {m['output_tokens']} out tokens")
+
+
+def write_prometheus_textfile(data, path):
+    lines = []
+
+    def metric(name, help_text, kind, samples):
+        lines.append(f"# HELP ugc_{name} {help_text}")
+        lines.append(f"# TYPE ugc_{name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+            lines.append(f"ugc_{name}{{{label_text}}} {value}" if label_text else f"ugc_{name} {value}")
+
+    stages = data["stages"].items()
+    metric("stage_wall_seconds", "Wall time of the last run per stage.", "gauge",
+           [({"stage": n}, s["wall_seconds"] or 0) for n, s in stages])
+    metric("stage_rows_out", "Rows written by the stage in the last run.", "gauge",
+           [({"stage": n}, s["rows_out"]) for n, s in stages])
+    metric("stage_success", "1 if the stage succeeded in the last run.", "gauge",
+           [({"stage": n}, int(s["status"] == "ok")) for n, s in stages])
+    metric("api_calls", "API calls in the last run.", "gauge",
+           [({"endpoint": e}, c["calls"]) for e, c in data["api_calls"].items()])
+    metric("api_errors", "Failed API calls in the last run.", "gauge",
+           [({"endpoint": e}, c["errors"]) for e, c in data["api_calls"].items()])
+    metric("quota_units", "Estimated quota units used in the last run.", "gauge",
+           [({"quota": q}, u) for q, u in data["quota_units"].items()])
+    metric("llm_tokens", "LLM tokens used in the last run.", "gauge",
+           [({"model": m, "kind": kind}, v[f"{kind}_tokens"])
+            for m, v in data["llm"].items() for kind in ("input", "output", "thinking")])
+    metric("run_peak_rss_megabytes", "Peak resident set size of the run.", "gauge",
+           [({}, data["peak_rss_mb"] or 0)])
+    metric("run_timestamp_seconds", "When the last run finished.", "gauge", [({}, int(time.time()))])
+
+    # written to a temp file and renamed so the exporter never reads a partial file
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    tmp_path.replace(path)
+    print(f"Saved Prometheus metrics to {path}")
+
+
+_metrics = RunMetrics()
+
+
+def get_metrics():
+    return _metrics
@@ -0,0 +1,221 @@
+import json
+import shutil
+import threading
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+ROW_GROUP_SIZE = 100_000
+# written next to the datasets: {dataset name: [partition values changed since the last feature build]}
+CHANGED_PARTITIONS_FILE = "changed_partitions.json"
+
+_manifest_lock = threading.Lock()
+
+
+def write_partitions(df, root, partition_col, partitions=None, replace_all=False, row_group_size=ROW_GROUP_SIZE):
+    """Write `df` as a hive-partitioned dataset: root/<partition_col>=<value>/part-0.parquet.
+
+    Only the partitions present in `df` (optionally limited to `partitions`)
+    are rewritten; other partitions on disk are left untouched unless
+    `replace_all` is set, in which case partitions missing from `df` are removed.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    keys = df[partition_col].astype(str)
+    written = []
+    for value, part in df.groupby(keys, sort=True):
+        if partitions is not None and value not in partitions:
+            continue
+        part_dir = root / f"{partition_col}={value}"
+        tmp_dir = root / f".{partition_col}={value}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir()
+        table = pa.Table.from_pandas(part.drop(columns=[partition_col]), preserve_index=False)
+        pq.write_table(
+            table, tmp_dir / "part-0.parquet",
+            row_group_size=row_group_size, write_statistics=True
+        )
+        shutil.rmtree(part_dir, ignore_errors=True)
+        tmp_dir.rename(part_dir)
+        written.append(value)
+
+    # partitions that should exist but ended up empty
+    stale = set(partitions or []) - set(keys)
+    if replace_all:
+        stale |= set(list_partitions(root, partition_col)) - set(keys)
+    for value in stale:
+        shutil.rmtree(root / f"{partition_col}={value}", ignore_errors=True)
+    record_changed_partitions(root, written + sorted(stale))
+    return written
+
+
+class PartitionedWriter:
+    """Streams RecordBatches into a hive-partitioned dataset, like write_partitions without a DataFrame.
+
+    Rows are buffered per partition and written as row groups of up to
+    `row_group_size` rows through one ParquetWriter per partition; when more
+    than `max_buffered_rows` rows are waiting, the largest buffer is written
+    early, so memory stays bounded however many rows go through. Partitions
+    are written to temporary directories and swapped in on close, and
+    `partitions`/`replace_all` behave as in write_partitions.
+    """
+
+    def __init__(self, root, partition_col, schema, partitions=None, replace_all=False,
+                 row_group_size=ROW_GROUP_SIZE, max_buffered_rows=ROW_GROUP_SIZE):
+        self.root = Path(root)
+        self.partition_col = partition_col
+        self.schema = schema.remove(schema.get_field_index(partition_col)) if partition_col in schema.names else schema
+        self.partitions = partitions
+        self.replace_all = replace_all
+        self.row_group_size = row_group_size
+        self.max_buffered_rows = max_buffered_rows
+        self.rows = 0
+        self.written = []
+        self._writers = {}
+        self._buffers = {}
+        self._buffered = 0
+
+    def __enter__(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, batch, value=None):
+        """Add `batch`; rows go to partition `value`, or are split by the batch's partition column."""
+        if value is not None:
+            self._add(str(value), batch)
+            return
+        keys = batch.column(self.partition_col)
+        data = batch.drop_columns([self.partition_col])
+        for key in pc.unique(keys).to_pylist():
+            mask = pc.is_null(keys) if key is None else pc.equal(keys, key)
+            self._add(str(key), data.filter(mask))
+
+    def _add(self, value, batch):
+        if self.partitions is not None and value not in self.partitions:
+            return
+        buffer = self._buffers.setdefault(value, [])
+        buffer.append(batch)
+        self.rows += batch.num_rows
+        self._buffered += batch.num_rows
+        if sum(b.num_rows for b in buffer) >= self.row_group_size:
+            self._flush(value)
+        while self._buffered > self.max_buffered_rows:
+            self._flush(max(self._buffers, key=lambda v: sum(b.num_rows for b in self._buffers[v])))
+
+    def _flush(self, value):
+        batches = self._buffers.pop(value, [])
+        if not batches:
+            return
+        self._buffered -= sum(b.num_rows for b in batches)
+        writer = self._writers.get(value)
+        if writer is None:
+            tmp_dir = self._tmp_dir(value)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            tmp_dir.mkdir()
+            writer = pq.ParquetWriter(tmp_dir / "part-0.parquet", self.schema, write_statistics=True)
+            self._writers[value] = writer
+        writer.write_table(pa.Table.from_batches(batches, schema=self.schema), row_group_size=self.row_group_size)
+
+    def _tmp_dir(self, value):
+        return self.root / f".{self.partition_col}={value}.tmp"
+
+    def close(self):
+        for value in list(self._buffers):
+            self._flush(value)
+        written = sorted(self._writers)
+        for value in written:
+            self._writers[value].close()
+            part_dir = self.root / f"{self.partition_col}={value}"
+            shutil.rmtree(part_dir, ignore_errors=True)
+            self._tmp_dir(value).rename(part_dir)
+        self._writers = {}
+
+        stale = set(self.partitions or []) - set(written)
+        if self.replace_all:
+            stale |= set(list_partitions(self.root, self.partition_col)) - set(written)
+        for value in stale:
+            shutil.rmtree(self.root / f"{self.partition_col}={value}", ignore_errors=True)
+        record_changed_partitions(self.root, written + sorted(stale))
+        self.written = written
+        return written
+
+    def abort(self):
+        for value, writer in self._writers.items():
+            writer.close()
+            shutil.rmtree(self._tmp_dir(value), ignore_errors=True)
+        self._writers, self._buffers, self._buffered = {}, {}, 0
+
+
+def list_partitions(root, partition_col):
+    prefix = f"{partition_col}="
+    return sorted(p.name[len(prefix):] for p in Path(root).glob(f"{prefix}*") if p.is_dir())
+
+
+def latest_partition(root, partition_col):
+    partitions = list_partitions(root, partition_col)
+    return partitions[-1] if partitions else None
+
+
+def read_dataset(root, columns=None, partitions=None, partition_col=None):
+    """Read a hive-partitioned dataset into pandas, optionally only some partitions."""
+    filters = None
+    if partitions is not None:
+        filters = [(partition_col, "in", list(partitions))]
+    df = pd.read_parquet(root, engine="pyarrow", columns=columns, filters=filters)
+    for col in df.columns:
+        # partition keys come back as categoricals
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(str)
+    return df
+
+
+def read_latest_partition(root, partition_col, columns=None):
+    latest = latest_partition(root, partition_col)
+    if latest is None:
+        raise FileNotFoundError(f"No {partition_col}= partitions under {root}")
+    return read_dataset(root, columns=columns, partitions=[latest], partition_col=partition_col)
+
+
+def record_changed_partitions(root, values):
+    """Add partitions of the dataset at `root` to the changed-partitions manifest in its parent dir."""
+    root = Path(root)
+    with _manifest_lock:
+        manifest = load_changed_partitions(root.parent)
+        manifest[root.name] = sorted(set(manifest.get(root.name, [])) | set(values))
+        _save_manifest(root.parent, manifest)
+
+
+def load_changed_partitions(processed_dir):
+    path = Path(processed_dir) / CHANGED_PARTITIONS_FILE
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def clear_changed_partitions(processed_dir, dataset, values=None):
+    """Drop `values` (all when None) of `dataset` from the manifest once they have been consumed."""
+    with _manifest_lock:
+        manifest = load_changed_partitions(processed_dir)
+        remaining = [] if values is None else sorted(set(manifest.get(dataset, [])) - set(values))
+        if remaining:
+            manifest[dataset] = remaining
+        else:
+            manifest.pop(dataset, None)
+        _save_manifest(processed_dir, manifest)
+
+
+def _save_manifest(processed_dir, manifest):
+    path = Path(processed_dir) / CHANGED_PARTITIONS_FILE
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    tmp_path.replace(path)
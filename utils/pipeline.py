@@ -0,0 +1,192 @@
+import hashlib
+import inspect
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from utils.metrics import get_metrics
+
+STATE_PATH = Path("data/.pipeline_state.json")
+
+
+class Stage:
+    """A pipeline step: a function plus the files or directories it reads and writes.
+
+    The module that defines `func` counts as an input too, so editing a
+    stage's code reruns it. Stages that read from outside the repository
+    (API collectors) have no input that changes over time, so they are
+    marked `always_run` and never skipped as up to date.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), kwargs=None, always_run=False):
+        self.name = name
+        self.func = func
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self.kwargs = kwargs or {}
+        self.always_run = always_run
+
+    @property
+    def code_path(self):
+        return Path(inspect.getsourcefile(self.func)).resolve()
+
+    def run(self):
+        return self.func(**self.kwargs)
+
+
+class Pipeline:
+    """Runs stages in dependency order, independent branches in parallel.
+
+    Stage B depends on stage A when one of B's inputs is one of A's outputs.
+    A stage is skipped when the content hashes of its inputs (and of its
+    outputs) match the last successful run recorded in `state_path`, unless
+    it is marked `always_run`.
+    """
+
+    def __init__(self, stages, state_path=STATE_PATH, max_workers=4):
+        self.stages = {s.name: s for s in stages}
+        self.state_path = Path(state_path)
+        self.max_workers = max_workers
+        self.deps = {
+            s.name: {
+                other.name for other in stages
+                if other is not s and set(other.outputs) & set(s.inputs)
+            }
+            for s in stages
+        }
+        self.state = self._load_state()
+        self._lock = threading.Lock()
+
+    def downstream(self, names):
+        selected = set(names)
+        changed = True
+        while changed:
+            changed = False
+            for name, deps in self.deps.items():
+                if name not in selected and deps & selected:
+                    selected.add(name)
+                    changed = True
+        return selected
+
+    def select(self, only=None, start=None):
+        for name in (only or []) + ([start] if start else []):
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage: {name} (choose from {', '.join(self.stages)})")
+        if only:
+            return set(only)
+        if start:
+            return self.downstream([start])
+        return set(self.stages)
+
+    def run(self, only=None, start=None, force=False):
+        selected = self.select(only, start)
+        # dependencies outside the selection count as already done
+        pending = {name: self.deps[name] & selected for name in selected}
+        done, failed, running = set(), {}, {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name in [n for n, deps in pending.items() if deps <= done]:
+                    del pending[name]
+                    running[pool.submit(self._run_stage, self.stages[name], force)] = name
+                # stages waiting on a failed stage can never run
+                for name in [n for n, deps in pending.items() if deps & set(failed)]:
+                    del pending[name]
+                    failed[name] = "upstream stage failed"
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    if future.exception():
+                        failed[name] = future.exception()
+                        print(f"[pipeline] {name} failed: {future.exception()}")
+                    else:
+                        done.add(name)
+
+        if failed:
+            errors = [e for e in failed.values() if isinstance(e, BaseException)]
+            print(f"[pipeline] failed: {', '.join(failed)}")
+            if errors:
+                raise errors[0]
+        return done
+
+    def _run_stage(self, stage, force):
+        inputs = self.fingerprint(stage.inputs + [stage.code_path])
+        last = self.state["stages"].get(stage.name)
+        if not (force or stage.always_run) and last and last["inputs"] == inputs and last["outputs"] == self.fingerprint(stage.outputs):
+            print(f"[pipeline] {stage.name}: up to date, skipping")
+            return
+        missing = [str(p) for p in stage.inputs if not p.exists()]
+        if missing:
+            print(f"[pipeline] {stage.name}: missing inputs {', '.join(missing)}")
+
+        print(f"[pipeline] {stage.name}: running")
+        start = time.perf_counter()
+        with get_metrics().stage(stage.name):
+            stage.run()
+        elapsed = time.perf_counter() - start
+        print(f"[pipeline] {stage.name}: done in {elapsed:.1f}s")
+
+        outputs = self.fingerprint(stage.outputs)
+        with self._lock:
+            self.state["stages"][stage.name] = {
+                # inputs are hashed before the run so changes made meanwhile trigger the next run
+                "inputs": inputs,
+                "outputs": outputs,
+                "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "seconds": round(elapsed, 3),
+            }
+            self._save_state()
+
+    def fingerprint(self, paths):
+        return {str(p): self.hash_path(p) for p in paths}
+
+    def hash_path(self, path):
+        """sha256 of a file, or of a directory's relative paths and file hashes; None if missing."""
+        path = Path(path)
+        if path.is_file():
+            return self.hash_file(path)
+        if not path.is_dir():
+            return None
+        digest = hashlib.sha256()
+        for file in sorted(p for p in path.rglob("*") if p.is_file()):
+            rel = file.relative_to(path)
+            # in-progress partition writes (see utils.parquet_io.write_partitions)
+            if any(part.endswith(".tmp") for part in rel.parts):
+                continue
+            digest.update(f"{rel.as_posix()}\0{self.hash_file(file)}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def hash_file(self, path):
+        # content hashes are memoized by (size, mtime) so unchanged files are not re-read
+        stat = path.stat()
+        key = str(path)
+        with self._lock:
+            memo = self.state["files"].get(key)
+        if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+            return memo[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        with self._lock:
+            self.state["files"][key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def _load_state(self):
+        if self.state_path.exists():
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        else:
+            state = {}
+        state.setdefault("stages", {})
+        state.setdefault("files", {})
+        return state
+
+    def _save_state(self):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.state_path)